@@ -0,0 +1,56 @@
+import os
+import time
+from psycopg import AsyncConnection
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from app.metrics import TIMED_CURSORS, TimedAsyncCursor, observe_acquire
+from app.db import conninfo, POOL_MIN_SIZE, POOL_MAX_SIZE, POOL_TIMEOUT, POOL_MAX_IDLE, POOL_MAX_LIFETIME
+
+APOOL_MIN_SIZE = int(os.getenv("PG_APOOL_MIN_SIZE", str(POOL_MIN_SIZE)))
+APOOL_MAX_SIZE = int(os.getenv("PG_APOOL_MAX_SIZE", str(POOL_MAX_SIZE)))
+
+_apool: AsyncConnectionPool | None = None
+
+async def get_apool() -> AsyncConnectionPool:
+    global _apool
+    if _apool is None:
+        _apool = AsyncConnectionPool(
+            conninfo(),
+            min_size=APOOL_MIN_SIZE,
+            max_size=APOOL_MAX_SIZE,
+            timeout=POOL_TIMEOUT,
+            max_idle=POOL_MAX_IDLE,
+            max_lifetime=POOL_MAX_LIFETIME,
+            check=AsyncConnectionPool.check_connection,
+            kwargs={"autocommit": True},
+            name="books-async",
+            open=False,
+        )
+        await _apool.open()
+    return _apool
+
+async def open_apool():
+    await (await get_apool()).wait()
+
+async def close_apool():
+    global _apool
+    if _apool is not None:
+        await _apool.close()
+        _apool = None
+
+def apool_stats() -> dict:
+    if _apool is None:
+        return {"open": False}
+    return {"open": True, **_apool.get_stats()}
+
+async def get_aconn():
+    started = time.perf_counter()
+    async with (await get_apool()).connection() as c:
+        observe_acquire("async", started)
+        yield c
+
+def get_async_dict_cursor(con: AsyncConnection):
+    if TIMED_CURSORS:
+        return TimedAsyncCursor(con, row_factory=dict_row)
+    return con.cursor(row_factory=dict_row)
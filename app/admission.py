@@ -0,0 +1,185 @@
+import os
+import math
+import time
+from dataclasses import dataclass
+
+from starlette.responses import JSONResponse
+
+from app.cache import TTLCache
+from app.auth import bearer_user_id
+
+# Вимкнено за замовчуванням (middleware не додається): анонімні ліміти рахуються за IP клієнта, і за
+# балансувальником, якому не довіряють проксі-заголовки (FORWARDED_ALLOW_IPS), усі клієнти були б одним IP.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "0") == "1"
+# memory — відра у воркері (з N воркерами serve.py — до N× ліміту частоти); redis — спільні для всіх воркерів.
+ADMISSION_BACKEND = os.getenv("ADMISSION_BACKEND", "memory")
+ADMISSION_URL = os.getenv("ADMISSION_URL", os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0"))
+ADMISSION_MAX_KEYS = int(os.getenv("ADMISSION_MAX_KEYS", "100000"))
+
+# клас -> (одночасних запитів на воркер, "запитів за секунду/запас" на користувача або IP; 0 — без ліміту)
+DEFAULT_LIMITS = {
+    "read": ("256", "50/100"),
+    "write": ("64", "10/30"),
+    "import": ("4", "0.2/3"),
+    "export": ("8", "2/10"),
+    "auth": ("32", "2/10"),
+}
+# Перевірки готовності й метрики не обмежуються: інакше під навантаженням інстанс «зникав» би з балансувальника.
+EXEMPT_PREFIXES = ("/status", "/metrics", "/docs", "/redoc", "/openapi.json")
+ROUTE_CLASSES = {
+    ("POST", "/auth/token"): "auth",
+    ("POST", "/auth/signup"): "auth",
+    ("POST", "/books/import"): "import",
+    ("GET", "/books/export"): "export",
+}
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+@dataclass
+class RouteClass:
+    concurrency: int
+    rate: float
+    burst: float
+    in_flight: int = 0
+    busy: int = 0
+    limited: int = 0
+
+
+def parse_rate(spec: str) -> tuple[float, float]:
+    rate, _, burst = spec.partition("/")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(1.0, rate)
+
+def load_limits() -> dict[str, RouteClass]:
+    limits = {}
+    for name, (concurrency, rate) in DEFAULT_LIMITS.items():
+        env = name.upper()
+        limits[name] = RouteClass(int(os.getenv(f"ADMIT_{env}_CONCURRENCY", concurrency)),
+                                  *parse_rate(os.getenv(f"ADMIT_{env}_RATE", rate)))
+    return limits
+
+def route_class(method: str, path: str) -> str | None:
+    if path.startswith(EXEMPT_PREFIXES):
+        return None
+    name = ROUTE_CLASSES.get((method, path.rstrip("/")))
+    if name is not None:
+        return name
+    return "read" if method in READ_METHODS else "write"
+
+
+class MemoryBuckets:
+    """Token bucket на ключ; запис живе, доки відро не наповниться знову, — далі воно й так повне."""
+
+    def __init__(self, maxsize: int):
+        self.buckets = TTLCache(maxsize, 24 * 3600)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """0 — запит пропущено, інакше скільки секунд чекати на наступний токен."""
+        now = time.monotonic()
+        tokens, updated = self.buckets.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self.buckets.set(key, (tokens, now), ttl=(burst - tokens) / rate or 1)
+        return wait
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "buckets": len(self.buckets)}
+
+
+# Те саме відро атомарно в Redis; час береться з самого Redis, щоб годинники воркерів не розходились.
+TAKE_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(b[1]) or burst
+local updated = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+class RedisBuckets:
+    """Асинхронний клієнт (redis.asyncio): middleware не блокує event loop очікуванням Redis.
+    client можна передати готовий — будь-який об'єкт з register_script(), як у redis.asyncio.Redis."""
+
+    def __init__(self, url: str, client=None):
+        self.errors_caught: tuple = (OSError,)
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("ADMISSION_BACKEND=redis потребує пакета redis")
+            client = redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.1)
+            self.errors_caught += (redis.RedisError,)
+        self.script = client.register_script(TAKE_SCRIPT)
+        self.errors = 0
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        try:
+            return float(await self.script(keys=[f"admit:{key}"], args=[rate, burst]))
+        except self.errors_caught:
+            # Недоступний Redis не повинен зупиняти сервіс: пропускаємо, лишаються ліміти одночасності.
+            self.errors += 1
+            return 0.0
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "backend_errors": self.errors}
+
+
+limits = load_limits()
+buckets = RedisBuckets(ADMISSION_URL) if ADMISSION_BACKEND == "redis" else MemoryBuckets(ADMISSION_MAX_KEYS)
+
+
+def client_key(scope, name: str) -> str:
+    # Вхід і реєстрація анонімні за визначенням — лише за IP.
+    if name != "auth":
+        auth = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"authorization"), "")
+        if (user_id := bearer_user_id(auth)) is not None:
+            return f"user:{user_id}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class AdmissionMiddleware:
+    """Зайве відхиляється одразу, а не стає в чергу: 503, коли клас маршрутів зайнятий повністю,
+    429, коли користувач (або IP для анонімних) вичерпав свій ліміт."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (name := route_class(scope["method"], scope["path"])) is None:
+            return await self.app(scope, receive, send)
+        limit = limits[name]
+        if limit.in_flight >= limit.concurrency:
+            limit.busy += 1
+            response = JSONResponse(status_code=503, content={"detail": "Сервер перевантажений, спробуйте пізніше"},
+                                    headers={"Retry-After": "1"})
+            return await response(scope, receive, send)
+        key = f"{name}:{client_key(scope, name)}"
+        if limit.rate > 0 and (wait := await buckets.take(key, limit.rate, limit.burst)):
+            limit.limited += 1
+            response = JSONResponse(status_code=429, content={"detail": "Забагато запитів, спробуйте пізніше"},
+                                    headers={"Retry-After": str(math.ceil(wait))})
+            return await response(scope, receive, send)
+        limit.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.in_flight -= 1
+
+
+def admission_stats() -> dict:
+    stats = {"enabled": ADMISSION_ENABLED, **buckets.stats()}
+    for name, limit in limits.items():
+        stats.update({f"{name}_in_flight": limit.in_flight, f"{name}_concurrency": limit.concurrency,
+                      f"{name}_rate": limit.rate, f"{name}_busy": limit.busy, f"{name}_limited": limit.limited})
+    return stats
@@ -1,5 +1,21 @@
+import os
+import hmac
+import time
 from pydantic import BaseModel, EmailStr, Field, field_validator
 
+from app.cache import TTLCache
+from app.response_cache import invalidate_books
+from app.security import decode_token
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+
+# Службові ендпоїнти (журнал повільних запитів) — лише із заголовком X-Admin-Token; не задано — вимкнені.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# token -> {"claims": ..., "user": ...}; запис живе не довше, ніж сам токен (exp)
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
@@ -25,11 +41,47 @@ class SignupIn(BaseModel):
         return v
 
 
-def get_user_by_email(cur, email: str):
-    cur.execute("SELECT id, email, password_hash FROM users WHERE LOWER(email)=LOWER(%s)", (email,))
-    return cur.fetchone()
+async def get_user_by_email(cur, email: str):
+    await cur.execute("SELECT id, email, password_hash FROM users WHERE LOWER(email)=LOWER(%s)", (email,))
+    return await cur.fetchone()
+
+async def get_user_by_id(cur, uid: int):
+    await cur.execute("SELECT id, email FROM users WHERE id=%s", (uid,))
+    return await cur.fetchone()
+
+
+async def delete_user(cur, uid: int):
+    # Книги видаляються явно (а не лише каскадом), щоб скинути їх у кеші відповідей.
+    await cur.execute("DELETE FROM books WHERE owner_id=%s RETURNING id", (uid,))
+    book_ids = [r["id"] for r in await cur.fetchall()]
+    await cur.execute("DELETE FROM users WHERE id=%s", (uid,))
+    invalidate_user(uid)
+    if book_ids:
+        invalidate_books(*book_ids)
+
+def token_entry(token: str) -> dict:
+    entry = token_cache.get(token)
+    if entry is None:
+        claims = decode_token(token)
+        entry = {"claims": claims, "user": None}
+        token_cache.set(token, entry, ttl=float(claims.get("exp", 0)) - time.time())
+    return entry
+
+def bearer_user_id(authorization: str) -> int | None:
+    """sub із заголовка Authorization; без токена чи з недійсним — None (для публічних маршрутів)."""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return int(token_entry(token)["claims"]["sub"])
+    except Exception:
+        return None
+
+def is_admin(token: str | None) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
 
-def get_user_by_id(cur, uid: int):
-    cur.execute("SELECT id, email FROM users WHERE id=%s", (uid,))
-    return cur.fetchone()
+def invalidate_user(uid: int):
+    token_cache.discard_where(lambda _, entry: str(entry["claims"].get("sub")) == str(uid))
 
+def token_cache_stats() -> dict:
+    return token_cache.stats()
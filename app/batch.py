@@ -0,0 +1,205 @@
+import os
+from typing import List, Literal, Optional
+
+from psycopg.errors import UniqueViolation
+from pydantic import BaseModel, Field, model_validator
+
+from app.adb import get_async_dict_cursor
+from app.books import BookIn, BookOut, author_cache, remember_author
+
+BATCH_MAX = int(os.getenv("BATCH_MAX", "1000"))
+
+class BatchOp(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[int] = Field(None, description="Для update/delete")
+    book: Optional[BookIn] = Field(None, description="Для create/update")
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if self.op != "create" and self.id is None:
+            raise ValueError(f"{self.op} потребує id")
+        if self.op != "delete" and self.book is None:
+            raise ValueError(f"{self.op} потребує book")
+        return self
+
+class BookBatch(BaseModel):
+    ops: List[BatchOp] = Field(..., min_length=1, max_length=BATCH_MAX)
+
+    @model_validator(mode="after")
+    def unique_ids(self):
+        ids = [o.id for o in self.ops if o.id is not None]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Кожна книга може з'явитися в пачці лише один раз")
+        return self
+
+class BatchResult(BaseModel):
+    status: int
+    book: Optional[BookOut] = None
+    detail: Optional[str] = None
+
+NOT_FOUND = BatchResult(status=404, detail="Книга не знайдена")
+FORBIDDEN = BatchResult(status=403, detail="Немає доступу")
+DUPLICATE = BatchResult(status=409, detail="Книжка вже додана для цього автора і року")
+
+UPSERT_AUTHORS_SQL = """
+    INSERT INTO authors(name) SELECT unnest(%s::text[])
+    ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+    RETURNING id, name, (xmax = 0) AS created
+"""
+
+# target бачить рядки до зміни, тож 404 (немає) і 403 (чужа) розрізняються в тому ж запиті.
+DELETE_SQL = """
+    WITH req AS (SELECT unnest(%(ids)s::bigint[]) AS id),
+    target AS (SELECT b.id, b.owner_id FROM books b JOIN req USING (id)),
+    del AS (
+        DELETE FROM books b USING req
+        WHERE b.id = req.id AND b.owner_id = %(owner_id)s
+        RETURNING b.id
+    )
+    SELECT req.id, target.owner_id, del.id IS NOT NULL AS done
+    FROM req LEFT JOIN target USING (id) LEFT JOIN del USING (id)
+"""
+
+# Власник перевіряється до upsert авторів, щоб оновлення чужих чи відсутніх книг не створювали авторів.
+# FOR UPDATE тримає рядки до UPDATE_SQL у тій самій транзакції.
+OWNERS_SQL = "SELECT id, owner_id FROM books WHERE id = ANY(%s::bigint[]) ORDER BY id FOR UPDATE"
+
+UPDATE_SQL = """
+    WITH req AS (
+        SELECT * FROM unnest(%(ids)s::bigint[], %(titles)s::text[], %(author_ids)s::int[],
+                             %(genres)s::genre_enum[], %(years)s::int[])
+               AS r(id, title, author_id, genre, published_year)
+    ),
+    target AS (SELECT b.id, b.owner_id FROM books b JOIN req USING (id)),
+    upd AS (
+        UPDATE books b
+        SET title = req.title, author_id = req.author_id, genre = req.genre, published_year = req.published_year
+        FROM req
+        WHERE b.id = req.id AND b.owner_id = %(owner_id)s
+        RETURNING b.id, b.title, b.genre, b.published_year
+    )
+    SELECT req.id, target.owner_id, upd.id IS NOT NULL AS done, upd.title, upd.genre, upd.published_year
+    FROM req LEFT JOIN target USING (id) LEFT JOIN upd USING (id)
+"""
+
+# Як і в імпорті: з дублікатів усередині пачки вставляється перший, решта — 409.
+CREATE_SQL = """
+    WITH req AS (
+        SELECT * FROM unnest(%(titles)s::text[], %(author_ids)s::int[], %(genres)s::genre_enum[], %(years)s::int[])
+               WITH ORDINALITY AS r(title, author_id, genre, published_year, ord)
+    ),
+    firsts AS (
+        SELECT DISTINCT ON (title, author_id, published_year) *
+        FROM req
+        ORDER BY title, author_id, published_year, ord
+    ),
+    ins AS (
+        INSERT INTO books(title, author_id, genre, published_year, owner_id)
+        SELECT title, author_id, genre, published_year, %(owner_id)s FROM firsts
+        ON CONFLICT ON CONSTRAINT books_unique DO NOTHING
+        RETURNING id, title, author_id, genre, published_year
+    )
+    SELECT f.ord, ins.id, ins.title, ins.genre, ins.published_year
+    FROM firsts f JOIN ins USING (title, author_id, published_year)
+"""
+
+async def resolve_authors(cur, names: set[str]) -> tuple[dict[str, int], list]:
+    """Id авторів: з кешу, решта — одним upsert (відсортовано, щоб конкурентні пачки брали блокування в одному порядку)."""
+    ids = {}
+    for name in names:
+        author_id = author_cache.get(name)
+        if author_id is not None:
+            ids[name] = author_id
+    missing = sorted(names - ids.keys())
+    upserted = []
+    if missing:
+        await cur.execute(UPSERT_AUTHORS_SQL, (missing,))
+        upserted = await cur.fetchall()
+        ids.update((r["name"], r["id"]) for r in upserted)
+    return ids, upserted
+
+def _book_params(items: list[BatchOp], author_ids: dict[str, int]) -> dict:
+    return {
+        "titles": [o.book.title for o in items],
+        "author_ids": [author_ids[o.book.author] for o in items],
+        "genres": [o.book.genre.value for o in items],
+        "years": [o.book.published_year for o in items],
+    }
+
+def _status_row(r, op: BatchOp) -> BatchResult:
+    if r["owner_id"] is None:
+        return NOT_FOUND
+    if not r["done"]:
+        return FORBIDDEN
+    if op.op == "delete":
+        return BatchResult(status=200)
+    return BatchResult(status=200, book=BookOut(id=r["id"], title=r["title"], author=op.book.author,
+                                                genre=r["genre"], published_year=r["published_year"]))
+
+async def _apply_updates(c, cur, items: list[tuple[int, BatchOp]], author_ids: dict, user_id: int, results: list):
+    ops = [op for _, op in items]
+    try:
+        async with c.transaction():
+            await cur.execute(UPDATE_SQL, {"ids": [o.id for o in ops], "owner_id": user_id, **_book_params(ops, author_ids)})
+            rows = await cur.fetchall()
+    except UniqueViolation:
+        # Пачка відкочена — повторюємо по одній, щоб знати, яке оновлення дало дублікат.
+        rows = []
+        for op in ops:
+            try:
+                async with c.transaction():
+                    await cur.execute(UPDATE_SQL, {"ids": [op.id], "owner_id": user_id, **_book_params([op], author_ids)})
+                    rows.append(await cur.fetchone())
+            except UniqueViolation:
+                rows.append(None)
+    by_id = {r["id"]: r for r in rows if r is not None}
+    for i, op in items:
+        results[i] = _status_row(by_id[op.id], op) if op.id in by_id else DUPLICATE
+
+async def run_batch(c, batch: BookBatch, user_id: int) -> tuple[list[BatchResult], list[int]]:
+    """Виконує пачку в одній транзакції: спершу видалення, потім оновлення, потім створення.
+
+    Повертає результати в порядку операцій і id змінених книг.
+    """
+    results: list[BatchResult | None] = [None] * len(batch.ops)
+    deletes = [(i, o) for i, o in enumerate(batch.ops) if o.op == "delete"]
+    updates = [(i, o) for i, o in enumerate(batch.ops) if o.op == "update"]
+    creates = [(i, o) for i, o in enumerate(batch.ops) if o.op == "create"]
+
+    async with get_async_dict_cursor(c) as cur:
+        async with c.transaction():
+            if updates:
+                await cur.execute(OWNERS_SQL, ([o.id for _, o in updates],))
+                owners = {r["id"]: r["owner_id"] for r in await cur.fetchall()}
+                for i, op in updates:
+                    if op.id not in owners:
+                        results[i] = NOT_FOUND
+                    elif owners[op.id] != user_id:
+                        results[i] = FORBIDDEN
+                updates = [(i, o) for i, o in updates if results[i] is None]
+
+            author_ids, upserted = await resolve_authors(cur, {o.book.author for _, o in updates + creates})
+
+            if deletes:
+                await cur.execute(DELETE_SQL, {"ids": [o.id for _, o in deletes], "owner_id": user_id})
+                by_id = {r["id"]: r for r in await cur.fetchall()}
+                for i, op in deletes:
+                    results[i] = _status_row(by_id[op.id], op)
+
+            if updates:
+                await _apply_updates(c, cur, updates, author_ids, user_id, results)
+
+            if creates:
+                await cur.execute(CREATE_SQL, {"owner_id": user_id, **_book_params([o for _, o in creates], author_ids)})
+                by_ord = {r["ord"]: r for r in await cur.fetchall()}
+                for n, (i, op) in enumerate(creates, start=1):
+                    r = by_ord.get(n)
+                    results[i] = DUPLICATE if r is None else BatchResult(status=200, book=BookOut(
+                        id=r["id"], title=r["title"], author=op.book.author,
+                        genre=r["genre"], published_year=r["published_year"]))
+
+        for r in upserted:
+            remember_author(cur, r["name"], r["id"], r["created"])
+
+    changed = [r.book.id if r.book else batch.ops[i].id for i, r in enumerate(results) if r.status == 200]
+    return results, changed
@@ -1,15 +1,30 @@
+import os
 import re
+import json
+import base64
 from enum import Enum
 from datetime import datetime
 
-from pydantic import BaseModel, Field, field_validator
+from psycopg.pq import TransactionStatus
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field, TypeAdapter, field_validator
+from typing_extensions import NotRequired, TypedDict
+
+from app.cache import TTLCache
+
+AUTHOR_CACHE_SIZE = int(os.getenv("AUTHOR_CACHE_SIZE", "50000"))
+AUTHOR_CACHE_TTL = float(os.getenv("AUTHOR_CACHE_TTL", "3600"))
+AUTHOR_CACHE_WARM = int(os.getenv("AUTHOR_CACHE_WARM", "1000"))
 
 
 
 
 CURRENT_YEAR = datetime.now().year
-TITLE_RE  = re.compile(r"^[A-Za-zА-Яа-яІіЇїЄєҐґ0-9\s\"'\-]+$")
-AUTHOR_RE = re.compile(r"^[A-Za-zА-Яа-яІіЇїЄєҐґ\s]+$")
+TITLE_CHARS  = r"A-Za-zА-Яа-яІіЇїЄєҐґ0-9\s\"'\-"
+AUTHOR_CHARS = r"A-Za-zА-Яа-яІіЇїЄєҐґ\s"
+TITLE_RE  = re.compile(rf"^[{TITLE_CHARS}]+$")
+AUTHOR_RE = re.compile(rf"^[{AUTHOR_CHARS}]+$")
 
 class Genre(str, Enum):
     fiction    = "Fiction"
@@ -43,17 +58,170 @@ class BookIn(BaseModel):
 class BookOut(BookIn):
     id: int
 
+class BookImportRow(TypedDict):
+    """Поля BookIn без Python-валідаторів — для пакетної перевірки в pydantic-core (imports.validate_items)."""
+    title: Annotated[str, Field(min_length=1)]
+    author: Annotated[str, Field(min_length=1)]
+    genre: Literal[tuple(g.value for g in Genre)]
+    published_year: Annotated[int, Field(ge=1800, le=CURRENT_YEAR)]
+    _row: NotRequired[int]
+
+# name -> id; автори не змінюються і не видаляються застосунком, тож запис може жити довго
+author_cache = TTLCache(AUTHOR_CACHE_SIZE, AUTHOR_CACHE_TTL)
+_author_stats = {"upserts": 0, "created": 0, "warmed": 0}
+
+# Один запит замість SELECT + INSERT і без гонки між двома конкурентними вставками того самого імені.
+UPSERT_AUTHOR_SQL = """
+    INSERT INTO authors(name) VALUES (%s)
+    ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+    RETURNING id, (xmax = 0) AS created
+"""
+
+def remember_author(cur, name: str, author_id: int, created: bool | None) -> int:
+    """Записує результат upsert автора; created=None означає, що id і так узято з кешу."""
+    if created is None:
+        return author_id
+    _author_stats["upserts"] += 1
+    _author_stats["created"] += created
+    # Автор, вставлений у ще не закомічену транзакцію, може відкотитися разом із нею — такий id не кешуємо.
+    if cur.connection.info.transaction_status == TransactionStatus.IDLE:
+        author_cache.set(name, author_id)
+    return author_id
+
 def get_or_create_author(cur, name: str) -> int:
-    cur.execute("SELECT id FROM authors WHERE name=%s", (name,))
-    r = cur.fetchone()
-    if r:
-        return r["id"]
-    cur.execute("INSERT INTO authors(name) VALUES (%s) RETURNING id", (name,))
-    return cur.fetchone()["id"]
+    author_id = author_cache.get(name)
+    if author_id is None:
+        cur.execute(UPSERT_AUTHOR_SQL, (name,))
+        r = cur.fetchone()
+        author_id = remember_author(cur, name, r["id"], r["created"])
+    return author_id
+
+def author_cte(name: str, guard: str = "") -> tuple[str, dict]:
+    """CTE `a(id, created)` для запису книги одним запитом: id з кешу або upsert автора.
+
+    `guard` — умова WHERE, за якої автора взагалі можна створювати (напр. перевірка власника).
+    """
+    author_id = author_cache.get(name)
+    if author_id is not None:
+        return "a AS (SELECT %(author_id)s::int AS id, NULL::boolean AS created)", {"author": name, "author_id": author_id}
+    return f"""a AS (
+        INSERT INTO authors(name) SELECT %(author)s {guard}
+        ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+        RETURNING id, (xmax = 0) AS created
+    )""", {"author": name}
+
+def warm_author_cache(cur, limit: int = AUTHOR_CACHE_WARM) -> int:
+    """Заповнює кеш найуживанішими авторами (за кількістю книг)."""
+    limit = min(limit, AUTHOR_CACHE_SIZE)
+    if limit <= 0:
+        return 0
+    cur.execute(
+        """SELECT a.id, a.name
+           FROM (SELECT author_id, count(*) AS n FROM books GROUP BY author_id ORDER BY n DESC LIMIT %s) t
+           JOIN authors a ON a.id = t.author_id
+           ORDER BY t.n""",
+        (limit,),
+    )
+    rows = cur.fetchall()
+    for r in rows:
+        author_cache.set(r["name"], r["id"])
+    _author_stats["warmed"] += len(rows)
+    return len(rows)
+
+def author_cache_stats() -> dict:
+    """round_trips_saved — порівняно з SELECT + INSERT: влучання економить SELECT, новий автор — INSERT."""
+    return {**author_cache.stats(), **_author_stats,
+            "round_trips_saved": author_cache.hits + _author_stats["created"]}
 
 def row_to_out(r) -> BookOut:
     return BookOut(**r)
 
+# Швидкий шлях для читання: рядок БД -> JSON без проміжних BookOut. Серіалізатор TypedDict
+# зберігає порядок ключів рядка, тому колонки вибираються в порядку полів BookOut —
+# тоді байти збігаються з тим, що віддав би response_model.
+BOOK_COLUMNS = "b.title, a.name AS author, b.genre, b.published_year, b.id"
 
+class BookRow(TypedDict):
+    title: str
+    author: str
+    genre: str
+    published_year: int
+    id: int
 
-
+_book_json = TypeAdapter(BookRow)
+_books_json = TypeAdapter(list[BookRow])
+
+def book_json(r) -> bytes:
+    return _book_json.dump_json(r)
+
+def books_json(rows) -> bytes:
+    return _books_json.dump_json(rows)
+
+# Назва сортується без урахування регістру; індекси books_*title* побудовані саме по lower(title).
+SORT_MAP = {"title": "lower(b.title)", "author": "a.name", "year": "b.published_year"}
+SORT_FIELD = {"title": "title", "author": "author", "year": "published_year"}
+# Значення з курсора приводиться до того ж ключа, що й колонка в SORT_MAP.
+SORT_PARAM = {"title": "lower(%s)", "author": "%s", "year": "%s"}
+
+def build_filters(search=None, author=None, genre=None, year_from=None, year_to=None) -> tuple[list[str], list]:
+    where = []
+    args = []
+
+    # Умови по авторах винесені в ARRAY(підзапит): так планувальник може поєднати
+    # trigram-індекс books.title з індексом books.author_id через BitmapOr.
+    if search:
+        where.append("(b.title ILIKE %s OR b.author_id = ANY(ARRAY(SELECT id FROM authors WHERE name ILIKE %s)))")
+        args += [f"%{search}%", f"%{search}%"]
+    if author:
+        where.append("b.author_id = ANY(ARRAY(SELECT id FROM authors WHERE name ILIKE %s))")
+        args.append(f"%{author}%")
+
+    if genre:
+        where.append("b.genre = %s")
+        args.append(genre.value)
+
+    if year_from is not None:
+        where.append("b.published_year >= %s")
+        args.append(year_from)
+
+    if year_to is not None:
+        where.append("b.published_year <= %s")
+        args.append(year_to)
+
+    return where, args
+
+def encode_cursor(row, sort: str) -> str:
+    raw = json.dumps([row[SORT_FIELD[sort]], row["id"]], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Некоректний курсор")
+    expected = int if sort == "year" else str
+    if type(value) is not expected or type(last_id) is not int:
+        raise ValueError("Некоректний курсор")
+    return value, last_id
+
+RELEVANCE_SQL = "GREATEST(similarity(b.title, %s), similarity(a.name, %s))"
+
+def keyset_page(where: list[str], args: list, sort: str, order: str, cursor: str | None, search: str | None = None) -> str:
+    """Додає умову курсора до where/args і повертає ORDER BY для стабільного порядку (ключ сортування + id).
+
+    Параметри ORDER BY також додаються в args, тому where після виклику розширювати не можна.
+    """
+    if sort == "relevance":
+        if not search:
+            raise ValueError("sort=relevance потребує параметра search")
+        if cursor:
+            raise ValueError("Курсор не підтримується для sort=relevance, використовуйте offset")
+        args += [search, search]
+        return f"ORDER BY {RELEVANCE_SQL} DESC, b.id ASC"
+    col = SORT_MAP[sort]
+    order_kw = "ASC" if order == "asc" else "DESC"
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort)
+        where.append(f"({col}, b.id) {'>' if order == 'asc' else '<'} ({SORT_PARAM[sort]}, %s)")
+        args += [value, last_id]
+    return f"ORDER BY {col} {order_kw}, b.id {order_kw}"
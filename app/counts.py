@@ -0,0 +1,90 @@
+import os
+
+from app.cache import TTLCache
+from app.response_cache import list_key
+
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", "10000"))
+# Ключ містить покоління списків, тож запис скидає кеш одразу — але лише там, де покоління спільне:
+# з RESPONSE_CACHE_BACKEND=memory воно своє в кожному воркері serve.py, і запис в одному воркері
+# не скидає COUNT, закешований в іншому. Тоді (і з backend=off) кількість може відставати до COUNT_CACHE_TTL.
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "30"))
+
+count_cache = TTLCache(COUNT_CACHE_SIZE, COUNT_CACHE_TTL)
+_count_stats = {"counter": 0, "exact": 0, "planner": 0}
+
+# Базовий рядок плюс ще не перенесені зміни з book_counts_delta (їх небагато — лише з останнього переносу).
+COUNTER_SQL = {
+    frozenset(): """
+        SELECT ((SELECT COALESCE(SUM(n), 0) FROM book_counts_by_genre)
+                + (SELECT COALESCE(SUM(delta), 0) FROM book_counts_delta))::bigint AS n
+    """,
+    frozenset({"genre"}): """
+        SELECT ((SELECT COALESCE(SUM(n), 0) FROM book_counts_by_genre WHERE genre = %(genre)s)
+                + (SELECT COALESCE(SUM(delta), 0) FROM book_counts_delta WHERE genre = %(genre)s))::bigint AS n
+    """,
+    frozenset({"owner_id"}): """
+        SELECT ((SELECT COALESCE(SUM(n), 0) FROM book_counts_by_owner WHERE owner_id = %(owner_id)s)
+                + (SELECT COALESCE(SUM(delta), 0) FROM book_counts_delta WHERE owner_id = %(owner_id)s))::bigint AS n
+    """,
+}
+
+# Як у app.stats: один DELETE ... RETURNING, тож кожна зміна переноситься рівно раз, а читач бачить
+# її або в журналі, або вже в базовому рядку. Власники з нулем видаляються окремо (рядок уже змінено в CTE).
+FOLD_SQL = """
+    WITH moved AS (
+        DELETE FROM book_counts_delta RETURNING genre, owner_id, delta
+    ),
+    genre AS (
+        INSERT INTO book_counts_by_genre AS t (genre, n)
+        SELECT genre, SUM(delta) FROM moved
+        GROUP BY genre HAVING SUM(delta) <> 0 ORDER BY genre
+        ON CONFLICT (genre) DO UPDATE SET n = t.n + EXCLUDED.n
+    ),
+    owner AS (
+        INSERT INTO book_counts_by_owner AS t (owner_id, n)
+        SELECT owner_id, SUM(delta) FROM moved
+        GROUP BY owner_id HAVING SUM(delta) <> 0 ORDER BY owner_id
+        ON CONFLICT (owner_id) DO UPDATE SET n = t.n + EXCLUDED.n
+        RETURNING owner_id, n
+    )
+    SELECT (SELECT COUNT(*) FROM moved) AS moved,
+           (SELECT array_agg(owner_id) FROM owner WHERE n = 0) AS emptied
+"""
+
+async def total_count(cur, mode: str, where: list[str], args: list, filters: dict, cache: bool = True) -> dict:
+    """Заголовки X-Total-Count для списку з фільтрами where/args (без умови курсора).
+
+    Без фільтрів, лише за жанром чи власником — з таблиць лічильників (точно, без сканування books). Інакше
+    exact рахує COUNT(*) і кешує його для цього набору фільтрів, estimate бере оцінку планувальника.
+    cache=False — cur з репліки: її COUNT може ще не враховувати останній запис, тож у кеш він не йде.
+    """
+    # Порожній рядок (?search=) build_filters пропускає — тут так само, інакше вийшло б "WHERE " без умов.
+    used = {k: v for k, v in filters.items() if v is not None and v != ""} if where else {}
+    sql = COUNTER_SQL.get(frozenset(used))
+    if sql is not None:
+        await cur.execute(sql, used)
+        n, source = (await cur.fetchone())["n"], "counter"
+    elif mode == "exact":
+        key = list_key("count", used)
+        n, source = count_cache.get(key), "exact"
+        if n is None:
+            await cur.execute(f"SELECT COUNT(*) AS n FROM books b WHERE {' AND '.join(where)}", args)
+            n = (await cur.fetchone())["n"]
+            if cache:
+                count_cache.set(key, n)
+    else:
+        await cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM books b WHERE {' AND '.join(where)}", args)
+        n, source = (await cur.fetchone())["QUERY PLAN"][0]["Plan"]["Plan Rows"], "planner"
+    _count_stats[source] += 1
+    return {"X-Total-Count": str(n), "X-Total-Count-Source": source}
+
+async def fold_counts(cur) -> int:
+    """Переносить book_counts_delta у таблиці лічильників; викликається з app.stats під його блокуванням."""
+    await cur.execute(FOLD_SQL)
+    row = await cur.fetchone()
+    if row["emptied"]:
+        await cur.execute("DELETE FROM book_counts_by_owner WHERE owner_id = ANY(%s) AND n = 0", (row["emptied"],))
+    return row["moved"]
+
+def count_cache_stats() -> dict:
+    return {**count_cache.stats(), **_count_stats}
@@ -1,8 +1,14 @@
 import os
+import time
+import asyncio
 import psycopg
 from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool, PoolTimeout
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
+from app.metrics import TIMED_CURSORS, TimedCursor, observe_acquire
+
 load_dotenv()
 
 PGUSER = os.getenv("PGUSER")
@@ -11,8 +17,80 @@ PGHOST = os.getenv("PGHOST")
 PGPORT = os.getenv("PGPORT")
 DBNAME = os.getenv("DBNAME")
 
+POOL_MIN_SIZE = int(os.getenv("PG_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("PG_POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("PG_POOL_TIMEOUT", "5"))
+POOL_MAX_IDLE = float(os.getenv("PG_POOL_MAX_IDLE", "300"))
+POOL_MAX_LIFETIME = float(os.getenv("PG_POOL_MAX_LIFETIME", "1800"))
+
+_pool: ConnectionPool | None = None
+_slots: asyncio.Semaphore | None = None
+_slots_waiting = 0
+
+def conninfo() -> str:
+    return psycopg.conninfo.make_conninfo(host=PGHOST, port=PGPORT, user=PGUSER, password=PGPASSWORD, dbname=DBNAME)
+
 def conn():
     return psycopg.connect(host=PGHOST, port=PGPORT, user=PGUSER, password=PGPASSWORD,dbname=DBNAME, autocommit=True)
 
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(
+            conninfo(),
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE,
+            timeout=POOL_TIMEOUT,
+            max_idle=POOL_MAX_IDLE,
+            max_lifetime=POOL_MAX_LIFETIME,
+            check=ConnectionPool.check_connection,
+            kwargs={"autocommit": True},
+            name="books",
+            open=True,
+        )
+    return _pool
+
+def open_pool():
+    get_pool().wait()
+
+def close_pool():
+    global _pool, _slots
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+    _slots = None
+
+def pool_stats() -> dict:
+    if _pool is None:
+        return {"open": False}
+    return {"open": True, "slots_waiting": _slots_waiting, **_pool.get_stats()}
+
+# Чекаємо на вільне з'єднання в event loop, а не в потоці threadpool:
+# інакше потоки, що чекають на пул, не дають власникам з'єднань їх повернути.
+async def get_conn():
+    global _slots, _slots_waiting
+    pool = get_pool()
+    if _slots is None:
+        _slots = asyncio.Semaphore(pool.max_size)
+    started = time.perf_counter()
+    _slots_waiting += 1
+    try:
+        await asyncio.wait_for(_slots.acquire(), POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PoolTimeout(f"couldn't get a connection after {POOL_TIMEOUT:.2f} sec")
+    finally:
+        _slots_waiting -= 1
+    try:
+        c = await run_in_threadpool(pool.getconn)
+        observe_acquire("sync", started)
+        try:
+            yield c
+        finally:
+            pool.putconn(c)
+    finally:
+        _slots.release()
+
 def get_dict_cursor(con):
-    return con.cursor(row_factory=dict_row)
\ No newline at end of file
+    if TIMED_CURSORS:
+        return TimedCursor(con, row_factory=dict_row)
+    return con.cursor(row_factory=dict_row)
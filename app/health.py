@@ -0,0 +1,33 @@
+import os
+import asyncio
+
+import psycopg
+from psycopg_pool import PoolTimeout
+
+from app.db import pool_stats, POOL_MAX_SIZE
+from app.adb import get_apool, apool_stats
+
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "1"))
+# Скільки запитів може чекати на з'єднання, поки інстанс ще вважається готовим.
+READY_MAX_WAITING = int(os.getenv("READY_MAX_WAITING", str(POOL_MAX_SIZE)))
+
+async def check_db() -> dict:
+    try:
+        async with (await get_apool()).connection(timeout=READY_TIMEOUT) as c:
+            await asyncio.wait_for(c.execute("SELECT 1"), READY_TIMEOUT)
+    except (PoolTimeout, psycopg.Error, asyncio.TimeoutError) as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    return {"ok": True}
+
+def check_pool(stats: dict) -> dict:
+    if not stats["open"]:
+        return {"ok": False, "error": "пул закритий"}
+    waiting = stats.get("requests_waiting", 0) + stats.get("slots_waiting", 0)
+    return {"ok": waiting <= READY_MAX_WAITING, "waiting": waiting,
+            "available": stats.get("pool_available", 0), "size": stats.get("pool_size", 0),
+            "max": stats.get("pool_max", 0)}
+
+async def readiness() -> dict:
+    """Готовність приймати трафік: БД відповідає, і черга на з'єднання не довша за READY_MAX_WAITING."""
+    checks = {"db": await check_db(), "pool": check_pool(pool_stats()), "apool": check_pool(apool_stats())}
+    return {"ok": all(c["ok"] for c in checks.values()), **checks}
@@ -1,13 +1,167 @@
-from typing import Any, Dict, List, Tuple
+from typing import Annotated, Any, BinaryIO, Dict, Iterable, Iterator, List, Tuple, Union
+from functools import partial
+from bisect import bisect_right
+from itertools import accumulate, chain, islice
+import os
+import re
+import time
 import json
 import csv
 import io
+import codecs
 from psycopg.errors import UniqueViolation
+from pydantic import Field, TypeAdapter
 
-from app.db import conn, get_dict_cursor
-from app.books import BookIn, get_or_create_author
+from app.db import get_dict_cursor
+from app.books import BookIn, BookImportRow, TITLE_CHARS, AUTHOR_CHARS, get_or_create_author
+from app.response_cache import invalidate_books
+from app.replicas import mark_write
+from app.metrics import observe_import_batch
 
-def parse_upload(filename: str, content_type: str | None, raw: bytes) -> List[Dict[str, Any]]:
+READ_CHUNK = 64 * 1024
+MAX_JSON_ITEM = 1024 * 1024
+IMPORT_MAX_ERRORS = 200
+
+_json_decoder = json.JSONDecoder()
+_END = object()
+
+class _JsonStream:
+    """Інкрементальний розбір JSON: тримає в пам'яті лише поточний елемент масиву."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self.eof = True
+            text = self._decoder.decode(b"", final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str):
+        if self.peek() != ch:
+            raise ValueError(f"Некоректний JSON: очікувався '{ch}' (позиція {self.pos})")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = _json_decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if len(self.buf) - self.pos > MAX_JSON_ITEM:
+                    raise ValueError("Некоректний JSON: елемент завеликий")
+                if not self._fill():
+                    raise ValueError(f"Некоректний JSON: {e}")
+                continue
+            # число в кінці буфера могло бути обрізане посередині
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def array(self) -> Iterator[Any]:
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            ch = self.peek()
+            self.pos += 1
+            if ch == "]":
+                return
+            if ch != ",":
+                raise ValueError("Некоректний JSON: очікувалась ',' або ']'")
+
+def iter_json_items(chunks: Iterator[bytes]) -> Iterator[Any]:
+    s = _JsonStream(chunks)
+    ch = s.peek()
+    if ch == "[":
+        yield from s.array()
+        if s.peek():
+            raise ValueError("Некоректний JSON: зайві дані після масиву")
+        return
+    if ch == "{":
+        s.pos += 1
+        while s.peek() not in ("}", ""):
+            key = s.value()
+            s.expect(":")
+            if key == "items" and s.peek() == "[":
+                yield from s.array()
+                return
+            s.value()
+            if s.peek() == ",":
+                s.pos += 1
+    elif not ch:
+        raise ValueError("Некоректний JSON: порожній файл")
+    raise ValueError("JSON має бути масивом об'єктів або {'items': [...]}")
+
+def _iter_text_lines(chunks: Iterator[bytes], encoding: str) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    tail = ""
+    for chunk in chain(chunks, [None]):
+        text = tail + (decoder.decode(chunk) if chunk is not None else decoder.decode(b"", final=True))
+        lines = text.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if tail:
+        yield tail
+
+def _csv_int(v):
+    try:
+        return int(v or 0)
+    except ValueError:
+        return v
+
+def iter_csv_items(chunks: Iterator[bytes]) -> Iterator[Dict[str, Any]]:
+    reader = csv.DictReader(_iter_text_lines(chunks, "utf-8-sig"))
+    expected = {"title", "author", "genre", "published_year"}
+    got = set(map(str.lower, reader.fieldnames or []))
+    if got != expected:
+        raise ValueError("CSV заголовок має бути: title,author,genre,published_year")
+
+    for idx, row in enumerate(reader, start=2):
+        yield {
+            "title": row.get("title"),
+            "author": row.get("author"),
+            "genre": row.get("genre"),
+            "published_year": _csv_int(row.get("published_year")),
+            "_row": idx,
+        }
+
+def _guard(items: Iterator[Any], prefix: str) -> Iterator[Any]:
+    """Помилку розбору посеред файлу віддає як елемент з _error: попередні пачки вже імпортовані."""
+    n = 0
+    try:
+        for n, item in enumerate(items, start=1):
+            yield item
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        msg = str(e)
+        yield {"_error": msg if msg.startswith(prefix) else f"{prefix}: {msg}", "_row": n + 1}
+
+def parse_upload(filename: str, content_type: str | None, source: bytes | BinaryIO) -> Iterator[Dict[str, Any]]:
+    """Повертає ітератор елементів файлу; помилки формату на початку файлу кидаються одразу як ValueError."""
     name = (filename or "").lower()
     is_json = ("json" in name) or (content_type == "application/json")
     is_csv = ("csv" in name) or (content_type in {"text/csv", "application/csv"})
@@ -15,68 +169,190 @@ def parse_upload(filename: str, content_type: str | None, raw: bytes) -> List[Di
     if not (is_json or is_csv):
         raise ValueError("Підтримуються лише JSON або CSV")
 
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    chunks = iter(partial(source.read, READ_CHUNK), b"")
+
     if is_json:
-        try:
-            data = json.loads(raw.decode("utf-8"))
-        except Exception as e:
-            raise ValueError(f"Некоректний JSON: {e}")
+        items = _guard(iter_json_items(chunks), "Некоректний JSON")
+    else:
+        items = _guard(iter_csv_items(chunks), "Некоректний CSV")
 
-        if isinstance(data, dict) and isinstance(data.get("items"), list):
-            return data["items"]
-        if isinstance(data, list):
-            return data
-        raise ValueError("JSON має бути масивом об'єктів або {'items': [...]}")
+    first = next(items, _END)
+    if first is _END:
+        return iter(())
+    if isinstance(first, dict) and "_error" in first:
+        raise ValueError(first["_error"])
+    return chain([first], items)
 
-    try:
-        text = raw.decode("utf-8-sig")
-        reader = csv.DictReader(io.StringIO(text))
-        expected = {"title", "author", "genre", "published_year"}
-        got = set(map(str.lower, reader.fieldnames or []))
-        if got != expected:
-            raise ValueError("CSV заголовок має бути: title,author,genre,published_year")
-
-        items: List[Dict[str, Any]] = []
-        for idx, row in enumerate(reader, start=2):
-            items.append({
-                "title": row.get("title"),
-                "author": row.get("author"),
-                "genre": row.get("genre"),
-                "published_year": int(row.get("published_year") or 0),
-                "_row": idx,
-            })
-        return items
-    except Exception as e:
-        raise ValueError(f"Некоректний CSV: {e}")
-
-def import_books_items(items: List[Dict[str, Any]], user_id: int) -> Tuple[int, int, List[Dict[str, Any]]]:
-    created = 0
-    skipped = 0
-    errors: List[Dict[str, Any]] = []
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "5000"))
 
-    with conn() as c, get_dict_cursor(c) as cur:
-        for i, raw_item in enumerate(items, start=1):
-            row_no = raw_item.pop("_row", i)
+STAGE_SQL = """
+    CREATE TEMP TABLE import_stage (
+        row_no         INT,
+        title          TEXT,
+        author         TEXT,
+        genre          genre_enum,
+        published_year INT
+    ) ON COMMIT DROP
+"""
 
-            try:
-                item = BookIn(**raw_item)
-            except Exception as e:
-                errors.append({"row": row_no, "error": str(e)})
-                skipped += 1
-                continue
+# Перший рядок для кожного ключа books_unique вставляється, решта — дублікати.
+INSERT_STAGED_SQL = """
+    WITH firsts AS (
+        SELECT DISTINCT ON (s.title, a.id, s.published_year)
+               s.row_no, s.title, a.id AS author_id, s.genre, s.published_year
+        FROM import_stage s
+        JOIN authors a ON a.name = s.author
+        ORDER BY s.title, a.id, s.published_year, s.row_no
+    ), ins AS (
+        INSERT INTO books(title, author_id, genre, published_year, owner_id)
+        SELECT title, author_id, genre, published_year, %s FROM firsts
+        ON CONFLICT ON CONSTRAINT books_unique DO NOTHING
+        RETURNING title, author_id, published_year
+    )
+    SELECT f.row_no FROM firsts f JOIN ins USING (title, author_id, published_year)
+"""
+
+# Рядок, готовий до вставки: (row_no, title, author, genre, published_year) — у порядку колонок import_stage.
+ImportRow = Tuple[int, str, str, str, int]
+
+# Рядок, що не пройшов BookImportRow, повертається як є (гілка Any) — без винятку на всю пачку.
+_rows_adapter = TypeAdapter(List[Annotated[Union[BookImportRow, Any], Field(union_mode="left_to_right")]])
+_TITLE_BAD = re.compile(rf"[^{TITLE_CHARS}]")
+_AUTHOR_BAD = re.compile(rf"[^{AUTHOR_CHARS}]")
 
+def _bad_values(values: List[str], bad: re.Pattern) -> set:
+    """Індекси порожніх значень або значень із недозволеними символами.
+
+    Значення склеюються через \\n (він і так дозволений як \\s), тож уся пачка перевіряється одним проходом регулярки.
+    """
+    idx = {i for i, v in enumerate(values) if not v} if "" in values else set()
+    joined = "\n".join(values)
+    positions = [m.start() for m in bad.finditer(joined)]
+    if positions:
+        starts = list(accumulate(len(v) + 1 for v in values))
+        idx.update(bisect_right(starts, pos) for pos in positions)
+    return idx
+
+def validate_items(items: List[Any], start: int = 1) -> Tuple[List[ImportRow], List[Dict[str, Any]]]:
+    """Валідує пачку за правилами BookIn, не створюючи моделі на кожен рядок.
+
+    Типи й обмеження полів перевіряє один виклик pydantic-core, title/author — одна регулярка на пачку.
+    Лише відхилені рядки проходять через BookIn(**item), тож текст помилки такий самий, як у BookIn.
+    """
+    rows = _rows_adapter.validate_python(items)
+    rejected = {i for i, (r, item) in enumerate(zip(rows, items)) if r is item}
+    kept = range(len(items))
+    if rejected:
+        kept = [i for i in kept if i not in rejected]
+        rows = [rows[i] for i in kept]
+
+    titles = [r["title"].strip() for r in rows]
+    authors = [r["author"].strip() for r in rows]
+    bad = _bad_values(titles, _TITLE_BAD) | _bad_values(authors, _AUTHOR_BAD)
+    valid = [(r.get("_row", start + i), title, author, r["genre"], r["published_year"])
+             for n, (i, r, title, author) in enumerate(zip(kept, rows, titles, authors)) if n not in bad]
+    rejected.update(kept[n] for n in bad)
+
+    errors: List[Dict[str, Any]] = []
+    for i in sorted(rejected):
+        item = items[i]
+        row_no = item.pop("_row", start + i) if isinstance(item, dict) else start + i
+        if isinstance(item, dict) and "_error" in item:
+            errors.append({"row": row_no, "error": item["_error"]})
+            continue
+        try:
+            book = BookIn(**item)
+            valid.append((row_no, book.title, book.author, book.genre.value, book.published_year))
+        except Exception as e:
+            errors.append({"row": row_no, "error": str(e)})
+    if rejected:
+        valid.sort(key=lambda r: r[0])
+        errors.sort(key=lambda e: e["row"])
+    return valid, errors
+
+def insert_rows(c, rows: List[ImportRow], user_id: int) -> List[Dict[str, Any]]:
+    """Вставляє книги по одній (повільний шлях); повертає помилки по рядках.
+
+    Кожен рядок у власній (вкладеній) транзакції, тож помилка рядка не ламає зовнішню транзакцію пачки.
+    """
+    errors: List[Dict[str, Any]] = []
+    with get_dict_cursor(c) as cur:
+        for row_no, title, author, genre, published_year in rows:
             try:
-                author_id = get_or_create_author(cur, item.author)
-                cur.execute(
-                    """INSERT INTO books(title, author_id, genre, published_year, owner_id)
-                       VALUES (%s,%s,%s,%s,%s)""",
-                    (item.title, author_id, item.genre.value, item.published_year, user_id),
-                )
-                created += 1
+                with c.transaction():
+                    author_id = get_or_create_author(cur, author)
+                    cur.execute(
+                        """INSERT INTO books(title, author_id, genre, published_year, owner_id)
+                           VALUES (%s,%s,%s,%s,%s)""",
+                        (title, author_id, genre, published_year, user_id),
+                    )
             except UniqueViolation:
-                skipped += 1
                 errors.append({"row": row_no, "error": "duplicate (already exists)"})
             except Exception as e:
-                skipped += 1
                 errors.append({"row": row_no, "error": f"db error: {e}"})
+    return errors
+
+def insert_rows_bulk(c, rows: List[ImportRow], user_id: int) -> List[Dict[str, Any]]:
+    """COPY у тимчасову таблицю + set-based upsert авторів і вставка книг в одній транзакції."""
+    with c.transaction(), get_dict_cursor(c) as cur:
+        cur.execute(STAGE_SQL)
+        with cur.copy("COPY import_stage(row_no, title, author, genre, published_year) FROM STDIN") as cp:
+            for row in rows:
+                cp.write_row(row)
+        cur.execute(
+            """INSERT INTO authors(name)
+               SELECT DISTINCT author FROM import_stage
+               ON CONFLICT (name) DO NOTHING"""
+        )
+        cur.execute(INSERT_STAGED_SQL, (user_id,))
+        inserted = {r["row_no"] for r in cur.fetchall()}
+    return [{"row": row_no, "error": "duplicate (already exists)"} for row_no, *_ in rows if row_no not in inserted]
+
+def import_books_items(c, items: Iterable[Dict[str, Any]], user_id: int,
+                       skip: int = 0, on_batch=None) -> Tuple[int, int, List[Dict[str, Any]]]:
+    """Імпортує елементи пачками по IMPORT_BATCH; повертає перші IMPORT_MAX_ERRORS помилок.
+
+    Кожна пачка комітиться атомарно. `skip` пропускає вже оброблені елементи (відновлення задачі),
+    а `on_batch(cur, rows, created, skipped, errors)` викликається в транзакції пачки;
+    якщо він повертає False, імпорт зупиняється.
+    """
+    created = 0
+    skipped = 0
+    errors: List[Dict[str, Any]] = []
+
+    it = islice(items, skip, None)
+    start = skip + 1
+    while batch := list(islice(it, IMPORT_BATCH)):
+        started = time.perf_counter()
+        with c.transaction():
+            valid, batch_errors = validate_items(batch, start=start)
+            start += len(batch)
+            batch_created = 0
+            if valid:
+                try:
+                    db_errors = insert_rows_bulk(c, valid, user_id)
+                except Exception:
+                    # Пачка відкочена цілком — повторюємо її по рядку, щоб точно знати, який рядок зламався.
+                    db_errors = insert_rows(c, valid, user_id)
+                batch_errors += db_errors
+                batch_created = len(valid) - len(db_errors)
+            batch_errors.sort(key=lambda e: e["row"])
+            created += batch_created
+            skipped += len(batch_errors)
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors += batch_errors[:IMPORT_MAX_ERRORS - len(errors)]
+            keep_going = True
+            if on_batch is not None:
+                with get_dict_cursor(c) as cur:
+                    keep_going = on_batch(cur, len(batch), batch_created, len(batch_errors), batch_errors)
+        observe_import_batch(batch_created, len(batch_errors), time.perf_counter() - started)
+        if batch_created:
+            # Після коміту пачки: нові книги мають з'явитися в кешованих списках.
+            invalidate_books()
+            mark_write(user_id)
+        if not keep_going:
+            break
 
-    return created, skipped, errors
\ No newline at end of file
+    return created, skipped, errors
@@ -0,0 +1,219 @@
+import os
+import shutil
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, List
+
+import psycopg
+from psycopg.types.json import Jsonb
+from psycopg_pool import PoolTimeout
+
+from app.db import get_pool, get_dict_cursor
+from app.imports import parse_upload, import_books_items
+
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+IMPORT_QUEUE_MAX = int(os.getenv("IMPORT_QUEUE_MAX", "20"))
+IMPORT_SPOOL_DIR = os.getenv("IMPORT_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "book-imports")
+IMPORT_STALE_SECONDS = int(os.getenv("IMPORT_STALE_SECONDS", "120"))
+JOB_MAX_ERRORS = 200
+
+JOB_FIELDS = "id, status, filename, rows_processed, created, skipped, errors, error, cancel_requested, created_at, updated_at"
+
+_executor: ThreadPoolExecutor | None = None
+_pending = 0
+_lock = threading.Lock()
+_stopping = threading.Event()
+log = logging.getLogger(__name__)
+
+class JobQueueFull(Exception):
+    pass
+
+def spool_upload(fileobj: BinaryIO) -> str:
+    os.makedirs(IMPORT_SPOOL_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=IMPORT_SPOOL_DIR, suffix=".upload", delete=False) as out:
+        shutil.copyfileobj(fileobj, out, 1024 * 1024)
+    return out.name
+
+def create_job(cur, owner_id: int, filename: str, content_type: str | None, path: str) -> str:
+    cur.execute(
+        """INSERT INTO import_jobs(owner_id, filename, content_type, spool_path)
+           VALUES (%s,%s,%s,%s) RETURNING id""",
+        (owner_id, filename, content_type, path),
+    )
+    return str(cur.fetchone()["id"])
+
+def get_job(cur, job_id: str, owner_id: int) -> Dict[str, Any] | None:
+    cur.execute(f"SELECT {JOB_FIELDS} FROM import_jobs WHERE id=%s AND owner_id=%s", (job_id, owner_id))
+    return cur.fetchone()
+
+def cancel_job(cur, job_id: str, owner_id: int) -> Dict[str, Any] | None:
+    """Задача в черзі скасовується одразу, задача в роботі — після поточної пачки.
+
+    None — задачі немає або вона вже завершилась (done/failed/cancelled): тоді її рядок не змінюється.
+    """
+    cur.execute(
+        f"""UPDATE import_jobs
+            SET cancel_requested = TRUE,
+                status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                updated_at = NOW()
+            WHERE id=%s AND owner_id=%s AND status IN ('queued', 'running')
+            RETURNING {JOB_FIELDS}""",
+        (job_id, owner_id),
+    )
+    return cur.fetchone()
+
+def submit(job_id: str):
+    global _executor, _pending
+    with _lock:
+        if _pending >= IMPORT_QUEUE_MAX:
+            raise JobQueueFull()
+        if _executor is None:
+            _stopping.clear()
+            _executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import-job")
+        _pending += 1
+    _executor.submit(_run_job_guarded, job_id)
+
+def _run_job_guarded(job_id: str):
+    global _pending
+    try:
+        run_job(job_id)
+    except Exception as e:
+        # Future з executor ніхто не читає: без цього задача мовчки лишилася б 'running' до перезапуску.
+        log.exception("import job %s failed", job_id)
+        _fail(job_id, e)
+    finally:
+        with _lock:
+            _pending -= 1
+
+def _claim(cur, job_id: str) -> Dict[str, Any] | None:
+    cur.execute(
+        """UPDATE import_jobs SET status='running', updated_at=NOW()
+           WHERE id=%s AND NOT cancel_requested
+             AND (status='queued' OR (status='running' AND updated_at < NOW() - make_interval(secs => %s)))
+           RETURNING id, owner_id, filename, content_type, spool_path, rows_processed,
+                     jsonb_array_length(errors) AS n_errors""",
+        (job_id, IMPORT_STALE_SECONDS),
+    )
+    return cur.fetchone()
+
+def _finish(cur, job_id: str, status: str, error: str | None = None):
+    cur.execute("UPDATE import_jobs SET status=%s, error=%s, updated_at=NOW() WHERE id=%s", (status, error, job_id))
+
+def _fail(job_id: str, e: Exception):
+    """Стан задачі після неочікуваної помилки — на новому з'єднанні, бо старе могло й зламатися.
+
+    Недоступна БД чи пул — помилка тимчасова: задача повертається в чергу з файлом, і resume_jobs
+    продовжить її з rows_processed. Решта — 'failed', а файл видаляється, як і для помилок формату.
+    """
+    retry = isinstance(e, (psycopg.OperationalError, PoolTimeout))
+    try:
+        with get_pool().connection() as c, get_dict_cursor(c) as cur:
+            cur.execute("SELECT spool_path FROM import_jobs WHERE id=%s", (job_id,))
+            job = cur.fetchone()
+            _finish(cur, job_id, "queued" if retry else "failed", f"{type(e).__name__}: {e}")
+    except Exception:
+        # БД недоступна і зараз: задача лишається 'running' і після IMPORT_STALE_SECONDS вважається покинутою.
+        log.exception("import job %s: could not record failure", job_id)
+        return
+    if job and not retry:
+        _remove_spool(job["spool_path"])
+
+def run_job(job_id: str):
+    with get_pool().connection() as c:
+        with get_dict_cursor(c) as cur:
+            job = _claim(cur, job_id)
+        if job is None:
+            return
+
+        n_errors = job["n_errors"]
+        state = {"cancelled": False}
+
+        def on_batch(cur, rows: int, created: int, skipped: int, errors: List[Dict[str, Any]]) -> bool:
+            nonlocal n_errors
+            errors = errors[:max(0, JOB_MAX_ERRORS - n_errors)]
+            n_errors += len(errors)
+            cur.execute(
+                """UPDATE import_jobs
+                   SET rows_processed = rows_processed + %s, created = created + %s,
+                       skipped = skipped + %s, errors = errors || %s, updated_at = NOW()
+                   WHERE id=%s
+                   RETURNING cancel_requested""",
+                (rows, created, skipped, Jsonb(errors), job_id),
+            )
+            state["cancelled"] = cur.fetchone()["cancel_requested"]
+            return not state["cancelled"] and not _stopping.is_set()
+
+        try:
+            with open(job["spool_path"], "rb") as f:
+                items = parse_upload(job["filename"], job["content_type"], f)
+                import_books_items(c, items, job["owner_id"], skip=job["rows_processed"], on_batch=on_batch)
+        except (ValueError, OSError) as e:
+            with get_dict_cursor(c) as cur:
+                _finish(cur, job_id, "failed", str(e))
+            _remove_spool(job["spool_path"])
+            return
+
+        with get_dict_cursor(c) as cur:
+            if state["cancelled"]:
+                _finish(cur, job_id, "cancelled")
+            elif _stopping.is_set():
+                # Повернути в чергу: наступний запуск продовжить з rows_processed.
+                _finish(cur, job_id, "queued")
+                return
+            else:
+                _finish(cur, job_id, "done")
+        _remove_spool(job["spool_path"])
+
+def _remove_spool(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def resume_jobs() -> int:
+    """Ставить у чергу задачі, перервані зупинкою або падінням процесу.
+
+    Задача в роботі вважається покинутою, якщо її прогрес не оновлювався IMPORT_STALE_SECONDS;
+    подвійного виконання не буде, бо run_job атомарно «захоплює» задачу.
+    """
+    with get_pool().connection() as c, get_dict_cursor(c) as cur:
+        cur.execute(
+            """SELECT id FROM import_jobs
+               WHERE NOT cancel_requested
+                 AND (status = 'queued' OR (status = 'running' AND updated_at < NOW() - make_interval(secs => %s)))
+               ORDER BY created_at""",
+            (IMPORT_STALE_SECONDS,),
+        )
+        ids = [str(r["id"]) for r in cur.fetchall()]
+    for job_id in ids:
+        try:
+            submit(job_id)
+        except JobQueueFull:
+            break
+    return len(ids)
+
+def enqueue_upload(c, owner_id: int, filename: str, content_type: str | None, fileobj: BinaryIO) -> str:
+    path = spool_upload(fileobj)
+    with get_dict_cursor(c) as cur:
+        job_id = create_job(cur, owner_id, filename, content_type, path)
+        try:
+            submit(job_id)
+        except JobQueueFull:
+            cur.execute("DELETE FROM import_jobs WHERE id=%s", (job_id,))
+            _remove_spool(path)
+            raise
+    return job_id
+
+def shutdown_jobs():
+    """Поточні задачі зупиняються після своєї пачки і повертаються в чергу; решта лишається 'queued' у БД."""
+    global _executor, _pending
+    _stopping.set()
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+    _pending = 0
+
+def jobs_stats() -> dict:
+    return {"workers": IMPORT_WORKERS, "queue_max": IMPORT_QUEUE_MAX, "pending": _pending}
@@ -0,0 +1,162 @@
+import os
+import re
+import time
+from typing import Callable, Dict
+
+import psycopg
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+from app.query_log import SLOW_QUERY_ENABLED, SLOW_QUERY_SECONDS, slow_sync, slow_async
+
+# Вимкнено — без middleware і обгортки курсора, а observe_* одразу повертаються.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Обгортка курсора потрібна і метрикам, і журналу повільних запитів.
+TIMED_CURSORS = METRICS_ENABLED or SLOW_QUERY_ENABLED
+
+DB_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+
+HTTP_REQUESTS = Counter("book_manager_http_requests_total", "HTTP-запити",
+                        ["method", "route", "status"])
+HTTP_LATENCY = Histogram("book_manager_http_request_duration_seconds", "Тривалість HTTP-запиту",
+                         ["method", "route"])
+HTTP_IN_FLIGHT = Gauge("book_manager_http_requests_in_flight", "HTTP-запити в обробці", ["method"],
+                       multiprocess_mode="livesum")
+DB_ACQUIRE = Histogram("book_manager_db_acquire_seconds", "Очікування з'єднання з пулу", ["pool"],
+                       buckets=DB_BUCKETS)
+DB_QUERY = Histogram("book_manager_db_query_seconds", "Виконання запиту до БД", ["pool"],
+                     buckets=DB_BUCKETS)
+HASHING = Histogram("book_manager_hashing_seconds", "Час bcrypt", ["op"],
+                    buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5))
+IMPORT_ROWS = Counter("book_manager_import_rows_total", "Оброблені рядки імпорту", ["result"])
+IMPORT_SECONDS = Counter("book_manager_import_seconds_total", "Час обробки пачок імпорту")
+IMPORT_RATE = Gauge("book_manager_import_rows_per_second", "Швидкість останньої пачки імпорту",
+                    multiprocess_mode="mostrecent")
+
+
+def observe_acquire(pool: str, started: float):
+    if METRICS_ENABLED:
+        DB_ACQUIRE.labels(pool).observe(time.perf_counter() - started)
+
+def observe_hashing(op: str, seconds: float):
+    if METRICS_ENABLED:
+        HASHING.labels(op).observe(seconds)
+
+def observe_import_batch(created: int, skipped: int, seconds: float):
+    if METRICS_ENABLED:
+        IMPORT_ROWS.labels("created").inc(created)
+        IMPORT_ROWS.labels("skipped").inc(skipped)
+        IMPORT_SECONDS.inc(seconds)
+        if seconds > 0:
+            IMPORT_RATE.set((created + skipped) / seconds)
+
+
+def _observe_query(pool: str, seconds: float):
+    if METRICS_ENABLED:
+        DB_QUERY.labels(pool).observe(seconds)
+
+
+class TimedCursor(psycopg.Cursor):
+    def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = super().execute(query, params, **kwargs)
+            ok = True
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            _observe_query("sync", seconds)
+            if seconds >= SLOW_QUERY_SECONDS:
+                # Запит, що впав (напр. за statement_timeout), теж потрапляє в лог, але без EXPLAIN: транзакція вже зламана.
+                slow_sync(self, query, params, seconds, failed=not ok)
+
+    def executemany(self, query, params_seq, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, params_seq, **kwargs)
+        finally:
+            _observe_query("sync", time.perf_counter() - started)
+
+
+class TimedAsyncCursor(psycopg.AsyncCursor):
+    async def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await super().execute(query, params, **kwargs)
+            ok = True
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            _observe_query("async", seconds)
+            if seconds >= SLOW_QUERY_SECONDS:
+                await slow_async(self, query, params, seconds, failed=not ok)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            _observe_query("async", time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """Лічильник, гістограма тривалості (за шаблоном маршруту, не за шляхом) і запити в обробці."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            in_flight.dec()
+            # Роутер FastAPI кладе знайдений маршрут у той самий scope.
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            HTTP_LATENCY.labels(method, path).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, path, str(status)).inc()
+
+
+_stats_sources: Dict[str, Callable[[], dict]] = {}
+
+def register_stats(name: str, fn: Callable[[], dict]):
+    """Числові поля `*_stats()` підсистеми експортуються як gauge під час збору метрик."""
+    _stats_sources[name] = fn
+
+class _StatsCollector:
+    def collect(self):
+        for name, fn in _stats_sources.items():
+            for key, value in fn().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = re.sub(r"[^a-zA-Z0-9_]", "_", f"book_manager_{name}_{key}")
+                yield GaugeMetricFamily(metric, f"{name}: {key}", value=value)
+
+REGISTRY.register(_StatsCollector())
+
+def render_metrics() -> tuple[bytes, str]:
+    """З PROMETHEUS_MULTIPROC_DIR (serve.py з кількома воркерами) лічильники й гістограми — сума по воркерах,
+    а поля `*_stats()` — того воркера, що відповів."""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_StatsCollector())
+    return generate_latest(registry), CONTENT_TYPE_LATEST
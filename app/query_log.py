@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import queue
+import random
+import hashlib
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+import psycopg
+from psycopg import sql
+
+# Не задано — профілювання вимкнене. 0 — логувати всі запити.
+SLOW_QUERY_MS = os.getenv("SLOW_QUERY_MS")
+SLOW_QUERY_ENABLED = bool(SLOW_QUERY_MS)
+SLOW_QUERY_SECONDS = float(SLOW_QUERY_MS) / 1000 if SLOW_QUERY_ENABLED else float("inf")
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "")
+SLOW_QUERY_KEEP = int(os.getenv("SLOW_QUERY_KEEP", "200"))
+
+EXPLAIN = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"%s(?:\s*,\s*%s)+")
+_SPACES = re.compile(r"\s+")
+# EXPLAIN ANALYZE виконує запит, тому плани знімаються лише для читання (і все одно з відкатом).
+_READ_ONLY = re.compile(r"^\s*(SELECT|WITH)\b", re.I)
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", re.I)
+
+_lock = threading.Lock()
+_shapes: dict[str, dict] = {}
+_recent: deque = deque(maxlen=SLOW_QUERY_KEEP)
+# Рядки для SLOW_QUERY_LOG пише окремий потік: record викликається і з event loop, а повільний диск
+# не має гальмувати всі запити. Переповнена черга — рядок відкидається (лічильник log_dropped).
+_log_queue: queue.Queue = queue.Queue(maxsize=10_000)
+_log_writer: threading.Thread | None = None
+_log_stats = {"log_dropped": 0, "log_errors": 0}
+
+
+def query_text(query, cur) -> str:
+    if isinstance(query, bytes):
+        return query.decode()
+    if isinstance(query, sql.Composable):
+        return query.as_string(cur)
+    return query
+
+def normalize(text: str) -> str:
+    """Форма запиту: без літералів і зайвих пробілів, щоб різні значення давали один відбиток."""
+    text = _STRING.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _PLACEHOLDER_LIST.sub("%s, ...", text)
+    return _SPACES.sub(" ", text).strip()
+
+def _type_name(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (list, tuple)):
+        return f"list[{_type_name(value[0])}]" if value else "list"
+    return type(value).__name__
+
+def param_types(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: _type_name(v) for k, v in params.items()}
+    return [_type_name(v) for v in params]
+
+def should_explain(text: str) -> bool:
+    return (SLOW_QUERY_EXPLAIN_SAMPLE > 0 and random.random() < SLOW_QUERY_EXPLAIN_SAMPLE
+            and bool(_READ_ONLY.match(text)) and not _WRITES.search(text))
+
+def _explain_query(query):
+    if isinstance(query, sql.Composable):
+        return sql.SQL(EXPLAIN) + query
+    return EXPLAIN + query_text(query, None)
+
+def explain_sync(conn, query, params):
+    with conn.transaction(force_rollback=True), conn.cursor() as cur:
+        cur.execute(_explain_query(query), params)
+        return cur.fetchone()[0]
+
+async def explain_async(conn, query, params):
+    async with conn.transaction(force_rollback=True), conn.cursor() as cur:
+        await cur.execute(_explain_query(query), params)
+        return (await cur.fetchone())[0]
+
+def record(text: str, params, seconds: float, plan=None, failed: bool = False):
+    shape = normalize(text)
+    fingerprint = hashlib.blake2b(shape.encode(), digest_size=8).hexdigest()
+    ms = round(seconds * 1000, 3)
+    entry = {"ts": datetime.now(timezone.utc).isoformat(), "fingerprint": fingerprint, "ms": ms,
+             "sql": shape, "param_types": param_types(params)}
+    if failed:
+        entry["failed"] = True
+    if plan is not None:
+        entry["plan"] = plan
+    with _lock:
+        s = _shapes.get(fingerprint)
+        if s is None:
+            s = _shapes[fingerprint] = {"fingerprint": fingerprint, "sql": shape, "count": 0,
+                                        "total_ms": 0.0, "max_ms": 0.0}
+        s["count"] += 1
+        s["total_ms"] = round(s["total_ms"] + ms, 3)
+        s["max_ms"] = max(s["max_ms"], ms)
+        s["param_types"] = entry["param_types"]
+        if plan is not None:
+            s["plan"] = plan
+        _recent.append(entry)
+    if SLOW_QUERY_LOG:
+        _enqueue_line(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+def _enqueue_line(line: str):
+    global _log_writer
+    if _log_writer is None:
+        with _lock:
+            if _log_writer is None:
+                _log_writer = threading.Thread(target=_write_loop, name="slow-query-log", daemon=True)
+                _log_writer.start()
+    try:
+        _log_queue.put_nowait(line)
+    except queue.Full:
+        _log_stats["log_dropped"] += 1
+
+def _write_loop():
+    while True:
+        lines = [_log_queue.get()]
+        # Усе, що встигло накопичитися, — одним відкриттям файлу.
+        while True:
+            try:
+                lines.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with open(SLOW_QUERY_LOG, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        except OSError:
+            _log_stats["log_errors"] += 1
+        finally:
+            for _ in lines:
+                _log_queue.task_done()
+
+def flush_log():
+    """Чекає, доки фоновий потік допише всі рядки в SLOW_QUERY_LOG."""
+    if _log_writer is not None:
+        _log_queue.join()
+
+def slow_sync(cur, query, params, seconds: float, explain: bool = True, failed: bool = False):
+    """Викликається курсором після запиту, довшого за поріг; failed — запит упав, і плану для нього не буде."""
+    text = query_text(query, cur)
+    plan = None
+    if explain and not failed and should_explain(text):
+        try:
+            plan = explain_sync(cur.connection, query, params)
+        except psycopg.Error as e:
+            plan = {"error": str(e)}
+    record(text, params, seconds, plan, failed)
+
+async def slow_async(cur, query, params, seconds: float, failed: bool = False):
+    text = query_text(query, cur)
+    plan = None
+    if not failed and should_explain(text):
+        try:
+            plan = await explain_async(cur.connection, query, params)
+        except psycopg.Error as e:
+            plan = {"error": str(e)}
+    record(text, params, seconds, plan, failed)
+
+def clear_slow_queries():
+    with _lock:
+        _shapes.clear()
+        _recent.clear()
+
+def slow_query_stats() -> dict:
+    """Форми запитів за сумарним часом — кандидати на індекси; recent — останні випадки."""
+    with _lock:
+        shapes = sorted(_shapes.values(), key=lambda s: s["total_ms"], reverse=True)
+        recent = [{k: v for k, v in e.items() if k != "plan"} for e in _recent]
+    return {"enabled": SLOW_QUERY_ENABLED, "threshold_ms": float(SLOW_QUERY_MS) if SLOW_QUERY_ENABLED else None,
+            "explain_sample": SLOW_QUERY_EXPLAIN_SAMPLE, "log_file": SLOW_QUERY_LOG or None, **_log_stats,
+            "shapes": shapes, "recent": recent}
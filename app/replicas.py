@@ -0,0 +1,307 @@
+import os
+import time
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool, ConnectionPool, PoolTimeout
+from fastapi import Request
+
+from app.cache import TTLCache
+from app.response_cache import key_since
+from app.auth import bearer_user_id
+from app.metrics import observe_acquire
+from app.db import conninfo, get_pool, POOL_MAX_IDLE, POOL_MAX_LIFETIME
+from app.adb import get_apool
+
+# Через кому; кожен запис доповнює параметри основної БД: "port=5433" — той самий хост, користувач і база.
+PG_REPLICAS = [d.strip() for d in os.getenv("PG_REPLICAS", "").split(",") if d.strip()]
+REPLICA_STRATEGY = os.getenv("REPLICA_STRATEGY", "round_robin")  # round_robin | latency
+REPLICA_POOL_MAX_SIZE = int(os.getenv("PG_REPLICA_POOL_MAX_SIZE", os.getenv("PG_APOOL_MAX_SIZE", "10")))
+REPLICA_ACQUIRE_TIMEOUT = float(os.getenv("REPLICA_ACQUIRE_TIMEOUT", "0.5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "2"))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+# Скільки секунд після запису читання цього користувача йдуть в основну БД.
+READ_YOUR_WRITES = float(os.getenv("READ_YOUR_WRITES", "5"))
+# memory — у межах воркера; redis — спільно для всіх воркерів serve.py.
+REPLICA_STICKY_BACKEND = os.getenv("REPLICA_STICKY_BACKEND", "memory")
+REPLICA_STICKY_URL = os.getenv("REPLICA_STICKY_URL", os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0"))
+
+# Для основної БД (не репліки) відставання — 0; на репліці без нових записів WAL — теж 0,
+# інакше час від останньої відтвореної транзакції.
+# lsn — до якої позиції WAL репліка вже відтворила зміни (для основної БД — поточна позиція).
+LAG_SQL = """
+    SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()), 0)
+           END::float AS lag,
+           (CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END
+            - '0/0'::pg_lsn)::bigint AS lsn
+"""
+PRIMARY_LSN_SQL = "SELECT (pg_current_wal_lsn() - '0/0'::pg_lsn)::bigint"
+# Скільки останніх перевірок пам'ятати для cacheable: REPLICA_CHECK_INTERVAL × 64 с історії.
+LSN_HISTORY = 64
+
+
+class Replica:
+    def __init__(self, name: str, dsn: str, number: int):
+        self.name = name
+        self.dsn = dsn
+        self.apool = AsyncConnectionPool(
+            dsn, min_size=1, max_size=REPLICA_POOL_MAX_SIZE, timeout=REPLICA_ACQUIRE_TIMEOUT,
+            max_idle=POOL_MAX_IDLE, max_lifetime=POOL_MAX_LIFETIME, check=AsyncConnectionPool.check_connection,
+            kwargs={"autocommit": True}, name=f"replica-{number}", open=False,
+        )
+        self.pool: ConnectionPool | None = None
+        self.number = number
+        self.healthy = False
+        self.latency: float | None = None
+        self.lag: float | None = None
+        self.error: str | None = None
+        self.reads = 0
+        self.failures = 0
+        # (monotonic, lsn) з кожної перевірки — див. cacheable.
+        self.replayed: deque = deque(maxlen=LSN_HISTORY)
+
+    def sync_pool(self) -> ConnectionPool:
+        # Лише для експорту (серверний курсор у потоці), тож відкривається за першої потреби.
+        if self.pool is None:
+            self.pool = ConnectionPool(self.dsn, min_size=0, max_size=REPLICA_POOL_MAX_SIZE,
+                                       timeout=REPLICA_ACQUIRE_TIMEOUT, max_idle=POOL_MAX_IDLE,
+                                       max_lifetime=POOL_MAX_LIFETIME, check=ConnectionPool.check_connection,
+                                       kwargs={"autocommit": True}, name=f"replica-{self.number}-sync", open=True)
+        return self.pool
+
+    def down(self, e: Exception):
+        self.healthy = False
+        self.failures += 1
+        self.error = f"{type(e).__name__}: {e}"
+
+    async def check(self):
+        started = time.perf_counter()
+        try:
+            async with self.apool.connection(timeout=REPLICA_ACQUIRE_TIMEOUT) as c:
+                cur = await asyncio.wait_for(c.execute(LAG_SQL), REPLICA_ACQUIRE_TIMEOUT)
+                self.lag, lsn = await cur.fetchone()
+            self.replayed.append((time.monotonic(), lsn))
+        except (PoolTimeout, psycopg.Error, asyncio.TimeoutError) as e:
+            self.down(e)
+            return
+        seconds = time.perf_counter() - started
+        self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+        self.healthy = self.lag <= REPLICA_MAX_LAG
+        self.error = None if self.healthy else f"відставання {self.lag:.1f} с"
+
+    def stats(self) -> dict:
+        return {"name": self.name, "healthy": self.healthy, "lag_seconds": self.lag,
+                "latency_ms": round(self.latency * 1000, 2) if self.latency is not None else None,
+                "reads": self.reads, "failures": self.failures, "error": self.error}
+
+
+class MemorySticky:
+    def __init__(self, ttl: float):
+        self.writers = TTLCache(100_000, ttl)
+
+    def mark(self, user_id: int):
+        self.writers.set(user_id, True)
+
+    def recent(self, user_id: int) -> bool:
+        return self.writers.get(user_id) is not None
+
+
+class RedisSticky:
+    def __init__(self, url: str, ttl: float):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("REPLICA_STICKY_BACKEND=redis потребує пакета redis")
+        self.r = redis.Redis.from_url(url)
+        self.ttl_ms = int(ttl * 1000)
+
+    def mark(self, user_id: int):
+        self.r.set(f"rw:{user_id}", 1, px=self.ttl_ms)
+
+    def recent(self, user_id: int) -> bool:
+        return bool(self.r.exists(f"rw:{user_id}"))
+
+
+_replicas: list[Replica] = []
+_rr = itertools.count()
+_task: asyncio.Task | None = None
+_sticky = None
+_route_stats = {"replica_reads": 0, "primary_reads": 0, "sticky_reads": 0, "fallbacks": 0,
+                "cached_replica_reads": 0}
+# (monotonic до запиту, позиція WAL основної БД): усе, що закомічено до цього моменту, має lsn не більший.
+_primary_lsn: deque = deque(maxlen=LSN_HISTORY)
+
+
+def replica_name(dsn: str) -> str:
+    params = psycopg.conninfo.conninfo_to_dict(dsn)
+    return f"{params.get('host', '')}:{params.get('port', '')}/{params.get('dbname', '')}"
+
+async def open_replicas(dsns: list[str] | None = None):
+    """Пули реплік і перша перевірка здоров'я; без PG_REPLICAS усе читається з основної БД."""
+    global _task, _sticky
+    dsns = PG_REPLICAS if dsns is None else dsns
+    if not dsns:
+        return
+    base = conninfo()
+    for number, entry in enumerate(dsns, 1):
+        dsn = psycopg.conninfo.make_conninfo(base, **psycopg.conninfo.conninfo_to_dict(entry))
+        replica = Replica(replica_name(dsn), dsn, number)
+        # Недоступна на старті репліка не заважає запуску: пул доновлюється у фоні.
+        await replica.apool.open(wait=False)
+        _replicas.append(replica)
+    _sticky = RedisSticky(REPLICA_STICKY_URL, READ_YOUR_WRITES) if REPLICA_STICKY_BACKEND == "redis" \
+        else MemorySticky(READ_YOUR_WRITES)
+    await check_replicas()
+    if REPLICA_CHECK_INTERVAL > 0:
+        _task = asyncio.create_task(_check_loop())
+
+async def close_replicas():
+    global _task, _sticky
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    for replica in _replicas:
+        await replica.apool.close()
+        if replica.pool is not None:
+            replica.pool.close()
+    _replicas.clear()
+    _sticky = None
+
+async def check_replicas():
+    started = time.monotonic()
+    try:
+        async with (await get_apool()).connection(timeout=REPLICA_ACQUIRE_TIMEOUT) as c:
+            cur = await c.execute(PRIMARY_LSN_SQL)
+            _primary_lsn.append((started, (await cur.fetchone())[0]))
+    except (PoolTimeout, psycopg.Error):
+        pass
+    # Репліки — після основної БД: їхні позиції з цієї перевірки порівнюються з її позицією.
+    await asyncio.gather(*(r.check() for r in _replicas))
+
+async def _check_loop():
+    while True:
+        await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+        await check_replicas()
+
+def pick_replica() -> Replica | None:
+    live = [r for r in _replicas if r.healthy]
+    if not live:
+        return None
+    if REPLICA_STRATEGY == "latency":
+        return min(live, key=lambda r: r.latency)
+    return live[next(_rr) % len(live)]
+
+def mark_write(user_id: int):
+    """Наступні READ_YOUR_WRITES с читання цього користувача бачать його запис (йдуть в основну БД)."""
+    if _sticky is not None and READ_YOUR_WRITES > 0:
+        _sticky.mark(user_id)
+
+def read_replica(request: Request) -> Replica | None:
+    request.state.replica = None
+    if not _replicas:
+        return None
+    user_id = bearer_user_id(request.headers.get("authorization", ""))
+    if user_id is not None and _sticky.recent(user_id):
+        _route_stats["sticky_reads"] += 1
+        return None
+    request.state.replica = pick_replica()
+    return request.state.replica
+
+def from_primary(request: Request) -> bool:
+    return getattr(request.state, "replica", None) is None
+
+def cacheable(request: Request, key: str) -> bool:
+    """Чи можна класти відповідь обробника в спільний кеш під ключем key.
+
+    З основної БД — завжди. З репліки — лише коли відомо, що до початку читання вона вже
+    відтворила запис, який змінив покоління в key: інакше застарілий рядок жив би в кеші
+    RESPONSE_CACHE_TTL під новим поколінням (і для автора запису, коли READ_YOUR_WRITES мине).
+    Доказ — пара перевірок: позиція основної БД, взята після появи покоління, і позиція
+    репліки, взята до читання й не менша за неї.
+    """
+    replica = getattr(request.state, "replica", None)
+    if replica is None:
+        return True
+    since, read_at = key_since(key), getattr(request.state, "read_at", None)
+    if since is None or read_at is None:
+        return False
+    replayed = max((lsn for at, lsn in replica.replayed if at <= read_at), default=None)
+    needed = next((lsn for at, lsn in _primary_lsn if at >= since), None)
+    if replayed is None or needed is None or replayed < needed:
+        return False
+    _route_stats["cached_replica_reads"] += 1
+    return True
+
+@asynccontextmanager
+async def read_aconn(request: Request):
+    """З'єднання для читання: з репліки, якщо є здорова, інакше з основної БД.
+
+    Обробники з кешем відповідей беруть його лише після промаху кешу, а не як залежність:
+    інакше кожне влучання і 304 тримали б слот пулу.
+    """
+    replica = read_replica(request)
+    request.state.read_at = time.monotonic()
+    if replica is not None:
+        started = time.perf_counter()
+        try:
+            c = await replica.apool.getconn()
+        except (PoolTimeout, psycopg.OperationalError) as e:
+            replica.down(e)
+            request.state.replica = None
+            _route_stats["fallbacks"] += 1
+        else:
+            observe_acquire("replica", started)
+            replica.reads += 1
+            _route_stats["replica_reads"] += 1
+            try:
+                yield c
+            finally:
+                await replica.apool.putconn(c)
+            return
+    _route_stats["primary_reads"] += 1
+    started = time.perf_counter()
+    async with (await get_apool()).connection() as c:
+        observe_acquire("async", started)
+        yield c
+
+async def get_read_aconn(request: Request):
+    """Як get_aconn, але для обробників лише на читання (див. read_aconn)."""
+    async with read_aconn(request) as c:
+        yield c
+
+@contextmanager
+def read_conn(request: Request):
+    """Синхронне з'єднання для читання (експорт): з репліки, якщо є здорова, інакше з основної БД."""
+    replica = read_replica(request)
+    request.state.read_at = time.monotonic()
+    if replica is not None:
+        try:
+            c = replica.sync_pool().getconn()
+        except (PoolTimeout, psycopg.OperationalError) as e:
+            replica.down(e)
+            request.state.replica = None
+            _route_stats["fallbacks"] += 1
+        else:
+            replica.reads += 1
+            _route_stats["replica_reads"] += 1
+            try:
+                yield c
+            finally:
+                replica.pool.putconn(c)
+            return
+    _route_stats["primary_reads"] += 1
+    with get_pool().connection() as c:
+        yield c
+
+def replicas_stats() -> dict:
+    return {"replicas": len(_replicas), "healthy": sum(r.healthy for r in _replicas),
+            "strategy": REPLICA_STRATEGY, **_route_stats, "details": [r.stats() for r in _replicas]}
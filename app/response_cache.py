@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from dataclasses import dataclass, field
+
+from fastapi import Request, Response
+
+from app.cache import TTLCache
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+
+# Після стількох лічильників окремих книг усі вони скидаються разом зі зміною епохи.
+MAX_GENERATIONS = 100_000
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    media_type: str = "application/json"
+    headers: dict = field(default_factory=dict)
+    etag: str = ""
+
+    def dumps(self) -> bytes:
+        meta = json.dumps({"media_type": self.media_type, "headers": self.headers, "etag": self.etag})
+        return meta.encode("utf-8") + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "CachedResponse":
+        meta, body = raw.split(b"\n", 1)
+        return cls(body=body, **json.loads(meta))
+
+
+class NullBackend:
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, value: CachedResponse):
+        pass
+
+    def generation(self, name: str) -> str:
+        return "0"
+
+    def bump(self, name: str):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "off"}
+
+
+class MemoryBackend:
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = TTLCache(maxsize, ttl)
+        self.epoch = 0
+        self.gens: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        return self.entries.get(key)
+
+    def set(self, key: str, value: CachedResponse):
+        self.entries.set(key, value)
+
+    def generation(self, name: str) -> str:
+        return f"{self.epoch}.{self.gens.get(name, 0)}"
+
+    def bump(self, name: str):
+        with self._lock:
+            if len(self.gens) >= MAX_GENERATIONS:
+                self.gens.clear()
+                self.epoch += 1
+            self.gens[name] = self.gens.get(name, 0) + 1
+
+    def clear(self):
+        self.entries.clear()
+        with self._lock:
+            self.gens.clear()
+            self.epoch += 1
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self.entries.stats()}
+
+
+class RedisBackend:
+    """Спільний кеш для кількох воркерів; LRU-витіснення задається maxmemory-policy на сервері."""
+
+    def __init__(self, url: str, ttl: float):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis потребує пакета redis")
+        self.r = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        raw = self.r.get(f"resp:{key}")
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedResponse.loads(raw)
+
+    def set(self, key: str, value: CachedResponse):
+        self.r.set(f"resp:{key}", value.dumps(), px=int(self.ttl * 1000))
+
+    def generation(self, name: str) -> str:
+        return (self.r.get(f"gen:{name}") or b"0").decode()
+
+    def bump(self, name: str):
+        self.r.incr(f"gen:{name}")
+
+    def clear(self):
+        for prefix in ("resp:*", "gen:*"):
+            for key in self.r.scan_iter(prefix):
+                self.r.delete(key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0}
+
+
+def make_backend():
+    if RESPONSE_CACHE_BACKEND == "off":
+        return NullBackend()
+    if RESPONSE_CACHE_BACKEND == "redis":
+        return RedisBackend(RESPONSE_CACHE_URL, RESPONSE_CACHE_TTL)
+    return MemoryBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+response_cache = make_backend()
+
+
+# Коли процес уперше побачив покоління ("books:0.3" -> monotonic) і яке покоління в ключі.
+# Запис, що змінив покоління, стався не пізніше, тож відповідь з репліки можна кешувати, якщо
+# репліка наздогнала основну БД уже після цього моменту (app.replicas.cacheable).
+_gen_seen = TTLCache(RESPONSE_CACHE_SIZE * 2, RESPONSE_CACHE_TTL)
+_key_since = TTLCache(RESPONSE_CACHE_SIZE * 2, RESPONSE_CACHE_TTL)
+
+def _generation(name: str) -> tuple[str, float]:
+    gen = response_cache.generation(name)
+    seen = _gen_seen.get(f"{name}:{gen}")
+    if seen is None:
+        seen = time.monotonic()
+        _gen_seen.set(f"{name}:{gen}", seen)
+    return gen, seen
+
+def _key(key: str, seen: float) -> str:
+    _key_since.set(key, seen)
+    return key
+
+def key_since(key: str) -> float | None:
+    """Найраніший відомий момент, коли покоління цього ключа вже діяло; None — невідомо."""
+    return _key_since.get(key)
+
+def list_key(ns: str, params: dict) -> str:
+    norm = json.dumps({k: v for k, v in params.items() if v is not None}, sort_keys=True, default=str, ensure_ascii=False)
+    gen, seen = _generation("books")
+    return _key(f"{ns}:{gen}:{norm}", seen)
+
+def book_key(book_id: int) -> str:
+    gen, seen = _generation(f"book:{book_id}")
+    return _key(f"book:{book_id}:{gen}", seen)
+
+def lookup(key: str) -> CachedResponse | None:
+    return response_cache.get(key)
+
+def store(key: str, body: bytes, media_type: str = "application/json", headers: dict | None = None,
+          cache: bool = True) -> CachedResponse:
+    """Відповідь з ETag; cache=False — лише для respond, без запису в кеш."""
+    entry = CachedResponse(body=body, media_type=media_type, headers=headers or {},
+                           etag='"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"')
+    if cache:
+        response_cache.set(key, entry)
+    return entry
+
+def respond(request: Request, entry: CachedResponse) -> Response:
+    headers = {**entry.headers, "ETag": entry.etag}
+    inm = request.headers.get("if-none-match")
+    if inm and (inm.strip() == "*" or entry.etag in [t.strip().removeprefix("W/") for t in inm.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+def invalidate_books(*book_ids: int):
+    """Запис змінює і списки (загальне покоління), і конкретні книги (покоління книги)."""
+    response_cache.bump("books")
+    _generation("books")
+    for book_id in book_ids:
+        response_cache.bump(f"book:{book_id}")
+        _generation(f"book:{book_id}")
+
+def response_cache_stats() -> dict:
+    return response_cache.stats()
@@ -1,16 +1,34 @@
 import os
 import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import jwt
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 
+from app.metrics import observe_hashing
+
 load_dotenv()
 
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALG = os.getenv("JWT_ALG")
 ACCESS_TTL = int(os.getenv("ACCESS_TTL"))
 
-pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "4"))
+HASH_QUEUE_MAX = int(os.getenv("HASH_QUEUE_MAX", "64"))
+
+pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt відпускає GIL, тож окремого пулу потоків достатньо, щоб не займати threadpool Starlette.
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_stats = {"pending": 0, "completed": 0, "failed": 0, "rejected": 0, "seconds": 0.0}
+# completed/failed/seconds оновлюють потоки bcrypt, pending/rejected — event loop.
+_hash_lock = threading.Lock()
+
+class HashQueueFull(Exception):
+    pass
 
 def hash_pwd(password: str) -> str:
     return pwd_ctx.hash(password)
@@ -18,6 +36,58 @@ def hash_pwd(password: str) -> str:
 def verify_pwd(password: str, password_hash: str) -> bool:
     return pwd_ctx.verify(password, password_hash)
 
+def verify_and_rehash(password: str, password_hash: str) -> tuple[bool, str | None]:
+    if not pwd_ctx.verify(password, password_hash):
+        return False, None
+    if pwd_ctx.needs_update(password_hash):
+        return True, pwd_ctx.hash(password)
+    return True, None
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    try:
+        result = fn(*args)
+    except Exception:
+        with _hash_lock:
+            _hash_stats["failed"] += 1
+        raise
+    seconds = time.perf_counter() - started
+    with _hash_lock:
+        _hash_stats["completed"] += 1
+        _hash_stats["seconds"] += seconds
+    observe_hashing(fn.__name__, seconds)
+    return result
+
+async def _run_hashing(fn, *args):
+    if _hash_stats["pending"] >= HASH_QUEUE_MAX:
+        _hash_stats["rejected"] += 1
+        raise HashQueueFull()
+    _hash_stats["pending"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, _timed, fn, *args)
+    finally:
+        _hash_stats["pending"] -= 1
+
+async def hash_pwd_async(password: str) -> str:
+    return await _run_hashing(hash_pwd, password)
+
+async def verify_and_rehash_async(password: str, password_hash: str) -> tuple[bool, str | None]:
+    return await _run_hashing(verify_and_rehash, password, password_hash)
+
+def hashing_stats() -> dict:
+    pending = _hash_stats["pending"]
+    return {
+        "workers": HASH_WORKERS,
+        "queue_max": HASH_QUEUE_MAX,
+        "in_flight": min(pending, HASH_WORKERS),
+        "queued": max(0, pending - HASH_WORKERS),
+        "completed": _hash_stats["completed"],
+        "failed": _hash_stats["failed"],
+        "rejected": _hash_stats["rejected"],
+        "seconds": round(_hash_stats["seconds"], 3),
+        "rounds": BCRYPT_ROUNDS,
+    }
+
 def make_token(sub: str, extra: dict | None = None, ttl: int = ACCESS_TTL) -> str:
     now = time.time()
     payload = {
@@ -0,0 +1,145 @@
+import os
+import asyncio
+import logging
+
+from app.adb import get_apool, get_async_dict_cursor
+from app.counts import fold_counts
+
+# Як часто накопичені зміни переносяться у зведені таблиці й лічильники X-Total-Count; 0 — лише через
+# ?refresh=true (лічильники лишаються точними, але їхній журнал тоді росте до наступного переносу).
+BOOK_STATS_REFRESH = float(os.getenv("BOOK_STATS_REFRESH", "5"))
+STATS_LOCK = 7_340_113
+
+# Усі CTE бачать один і той самий набір moved, тож кожна зміна потрапляє в кожну таблицю рівно раз.
+REFRESH_SQL = """
+    WITH moved AS (
+        DELETE FROM book_stats_delta RETURNING genre, published_year, author_id, owner_id, delta
+    ),
+    genre_year AS (
+        INSERT INTO book_stats_genre_year AS t (genre, published_year, n)
+        SELECT genre, published_year, SUM(delta) FROM moved
+        GROUP BY genre, published_year ORDER BY genre, published_year
+        ON CONFLICT (genre, published_year) DO UPDATE SET n = t.n + EXCLUDED.n
+    ),
+    author AS (
+        INSERT INTO book_stats_author AS t (author_id, genre, n)
+        SELECT author_id, genre, SUM(delta) FROM moved
+        GROUP BY author_id, genre ORDER BY author_id, genre
+        ON CONFLICT (author_id, genre) DO UPDATE SET n = t.n + EXCLUDED.n
+    ),
+    owner AS (
+        INSERT INTO book_stats_owner AS t (owner_id, genre, n)
+        SELECT owner_id, genre, SUM(delta) FROM moved
+        GROUP BY owner_id, genre ORDER BY owner_id, genre
+        ON CONFLICT (owner_id, genre) DO UPDATE SET n = t.n + EXCLUDED.n
+    ),
+    state AS (UPDATE book_stats_state SET refreshed_at = NOW())
+    SELECT COUNT(*) AS moved FROM moved
+"""
+
+STALENESS_SQL = """
+    SELECT s.refreshed_at, d.pending,
+           COALESCE(EXTRACT(EPOCH FROM NOW() - d.oldest), 0)::float AS stale_seconds
+    FROM book_stats_state s,
+         (SELECT COUNT(*) AS pending, MIN(created_at) AS oldest FROM book_stats_delta) d
+"""
+
+# group_by -> (таблиця, ключ групи, чи можна фільтрувати за роками)
+GROUPS = {
+    "genre": ("book_stats_genre_year s", "s.genre::text", True),
+    "year": ("book_stats_genre_year s", "s.published_year", True),
+    "decade": ("book_stats_genre_year s", "s.published_year / 10 * 10", True),
+    "author": ("book_stats_author s JOIN authors a ON a.id = s.author_id", "a.name", False),
+    "owner": ("book_stats_owner s", "s.owner_id", False),
+}
+
+log = logging.getLogger(__name__)
+_task: asyncio.Task | None = None
+_refresh_stats = {"runs": 0, "moved": 0, "counts_moved": 0, "skipped": 0, "failed": 0}
+
+
+async def refresh_stats(cur, wait: bool = False) -> int | None:
+    """Переносить накопичені зміни у зведені таблиці (і журнал лічильників); None — якщо це саме робить інший процес.
+
+    wait=True (явний ?refresh=true) чекає на чужий перенос, а не пропускає: інакше відповідь
+    показала б зміни, яких ще немає у зведенні.
+    """
+    async with cur.connection.transaction():
+        if wait:
+            await cur.execute("SELECT pg_advisory_xact_lock(%s)", (STATS_LOCK,))
+        else:
+            await cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS ok", (STATS_LOCK,))
+            if not (await cur.fetchone())["ok"]:
+                _refresh_stats["skipped"] += 1
+                return None
+        await cur.execute(REFRESH_SQL)
+        moved = (await cur.fetchone())["moved"]
+        counts_moved = await fold_counts(cur)
+    _refresh_stats["runs"] += 1
+    _refresh_stats["counts_moved"] += counts_moved
+    _refresh_stats["moved"] += moved
+    return moved
+
+async def staleness(cur) -> dict:
+    await cur.execute(STALENESS_SQL)
+    return await cur.fetchone()
+
+async def catalogue_stats(cur, group_by: str, genre: str | None = None, year_from: int | None = None,
+                          year_to: int | None = None, limit: int = 100) -> dict:
+    """Кількість книг за групами зі зведених таблиць — O(груп), а не O(книг)."""
+    table, key, by_year = GROUPS[group_by]
+    if not by_year and (year_from is not None or year_to is not None):
+        raise ValueError(f"Фільтр за роками недоступний для group_by={group_by}")
+    where, args = [], []
+    if genre:
+        where.append("s.genre = %s")
+        args.append(genre)
+    if year_from is not None:
+        where.append("s.published_year >= %s")
+        args.append(year_from)
+    if year_to is not None:
+        where.append("s.published_year <= %s")
+        args.append(year_to)
+    order = "key" if by_year else "books DESC, key"
+    await cur.execute(f"""
+        SELECT {key} AS key, SUM(s.n)::bigint AS books, SUM(SUM(s.n)) OVER ()::bigint AS total
+        FROM {table}
+        {"WHERE " + " AND ".join(where) if where else ""}
+        GROUP BY 1
+        HAVING SUM(s.n) > 0
+        ORDER BY {order}
+        LIMIT %s
+    """, args + [limit])
+    rows = await cur.fetchall()
+    return {"group_by": group_by, "total": rows[0]["total"] if rows else 0,
+            "groups": [{"key": r["key"], "books": r["books"]} for r in rows],
+            **await staleness(cur)}
+
+async def _refresh_loop():
+    while True:
+        await asyncio.sleep(BOOK_STATS_REFRESH)
+        try:
+            async with (await get_apool()).connection() as c, get_async_dict_cursor(c) as cur:
+                await refresh_stats(cur)
+        except Exception:
+            # Зміни лишаються в book_stats_delta і перенесуться наступного разу; цикл не має зупинятися.
+            log.exception("book stats refresh failed")
+            _refresh_stats["failed"] += 1
+
+def start_stats_refresher():
+    global _task
+    if BOOK_STATS_REFRESH > 0 and _task is None:
+        _task = asyncio.create_task(_refresh_loop())
+
+async def stop_stats_refresher():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+def stats_refresher_stats() -> dict:
+    return {"refresh_seconds": BOOK_STATS_REFRESH, "running": _task is not None, **_refresh_stats}
@@ -0,0 +1,99 @@
+"""Порівняння пропускної здатності sync (threadpool) та async обробників.
+
+    python -m bench.async_vs_sync --books 10000 --duration 10
+"""
+import os
+
+# Усі клієнти бенчмарку — один IP, тож ліміти частоти різали б саме навантаження.
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+import argparse
+import asyncio
+import json
+import random
+from typing import List
+
+from fastapi import FastAPI, Depends, HTTPException
+
+from app.books import BookOut, row_to_out
+from app.db import get_dict_cursor, get_pool, open_pool, close_pool
+from bench.load import run_load
+from bench.seed import seed_books
+
+BOOK_SQL = """SELECT b.id, b.title, a.name AS author, b.genre, b.published_year
+              FROM books b JOIN authors a ON a.id = b.author_id
+              WHERE b.id = %s"""
+LIST_SQL = """SELECT b.id, b.title, a.name AS author, b.genre, b.published_year
+              FROM books b JOIN authors a ON a.id = b.author_id
+              ORDER BY lower(b.title), b.id LIMIT 20"""
+
+sync_app = FastAPI()
+
+
+def sync_conn():
+    # Звичайна sync-залежність: FastAPI виконує її в threadpool, і потік сам чекає на пул.
+    # app.db.get_conn тут не підходить — він чекає на семафор в event loop, тобто вже наполовину async.
+    with get_pool().connection() as c:
+        yield c
+
+
+@sync_app.get("/books/id/{book_id}", response_model=BookOut)
+def sync_get_book(book_id: int, c=Depends(sync_conn)):
+    with get_dict_cursor(c) as cur:
+        cur.execute(BOOK_SQL, (book_id,))
+        r = cur.fetchone()
+        if not r:
+            raise HTTPException(status_code=404, detail="Не знайдено")
+        return row_to_out(r)
+
+
+@sync_app.get("/books", response_model=List[BookOut])
+def sync_list_books(c=Depends(sync_conn)):
+    with get_dict_cursor(c) as cur:
+        cur.execute(LIST_SQL)
+        return [row_to_out(r) for r in cur.fetchall()]
+
+
+async def bench(app, label: str, ids: list[int], levels: list[int], duration: float) -> list[dict]:
+    rnd = random.Random(1)
+
+    async def request(client, i):
+        if i % 4 == 0:
+            return await client.get("/books")
+        return await client.get(f"/books/id/{rnd.choice(ids)}")
+
+    out = []
+    for level in levels:
+        res = await run_load(app, level, duration, request)
+        res["mode"] = label
+        print(json.dumps(res))
+        out.append(res)
+    return out
+
+
+async def main(args):
+    from main import app
+
+    if args.books:
+        seed_books(args.books, reset=True)
+    open_pool()
+    with get_pool().connection() as c, get_dict_cursor(c) as cur:
+        cur.execute("SELECT id FROM books ORDER BY random() LIMIT 1000")
+        ids = [r["id"] for r in cur.fetchall()]
+
+    results = await bench(sync_app, "sync", ids, args.levels, args.duration)
+    async with app.router.lifespan_context(app):
+        results += await bench(app, "async", ids, args.levels, args.duration)
+    close_pool()
+
+    print(f"{'mode':<6} {'clients':>8} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for r in results:
+        print(f"{r['mode']:<6} {r['concurrency']:>8} {r['rps']:>10} {r['p50_ms']:>9} {r['p99_ms']:>9} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--books", type=int, default=10_000, help="0 — не перезаповнювати БД")
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--levels", type=int, nargs="+", default=[50, 200, 1000])
+    asyncio.run(main(ap.parse_args()))
@@ -0,0 +1,69 @@
+"""Імпорт: порядковий шлях (insert_rows) проти COPY + set-based (import_books_items).
+
+    python -m bench.import_bulk --sizes 10000 100000 1000000 --slow-max 100000
+"""
+import argparse
+import json
+import random
+import time
+
+from app.books import author_cache
+from app.db import conn, get_dict_cursor
+from app.imports import import_books_items, insert_rows, validate_items
+from bench.seed import GENRES, WORDS, author_names, ensure_user
+
+
+def make_items(n: int, n_authors: int = 3000, dup_ratio: float = 0.02, rnd_seed: int = 7) -> list[dict]:
+    rnd = random.Random(rnd_seed)
+    names = author_names(n_authors)
+    weights = [1 / (i + 1) for i in range(len(names))]
+    authors = rnd.choices(names, weights=weights, k=n)
+    items = [
+        {"title": f"{rnd.choice(WORDS)} {rnd.choice(WORDS)} {i}", "author": authors[i],
+         "genre": rnd.choice(GENRES), "published_year": rnd.randint(1800, 2024)}
+        for i in range(n)
+    ]
+    for _ in range(int(n * dup_ratio)):
+        items.append(dict(rnd.choice(items)))
+    return items
+
+
+def reset(cur):
+    cur.execute("TRUNCATE books, authors RESTART IDENTITY CASCADE")
+    author_cache.clear()
+
+
+def run(label: str, n: int, fn) -> dict:
+    with conn() as c, get_dict_cursor(c) as cur:
+        reset(cur)
+        uid = ensure_user(cur)
+        items = make_items(n)
+        t0 = time.perf_counter()
+        created, skipped = fn(c, items, uid)
+        elapsed = time.perf_counter() - t0
+    res = {"mode": label, "rows": len(items), "created": created, "skipped": skipped,
+           "seconds": round(elapsed, 2), "rows_per_sec": round(len(items) / elapsed)}
+    print(json.dumps(res))
+    return res
+
+
+def slow(c, items, uid):
+    valid, errors = validate_items(items)
+    errors += insert_rows(c, valid, uid)
+    return len(items) - len(errors), len(errors)
+
+
+def bulk(c, items, uid):
+    created, skipped, _ = import_books_items(c, items, uid)
+    return created, skipped
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--slow-max", type=int, default=100_000, help="не запускати порядковий шлях на більших обсягах")
+    args = ap.parse_args()
+    for n in args.sizes:
+        if n <= args.slow_max:
+            run("row-by-row", n, slow)
+        run("bulk", n, bulk)
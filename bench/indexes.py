@@ -0,0 +1,122 @@
+"""Плани запитів списків (GET /books, /books/by-owner, /books/export) без індексів міграції 0001 і з ними.
+
+Запити йдуть через сам застосунок, а плани знімає журнал повільних запитів (SLOW_QUERY_MS=0,
+SLOW_QUERY_EXPLAIN_SAMPLE=1), тож перевіряється саме той SQL, який збирають роутери.
+`--check` завершується з помилкою, якщо після міграції хоч один запит читає books через Seq Scan.
+
+    python -m bench.indexes --books 1000000 --owners 50 --check
+"""
+import os
+
+os.environ.update(SLOW_QUERY_MS="0", SLOW_QUERY_EXPLAIN_SAMPLE="1", RESPONSE_CACHE_BACKEND="off")
+# Запити йдуть з одного IP без пауз — ліміти частоти тут лише дали б 429.
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+
+import httpx
+
+from app.db import conn, get_dict_cursor
+from app.query_log import clear_slow_queries, slow_query_stats
+from bench.load import percentile
+from bench.seed import BENCH_EMAIL, BENCH_PASSWORD, seed_books
+from init_db import MIGRATIONS_DIR
+
+MIGRATION = os.path.join(MIGRATIONS_DIR, "0001_listing_indexes.sql")
+
+QUERIES = {
+    "title": ("/books", {}),
+    "title desc": ("/books", {"order": "desc"}),
+    "title cursor": ("/books", {"cursor": True}),
+    "genre": ("/books", {"genre": "Science"}),
+    "genre + year": ("/books", {"genre": "History", "sort": "year", "order": "desc"}),
+    "year": ("/books", {"sort": "year"}),
+    "year range": ("/books", {"year_from": 1990, "year_to": 1995, "sort": "year"}),
+    "by-owner": ("/books/by-owner", {"limit": 100}),
+    "by-owner cursor": ("/books/by-owner", {"limit": 100, "cursor": True}),
+    "export page": ("/books/export", {"limit": 100, "offset": 5000}),
+    "export genre": ("/books/export", {"genre": "Fiction", "limit": 1000}),
+}
+
+
+def index_statements() -> tuple[list[str], list[str]]:
+    with open(MIGRATION, encoding="utf-8") as f:
+        sql = f.read()
+    creates = [s.replace("CONCURRENTLY ", "") for s in re.findall(r"^CREATE INDEX[^;]+", sql, flags=re.M)]
+    names = [re.search(r"IF NOT EXISTS (\w+)", s).group(1) for s in creates]
+    return creates, names
+
+
+def books_nodes(plan: dict) -> list[str]:
+    nodes = []
+    if plan.get("Relation Name") == "books":
+        nodes.append(plan["Node Type"] + (f" ({plan['Index Name']})" if "Index Name" in plan else ""))
+    for child in plan.get("Plans", []):
+        nodes += books_nodes(child)
+    return nodes
+
+
+async def run_queries(client, headers: dict, repeat: int) -> dict:
+    results = {}
+    for label, (url, params) in QUERIES.items():
+        params = dict(params)
+        if params.pop("cursor", False):
+            # Друга сторінка: курсор беремо з першої.
+            first = await client.get(url, params=params, headers=headers)
+            params["cursor"] = first.headers["X-Next-Cursor"]
+        latencies = []
+        plan = None
+        for i in range(repeat):
+            clear_slow_queries()
+            t0 = time.perf_counter()
+            r = await client.get(url, params=params, headers=headers)
+            latencies.append(time.perf_counter() - t0)
+            assert r.status_code == 200, (label, r.status_code, r.text)
+            if plan is None:
+                plan = next(s["plan"][0] for s in slow_query_stats()["shapes"]
+                            if "FROM books b" in s["sql"] and isinstance(s.get("plan"), list))
+        nodes = books_nodes(plan["Plan"])
+        results[label] = {"seq_scan": any(n.startswith("Seq Scan") for n in nodes), "books": nodes,
+                          "execution_ms": round(plan["Execution Time"], 2),
+                          "p50_ms": round(percentile(latencies, 50) * 1000, 2)}
+    return results
+
+
+async def main(args) -> int:
+    from main import app
+
+    if args.books:
+        print(seed_books(args.books, n_authors=5000, n_owners=args.owners, reset=True), file=sys.stderr)
+    creates, names = index_statements()
+    report = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            r = await client.post("/auth/token", data={"username": BENCH_EMAIL, "password": BENCH_PASSWORD})
+            headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+            for phase in ("before", "after"):
+                with conn() as c, get_dict_cursor(c) as cur:
+                    for name, sql in zip(names, creates):
+                        cur.execute(f"DROP INDEX IF EXISTS {name}" if phase == "before" else sql)
+                    cur.execute("ANALYZE books")
+                report[phase] = await run_queries(client, headers, args.repeat)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    seq = [label for label, res in report["after"].items() if res["seq_scan"]]
+    if seq:
+        print(f"Seq Scan по books після міграції: {', '.join(seq)}", file=sys.stderr)
+    return 1 if args.check and seq else 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--books", type=int, default=1_000_000, help="0 — не перезаповнювати БД")
+    ap.add_argument("--owners", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--check", action="store_true")
+    sys.exit(asyncio.run(main(ap.parse_args())))
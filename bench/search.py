@@ -0,0 +1,67 @@
+"""Латентність пошуку (search/author) без trigram-індексів і з ними.
+
+    python -m bench.search --books 1000000
+"""
+import argparse
+import json
+import time
+
+from app.books import build_filters
+from app.db import conn, get_dict_cursor
+from bench.load import percentile
+from bench.seed import seed_books
+
+INDEXES = {
+    "books_title_trgm": "CREATE INDEX IF NOT EXISTS books_title_trgm ON books USING gin (title gin_trgm_ops)",
+    "authors_name_trgm": "CREATE INDEX IF NOT EXISTS authors_name_trgm ON authors USING gin (name gin_trgm_ops)",
+}
+QUERIES = [
+    {"search": "Shadow"}, {"search": "iver"}, {"search": "Golden Night"}, {"search": "Hawking"},
+    {"search": "12345"}, {"author": "Franko"}, {"author": "olena"}, {"search": "Kingdom", "author": "Stus"},
+]
+
+
+def run_queries(cur, repeat: int) -> dict:
+    timings: dict[str, list[float]] = {}
+    for q in QUERIES:
+        where, args = build_filters(search=q.get("search"), author=q.get("author"))
+        sql = f"""SELECT b.id, b.title, a.name AS author, b.genre, b.published_year
+                  FROM books b JOIN authors a ON a.id = b.author_id
+                  WHERE {" AND ".join(where)}
+                  ORDER BY lower(b.title), b.id LIMIT 20"""
+        key = json.dumps(q, ensure_ascii=False)
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            cur.execute(sql, args)
+            cur.fetchall()
+            timings.setdefault(key, []).append(time.perf_counter() - t0)
+    everything = [t for ts in timings.values() for t in ts]
+    return {
+        "p50_ms": round(percentile(everything, 50) * 1000, 2),
+        "p99_ms": round(percentile(everything, 99) * 1000, 2),
+        "per_query_p50_ms": {k: round(percentile(v, 50) * 1000, 2) for k, v in timings.items()},
+    }
+
+
+def main(args):
+    if args.books:
+        print(seed_books(args.books, n_authors=5000, reset=True))
+    results = {}
+    with conn() as c, get_dict_cursor(c) as cur:
+        for name in INDEXES:
+            cur.execute(f"DROP INDEX IF EXISTS {name}")
+        cur.execute("ANALYZE books")
+        results["before"] = run_queries(cur, args.repeat)
+        for sql in INDEXES.values():
+            cur.execute(sql)
+        cur.execute("ANALYZE books")
+        cur.execute("ANALYZE authors")
+        results["after"] = run_queries(cur, args.repeat)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--books", type=int, default=1_000_000, help="0 — не перезаповнювати БД")
+    ap.add_argument("--repeat", type=int, default=20)
+    main(ap.parse_args())
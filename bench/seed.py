@@ -0,0 +1,94 @@
+import argparse
+import random
+import time
+
+from app.db import conn, get_dict_cursor
+from app.books import author_cache
+from app.security import hash_pwd
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "Bench123!"
+GENRES = ["Fiction", "Non-Fiction", "Science", "History"]
+WORDS = [
+    "Silent", "River", "Shadow", "Empire", "Garden", "Winter", "Golden", "Night", "Ocean", "Storm",
+    "Forest", "Stone", "Glass", "Iron", "Secret", "Lost", "City", "Dream", "Fire", "Light",
+    "History", "Science", "Journey", "Kingdom", "Mountain", "Machine", "Island", "Road", "Star", "Time",
+]
+FIRST = ["Anna", "Taras", "Olena", "Ivan", "Maria", "Petro", "Sofia", "Andrii", "Iryna", "Oleh",
+         "Frank", "Yuval", "Stephen", "Herman", "Agatha", "George", "Virginia", "Ernest", "Jane", "Mark"]
+LAST = ["Shevchenko", "Franko", "Ukrainka", "Kostenko", "Herbert", "Harari", "Hawking", "Melville",
+        "Christie", "Orwell", "Woolf", "Hemingway", "Austen", "Twain", "Kotsiubynsky", "Stus"]
+
+
+def ensure_user(cur, email: str = BENCH_EMAIL, password: str = BENCH_PASSWORD) -> int:
+    cur.execute("SELECT id FROM users WHERE LOWER(email)=LOWER(%s)", (email,))
+    r = cur.fetchone()
+    if r:
+        return r["id"]
+    cur.execute("INSERT INTO users(email, password_hash) VALUES (%s,%s) RETURNING id", (email, hash_pwd(password)))
+    return cur.fetchone()["id"]
+
+
+def ensure_users(cur, n: int, password: str = BENCH_PASSWORD) -> list[int]:
+    """bench1..benchN@example.com з одним і тим самим хешем: bcrypt на кожного зайняв би хвилини."""
+    if n <= 0:
+        return []
+    cur.execute("""
+        INSERT INTO users(email, password_hash)
+        SELECT 'bench' || i || '@example.com', %s FROM generate_series(1, %s) i
+        ON CONFLICT DO NOTHING
+    """, (hash_pwd(password), n))
+    cur.execute("SELECT id FROM users WHERE email = ANY(%s) ORDER BY id",
+                ([f"bench{i}@example.com" for i in range(1, n + 1)],))
+    return [r["id"] for r in cur.fetchall()]
+
+
+def author_names(n: int) -> list[str]:
+    names = [f"{f} {l}" for l in LAST for f in FIRST]
+    names += [f"{f} {m} {l}" for m in WORDS for l in LAST for f in FIRST]
+    return names[:n]
+
+
+def seed_books(n_books: int, n_authors: int = 2000, n_owners: int = 1, reset: bool = False, rnd_seed: int = 42,
+               skew: float = 1.0) -> dict:
+    """Заповнює БД синтетичними книгами (COPY), автори розподілені за законом Ципфа з показником skew."""
+    rnd = random.Random(rnd_seed)
+    started = time.perf_counter()
+    with conn() as c, get_dict_cursor(c) as cur:
+        if reset:
+            cur.execute("TRUNCATE books, authors RESTART IDENTITY CASCADE")
+            author_cache.clear()
+        owners = [ensure_user(cur)] + ensure_users(cur, n_owners - 1)
+
+        names = author_names(n_authors)
+        cur.execute("DROP TABLE IF EXISTS pg_temp.seed_authors")
+        cur.execute("CREATE TEMP TABLE seed_authors(name TEXT)")
+        with cur.copy("COPY seed_authors(name) FROM STDIN") as cp:
+            for name in names:
+                cp.write_row((name,))
+        cur.execute("INSERT INTO authors(name) SELECT name FROM seed_authors ON CONFLICT (name) DO NOTHING")
+        cur.execute("SELECT a.id FROM authors a JOIN seed_authors s ON s.name = a.name ORDER BY a.id")
+        author_ids = [r["id"] for r in cur.fetchall()]
+        weights = [1 / (i + 1) ** skew for i in range(len(author_ids))]
+
+        cur.execute("SELECT COALESCE(MAX(id), 0) AS m FROM books")
+        base = cur.fetchone()["m"]
+        picked = rnd.choices(author_ids, weights=weights, k=n_books)
+        with cur.copy("COPY books(title, author_id, genre, published_year, owner_id) FROM STDIN") as cp:
+            for i in range(n_books):
+                title = f"{rnd.choice(WORDS)} {rnd.choice(WORDS)} {base + i + 1}"
+                cp.write_row((title, picked[i], rnd.choice(GENRES), rnd.randint(1800, 2024), rnd.choice(owners)))
+        cur.execute("ANALYZE books")
+        cur.execute("ANALYZE authors")
+    return {"books": n_books, "authors": len(names), "owners": len(owners), "seconds": round(time.perf_counter() - started, 2)}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Заповнення БД тестовими книгами для бенчмарків")
+    ap.add_argument("--books", type=int, default=10_000)
+    ap.add_argument("--authors", type=int, default=2000)
+    ap.add_argument("--owners", type=int, default=1)
+    ap.add_argument("--skew", type=float, default=1.0, help="показник Ципфа для авторів (0 — рівномірно)")
+    ap.add_argument("--reset", action="store_true")
+    args = ap.parse_args()
+    print(seed_books(args.books, args.authors, args.owners, args.reset, skew=args.skew))
@@ -0,0 +1,47 @@
+"""Серіалізація сторінки книг: BookOut + jsonable_encoder + JSONResponse проти books_json (TypeAdapter).
+
+    python -m bench.serialize --page 100 --seconds 3
+"""
+import argparse
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.books import books_json, row_to_out
+from bench.seed import GENRES, WORDS, author_names
+
+
+def make_rows(n: int) -> list[dict]:
+    names = author_names(50)
+    return [{"title": f"{WORDS[i % len(WORDS)]} {WORDS[(i * 7) % len(WORDS)]} {i}", "author": names[i % len(names)],
+             "genre": GENRES[i % len(GENRES)], "published_year": 1900 + i % 120, "id": i + 1} for i in range(n)]
+
+
+def models_path(rows) -> bytes:
+    # Те, що робив FastAPI: BookOut на рядок, jsonable_encoder і json.dumps у JSONResponse.
+    return JSONResponse(content=jsonable_encoder([row_to_out(r) for r in rows])).body
+
+
+def rows_per_sec(fn, rows, seconds: float) -> float:
+    n = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        fn(rows)
+        n += len(rows)
+    return n / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--page", type=int, default=100)
+    ap.add_argument("--seconds", type=float, default=3.0)
+    args = ap.parse_args()
+
+    rows = make_rows(args.page)
+    assert models_path(rows) == books_json(rows)
+    old = rows_per_sec(models_path, rows, args.seconds)
+    new = rows_per_sec(books_json, rows, args.seconds)
+    print(json.dumps({"page": args.page, "models_rows_per_sec": round(old), "fast_rows_per_sec": round(new),
+                      "speedup": round(new / old, 1)}))
@@ -0,0 +1,76 @@
+"""Валідація імпорту: BookIn(**item) по рядку проти validate_items (TypeAdapter на пачку).
+
+    python -m bench.validate --rows 100000 --bad-ratio 0.01
+"""
+import argparse
+import copy
+import csv
+import io
+import json
+import random
+import time
+
+from app.books import BookIn
+from app.imports import IMPORT_BATCH, parse_upload, validate_items
+from bench.import_bulk import make_items
+
+
+def per_row(items, start=1):
+    # Попередня реалізація validate_items.
+    valid, errors = [], []
+    for i, raw_item in enumerate(items, start=start):
+        row_no = raw_item.pop("_row", i) if isinstance(raw_item, dict) else i
+        if isinstance(raw_item, dict) and "_error" in raw_item:
+            errors.append({"row": row_no, "error": raw_item["_error"]})
+            continue
+        try:
+            valid.append((row_no, BookIn(**raw_item)))
+        except Exception as e:
+            errors.append({"row": row_no, "error": str(e)})
+    return valid, errors
+
+
+def make_csv(n: int, bad_ratio: float) -> bytes:
+    rnd = random.Random(3)
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=["title", "author", "genre", "published_year"])
+    writer.writeheader()
+    for item in make_items(n, dup_ratio=0):
+        if rnd.random() < bad_ratio:
+            item[rnd.choice(["title", "genre", "published_year"])] = rnd.choice(["", "$$$", "1700"])
+        writer.writerow(item)
+    return buf.getvalue().encode("utf-8")
+
+
+def run(fn, batches, repeat: int) -> tuple[float, list]:
+    """Найкращий час із `repeat` прогонів (кожен на свіжій копії — validate_items змінює елементи)."""
+    best = float("inf")
+    for _ in range(repeat):
+        copies = copy.deepcopy(batches)
+        started = time.perf_counter()
+        out = []
+        start = 1
+        for batch in copies:
+            valid, errors = fn(batch, start)
+            out.append((len(valid), errors))
+            start += len(batch)
+        best = min(best, time.perf_counter() - started)
+    return best, out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--bad-ratio", type=float, default=0.01)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    items = list(parse_upload("books.csv", "text/csv", make_csv(args.rows, args.bad_ratio)))
+    batches = [items[i:i + IMPORT_BATCH] for i in range(0, len(items), IMPORT_BATCH)]
+    old_s, old = run(per_row, batches, args.repeat)
+    new_s, new = run(validate_items, batches, args.repeat)
+    assert old == new, "різні помилки"
+    print(json.dumps({"rows": len(items), "errors": sum(len(e) for _, e in new),
+                      "per_row_rows_per_sec": round(len(items) / old_s),
+                      "batch_rows_per_sec": round(len(items) / new_s),
+                      "speedup": round(old_s / new_s, 1)}))
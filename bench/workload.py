@@ -0,0 +1,237 @@
+"""Змішане навантаження: списки з фільтрами, by-owner, книга за id, вхід, імпорт і експорт.
+
+Дані — синтетичні (bench.seed: COPY, автори за законом Ципфа, книги рівномірно між --users власниками).
+Запити йдуть через ASGI у тому ж процесі або на --url (наприклад, serve.py з кількома воркерами — тоді
+БД з .env має бути тією самою). Результат — JSON з пропускною здатністю і p50/p95/p99 для кожного
+ендпоїнта. `--baseline` порівнює з попереднім запуском: погіршення req/s або p95 більше ніж на
+`--max-regression` % дає код виходу 1. Імпорт додає книги, тож повторні запуски без --books ростуть.
+
+    python -m bench.workload --books 1000000 --users 200 --duration 30 --concurrency 64 --output base.json
+    python -m bench.workload --books 0 --duration 30 --concurrency 64 --baseline base.json --max-regression 10
+"""
+import os
+
+# Усі клієнти бенчмарку — один IP, тож ліміти на IP різали б саме навантаження; для --url діють налаштування сервера.
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+import httpx
+
+from app.db import conn, get_dict_cursor
+from bench.load import percentile
+from bench.seed import BENCH_EMAIL, BENCH_PASSWORD, GENRES, WORDS, author_names, seed_books
+
+# Частки операцій у суміші; --mix list=50,login=0 змінює окремі.
+MIX = {"list": 40, "get_book": 25, "by_owner": 15, "export": 10, "login": 5, "import": 5}
+
+
+class Workload:
+    def __init__(self, rnd: random.Random, ids: tuple[int, int], authors: list[str], sessions: list[dict],
+                 import_rows: int):
+        self.rnd = rnd
+        self.ids = ids
+        self.authors = authors
+        self.sessions = sessions
+        self.import_rows = import_rows
+        self.imported = 0
+
+    async def list(self, client):
+        rnd = self.rnd
+        params = rnd.choice([
+            {},
+            {"genre": rnd.choice(GENRES)},
+            {"genre": rnd.choice(GENRES), "sort": "year", "order": "desc"},
+            {"year_from": (y := rnd.randint(1800, 2015)), "year_to": y + 10, "sort": "year"},
+            # Популярні автори частіше — як і в даних.
+            {"author": self.authors[min(int(rnd.paretovariate(1)) - 1, len(self.authors) - 1)]},
+            {"search": rnd.choice(WORDS)},
+            {"offset": rnd.randint(0, 1000)},
+        ])
+        return await client.get("/books", params=params)
+
+    async def get_book(self, client):
+        return await client.get(f"/books/id/{self.rnd.randint(*self.ids)}")
+
+    async def by_owner(self, client):
+        return await client.get("/books/by-owner", params={"limit": 100},
+                                headers=self.rnd.choice(self.sessions)["headers"])
+
+    async def export(self, client):
+        return await client.get("/books/export", params={
+            "format": self.rnd.choice(["json", "csv", "ndjson"]), "genre": self.rnd.choice(GENRES),
+            "limit": 1000, "offset": self.rnd.randint(0, 10_000)})
+
+    async def login(self, client):
+        return await client.post("/auth/token", data={"username": self.rnd.choice(self.sessions)["email"],
+                                                      "password": BENCH_PASSWORD})
+
+    async def import_(self, client):
+        self.imported += 1
+        run = f"{time.time_ns():x}-{self.imported}"
+        items = [{"title": f"Workload {run} {i}", "author": self.rnd.choice(self.authors),
+                  "genre": self.rnd.choice(GENRES), "published_year": self.rnd.randint(1800, 2024)}
+                 for i in range(self.import_rows)]
+        return await client.post("/books/import", headers=self.rnd.choice(self.sessions)["headers"],
+                                 files={"file": ("books.json", json.dumps(items), "application/json")})
+
+
+async def login_sessions(client, n: int) -> list[dict]:
+    emails = [BENCH_EMAIL] + [f"bench{i}@example.com" for i in range(1, n)]
+    sessions = []
+    for email in emails:
+        r = await client.post("/auth/token", data={"username": email, "password": BENCH_PASSWORD})
+        assert r.status_code == 200, (email, r.status_code, r.text)
+        sessions.append({"email": email, "headers": {"Authorization": f"Bearer {r.json()['access_token']}"}})
+    return sessions
+
+
+async def run_mix(client, workload: Workload, mix: dict, concurrency: int, duration: float) -> dict:
+    """`concurrency` клієнтів без пауз протягом `duration` секунд; кожен запит — операція за вагами mix."""
+    ops = [op for op, w in mix.items() if w > 0]
+    weights = [mix[op] for op in ops]
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            op = workload.rnd.choices(ops, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                r = await getattr(workload, "import_" if op == "import" else op)(client)
+                failed = r.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[op].append(time.perf_counter() - t0)
+            errors[op] += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    def summary(values: list[float], failed: int) -> dict:
+        return {"requests": len(values), "errors": failed, "rps": round(len(values) / elapsed, 1),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2)}
+
+    return {"total": summary([x for v in latencies.values() for x in v], sum(errors.values())),
+            "endpoints": {op: summary(latencies[op], errors[op]) for op in ops if latencies[op]}}
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> dict:
+    """Зміна req/s і p95 (у %) відносно baseline; regression — якщо хоч одна гірша за поріг."""
+    diff = {}
+    for op, cur in {"total": report["total"], **report["endpoints"]}.items():
+        base = baseline["total"] if op == "total" else baseline["endpoints"].get(op)
+        if not base or not base["rps"] or not base["p95_ms"]:
+            continue
+        rps = (cur["rps"] - base["rps"]) / base["rps"] * 100
+        p95 = (cur["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100
+        diff[op] = {"rps_pct": round(rps, 1), "p95_pct": round(p95, 1),
+                    "regression": rps < -max_regression or p95 > max_regression}
+    return {"commit": baseline["meta"].get("commit"), "max_regression_pct": max_regression, "endpoints": diff}
+
+
+def dataset() -> dict:
+    with conn() as c, get_dict_cursor(c) as cur:
+        cur.execute("""
+            SELECT (SELECT COALESCE(MIN(id), 0) FROM books) AS min_id, (SELECT COALESCE(MAX(id), 0) FROM books) AS max_id,
+                   ((SELECT COALESCE(SUM(n), 0) FROM book_counts_by_genre)
+                    + (SELECT COALESCE(SUM(delta), 0) FROM book_counts_delta))::bigint AS books,
+                   (SELECT COUNT(*) FROM authors) AS authors, (SELECT COUNT(*) FROM users WHERE email LIKE 'bench%%@example.com') AS users
+        """)
+        return cur.fetchone()
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(spec: str | None) -> dict:
+    mix = dict(MIX)
+    for part in filter(None, (spec or "").split(",")):
+        op, _, weight = part.partition("=")
+        if op not in MIX:
+            raise SystemExit(f"Невідома операція у --mix: {op} (є: {', '.join(MIX)})")
+        mix[op] = float(weight)
+    return mix
+
+
+async def main(args) -> int:
+    mix = parse_mix(args.mix)
+    seeded = None
+    if args.books:
+        seeded = seed_books(args.books, n_authors=args.authors, n_owners=args.users, reset=True, skew=args.skew)
+        print(seeded, file=sys.stderr)
+    data = dataset()
+
+    app = None
+    if not args.url:
+        from main import app
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    transport = httpx.ASGITransport(app=app) if app is not None else None
+    async with app.router.lifespan_context(app) if app is not None else nullcontext():
+        async with httpx.AsyncClient(transport=transport, base_url=args.url or "http://bench",
+                                     limits=limits, timeout=120) as client:
+            sessions = await login_sessions(client, min(args.sessions, data["users"]))
+            workload = Workload(random.Random(args.seed), (data["min_id"], data["max_id"]),
+                                author_names(args.authors), sessions, args.import_rows)
+            if args.warmup:
+                await run_mix(client, workload, mix, args.concurrency, args.warmup)
+            result = await run_mix(client, workload, mix, args.concurrency, args.duration)
+
+    report = {
+        "meta": {"commit": git_commit(), "python": platform.python_version(), "target": args.url or "asgi",
+                 "concurrency": args.concurrency, "duration": args.duration, "mix": mix,
+                 "dataset": data, "seed": seeded},
+        **result,
+    }
+    code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["baseline"] = compare(report, json.load(f), args.max_regression)
+        worse = [op for op, d in report["baseline"]["endpoints"].items() if d["regression"]]
+        if worse:
+            print(f"Погіршення понад {args.max_regression}%: {', '.join(worse)}", file=sys.stderr)
+            code = 1
+    out = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    print(out)
+    return code
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Змішане навантаження з JSON-звітом p50/p95/p99 за ендпоїнтами")
+    ap.add_argument("--books", type=int, default=100_000, help="0 — не перезаповнювати БД")
+    ap.add_argument("--authors", type=int, default=5000)
+    ap.add_argument("--users", type=int, default=100, help="власники книг")
+    ap.add_argument("--skew", type=float, default=1.0, help="показник Ципфа для авторів")
+    ap.add_argument("--sessions", type=int, default=20, help="скільки власників входять і роблять запити")
+    ap.add_argument("--url", help="адреса запущеного сервера замість ASGI у цьому процесі")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--duration", type=float, default=20.0)
+    ap.add_argument("--warmup", type=float, default=3.0)
+    ap.add_argument("--mix", help="ваги операцій, напр. list=50,import=0 (" + ", ".join(MIX) + ")")
+    ap.add_argument("--import-rows", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--output")
+    ap.add_argument("--baseline")
+    ap.add_argument("--max-regression", type=float, default=10.0)
+    sys.exit(asyncio.run(main(ap.parse_args())))
@@ -0,0 +1,108 @@
+"""Запити до БД і затримка на запит для POST/PUT/DELETE /books (послідовно, один клієнт).
+
+Кількість запитів включає перевірку з'єднання пулом (check_connection) при кожному запиті.
+`--rtt-ms` додає штучну затримку перед кожним запитом — модель БД в іншій мережі.
+
+    python -m bench.write_paths --iterations 2000 --rtt-ms 0.5
+"""
+import os
+
+# Усі клієнти бенчмарку — один IP, тож ліміти частоти різали б саме навантаження.
+os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+import httpx
+import psycopg
+
+from app.db import conn, get_dict_cursor
+from bench.load import percentile
+from bench.seed import author_names
+
+_round_trips = 0
+_rtt = 0.0
+_execute = psycopg.AsyncCursor.execute
+
+
+async def _counting_execute(self, *args, **kwargs):
+    global _round_trips
+    _round_trips += 1
+    if _rtt:
+        await asyncio.sleep(_rtt)
+    return await _execute(self, *args, **kwargs)
+
+
+async def signup(client, email: str) -> dict:
+    await client.post("/auth/signup", json={"email": email, "password": "Bench123!"})
+    r = await client.post("/auth/token", data={"username": email, "password": "Bench123!"})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+async def main(args):
+    global _rtt
+    from main import app
+
+    _rtt = args.rtt_ms / 1000
+    with conn() as c, get_dict_cursor(c) as cur:
+        cur.execute("DELETE FROM users WHERE email LIKE 'writes%%@example.com'")
+
+    samples = defaultdict(list)
+    trips = defaultdict(list)
+    names = author_names(args.authors)
+    psycopg.AsyncCursor.execute = _counting_execute
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                owner = await signup(client, "writes1@example.com")
+                other = await signup(client, "writes2@example.com")
+
+                async def call(label: str, expect: int, method: str, url: str, **kw):
+                    global _round_trips
+                    _round_trips = 0
+                    t0 = time.perf_counter()
+                    r = await client.request(method, url, **kw)
+                    samples[label].append(time.perf_counter() - t0)
+                    trips[label].append(_round_trips)
+                    assert r.status_code == expect, (label, r.status_code, r.text)
+                    return r
+
+                for i in range(args.iterations):
+                    book = {"title": f"Write path {i}", "author": names[i % len(names)],
+                            "genre": "Fiction", "published_year": 2000}
+                    bid = (await call("create", 200, "POST", "/books", headers=owner, json=book)).json()["id"]
+                    await call("create 409", 409, "POST", "/books", headers=owner, json=book)
+                    await call("update", 200, "PUT", f"/books/{bid}", headers=owner,
+                               json={**book, "author": names[(i + 1) % len(names)], "published_year": 2001})
+                    await call("update 403", 403, "PUT", f"/books/{bid}", headers=other, json=book)
+                    await call("update 404", 404, "PUT", "/books/0", headers=owner, json=book)
+                    await call("delete 403", 403, "DELETE", f"/books/{bid}", headers=other)
+                    await call("delete", 200, "DELETE", f"/books/{bid}", headers=owner)
+                    await call("delete 404", 404, "DELETE", f"/books/{bid}", headers=owner)
+    finally:
+        psycopg.AsyncCursor.execute = _execute
+
+    print(f"{'endpoint':<12} {'round trips':>12} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, lat in samples.items():
+        res = {"endpoint": label, "requests": len(lat),
+               "round_trips": round(sum(trips[label]) / len(trips[label]), 2),
+               "p50_ms": round(percentile(lat, 50) * 1000, 2),
+               "p95_ms": round(percentile(lat, 95) * 1000, 2),
+               "p99_ms": round(percentile(lat, 99) * 1000, 2)}
+        if args.json:
+            print(json.dumps(res))
+        else:
+            print(f"{label:<12} {res['round_trips']:>12} {res['p50_ms']:>8} {res['p95_ms']:>8} {res['p99_ms']:>8}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iterations", type=int, default=2000)
+    ap.add_argument("--authors", type=int, default=200, help="скільки різних авторів чергувати")
+    ap.add_argument("--rtt-ms", type=float, default=0.0, help="штучна мережева затримка на кожен запит до БД")
+    ap.add_argument("--json", action="store_true")
+    asyncio.run(main(ap.parse_args()))
@@ -1,5 +1,7 @@
 import os
+import re
 import psycopg
+from psycopg import sql as pgsql
 
 from dotenv import load_dotenv
 
@@ -11,6 +13,13 @@ PGHOST = os.getenv("PGHOST")
 PGPORT = os.getenv("PGPORT")
 DBNAME = os.getenv("DBNAME")
 SCHEMA_FILE = os.getenv("SCHEMA_FILE")
+MIGRATIONS_DIR = os.getenv("MIGRATIONS_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+NO_TRANSACTION = "-- migrate: no-transaction"
+# Кілька процесів, що стартують одночасно, накочують міграції по черзі.
+MIGRATIONS_LOCK = 7_340_112
+CONCURRENT_INDEX = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.I)
 
 def create_database():
     with psycopg.connect(host=PGHOST, port=PGPORT, user=PGUSER, password=PGPASSWORD, autocommit=True) as conn:
@@ -22,14 +31,65 @@ def create_database():
                 cur.execute(f'CREATE DATABASE "{DBNAME}";')
                 print(f"[OK] Database '{DBNAME}' created")
 
+def list_migrations() -> list[tuple[int, str, str]]:
+    found = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        m = MIGRATION_FILE.match(filename)
+        if m:
+            found.append((int(m.group(1)), m.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return found
+
+def drop_invalid_index(conn, index: str) -> bool:
+    """Прибирає індекс, що лишився INVALID після перерваного CREATE INDEX CONCURRENTLY.
+
+    Інакше IF NOT EXISTS вважає його наявним: міграція «проходить», а планувальник індексом не користується.
+    """
+    row = conn.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (index,)).fetchone()
+    if not row or not row[0]:
+        return False
+    conn.execute(pgsql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(pgsql.Identifier(index)))
+    print(f"[OK] Invalid index '{index}' dropped")
+    return True
+
+def run_migration(conn, version: int, name: str, sql: str):
+    """Міграція з позначкою no-transaction (CREATE INDEX CONCURRENTLY) виконується по одній команді без транзакції."""
+    if sql.lstrip().startswith(NO_TRANSACTION):
+        statements = [s for s in re.split(r";\s*$", sql, flags=re.M)
+                      if re.sub(r"--[^\n]*", "", s).strip()]
+        for statement in statements:
+            if m := CONCURRENT_INDEX.search(re.sub(r"--[^\n]*", "", statement)):
+                drop_invalid_index(conn, m.group(1))
+            conn.execute(statement)
+        conn.execute("INSERT INTO schema_migrations(version, name) VALUES (%s, %s)", (version, name))
+    else:
+        with conn.transaction():
+            conn.execute(sql)
+            conn.execute("INSERT INTO schema_migrations(version, name) VALUES (%s, %s)", (version, name))
+
 def apply_schema():
-    with open(SCHEMA_FILE, encoding="utf-8") as f:
-        sql = f.read()
+    """Накочує базову схему (лише на порожню БД) і ще не застосовані міграції з MIGRATIONS_DIR."""
     with psycopg.connect(host=PGHOST, port=PGPORT, user=PGUSER, password=PGPASSWORD,dbname=DBNAME, autocommit=True) as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql)
-    print(f"[OK] Schema from '{SCHEMA_FILE}' applied")
+        conn.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK,))
+        try:
+            conn.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                                version    INT PRIMARY KEY,
+                                name       TEXT NOT NULL,
+                                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW())""")
+            applied = {r[0] for r in conn.execute("SELECT version FROM schema_migrations")}
+            # Версія 0 — schema.sql; бази, створені до міграцій, теж її проходять (вона ідемпотентна).
+            if 0 not in applied:
+                with open(SCHEMA_FILE, encoding="utf-8") as f:
+                    run_migration(conn, 0, "baseline", f.read())
+                print(f"[OK] Schema from '{SCHEMA_FILE}' applied")
+            for version, name, path in list_migrations():
+                if version in applied:
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    run_migration(conn, version, name, f.read())
+                print(f"[OK] Migration {version:04d}_{name} applied")
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK,))
 
 if __name__ == "__main__":
     create_database()
-    apply_schema()
\ No newline at end of file
+    apply_schema()
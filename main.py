@@ -1,23 +1,153 @@
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+from psycopg_pool import PoolTimeout
+from starlette.concurrency import run_in_threadpool
+
+from app.db import open_pool, close_pool, pool_stats, get_pool, get_dict_cursor
+from app.adb import open_apool, close_apool, apool_stats
+from app.replicas import open_replicas, close_replicas, replicas_stats
+from app.security import HashQueueFull, hashing_stats
+from app.auth import token_cache_stats, is_admin
+from app.books import warm_author_cache, author_cache_stats
+from app.jobs import JobQueueFull, resume_jobs, shutdown_jobs, jobs_stats
+from app.response_cache import response_cache_stats
+from app.health import readiness
+from app.counts import count_cache_stats
+from app.stats import start_stats_refresher, stop_stats_refresher, stats_refresher_stats
+from app.query_log import slow_query_stats, clear_slow_queries, flush_log
+from app.admission import ADMISSION_ENABLED, AdmissionMiddleware, admission_stats
+from app.metrics import METRICS_ENABLED, MetricsMiddleware, register_stats, render_metrics
 from routers.books import router as books_router
 from routers.auth import router as auth_router
 from routers.imports import router as imports_router
 from routers.export import router as export_router
+from routers.stats import router as stats_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    open_pool()
+    await open_apool()
+    await open_replicas()
+    with get_pool().connection() as c, get_dict_cursor(c) as cur:
+        warm_author_cache(cur)
+    resume_jobs()
+    start_stats_refresher()
+    yield
+    await stop_stats_refresher()
+    await run_in_threadpool(shutdown_jobs)
+    await close_replicas()
+    await close_apool()
+    close_pool()
+    await run_in_threadpool(flush_log)
+
+app = FastAPI(title="Book Manager System", docs_url="/docs", redoc_url="/redoc", lifespan=lifespan)
+
+# Добавлений пізніше middleware — зовнішній: метрики бачать і відхилені 429/503.
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    for name, fn in {"pool": pool_stats, "apool": apool_stats, "hashing": hashing_stats,
+                     "token_cache": token_cache_stats, "import_jobs": jobs_stats,
+                     "author_cache": author_cache_stats, "response_cache": response_cache_stats,
+                     "count_cache": count_cache_stats, "book_stats": stats_refresher_stats,
+                     "replicas": replicas_stats, "admission": admission_stats}.items():
+        register_stats(name, fn)
+
+@app.exception_handler(PoolTimeout)
+def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": "База даних перевантажена, спробуйте пізніше"})
+
+@app.exception_handler(HashQueueFull)
+def hash_queue_full_handler(request: Request, exc: HashQueueFull):
+    return JSONResponse(status_code=503, content={"detail": "Сервіс авторизації перевантажений, спробуйте пізніше"},
+                        headers={"Retry-After": "1"})
+
+@app.exception_handler(JobQueueFull)
+def job_queue_full_handler(request: Request, exc: JobQueueFull):
+    return JSONResponse(status_code=503, content={"detail": "Черга імпорту переповнена, спробуйте пізніше"},
+                        headers={"Retry-After": "30"})
+
+@app.get("/status", description="Готовність: БД досяжна, пули не переповнені (інакше 503).")
+async def status():
+    ready = await readiness()
+    if not ready["ok"]:
+        return JSONResponse(status_code=503, content=ready, headers={"Retry-After": "1"})
+    return ready
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Метрики вимкнено")
+    body, media_type = render_metrics()
+    return Response(content=body, media_type=media_type)
+
+@app.get("/status/pool")
+def status_pool():
+    return {"sync": pool_stats(), "async": apool_stats()}
 
-app = FastAPI(title="Book Manager System", docs_url="/docs", redoc_url="/redoc")
+@app.get("/status/hashing")
+def status_hashing():
+    return hashing_stats()
 
-@app.get("/status")
-def status():
-    return {'ok': True}
+@app.get("/status/token-cache")
+def status_token_cache():
+    return token_cache_stats()
+
+@app.get("/status/import-jobs")
+def status_import_jobs():
+    return jobs_stats()
+
+@app.get("/status/author-cache")
+def status_author_cache():
+    return author_cache_stats()
+
+@app.get("/status/response-cache")
+def status_response_cache():
+    return response_cache_stats()
+
+@app.get("/status/count-cache")
+def status_count_cache():
+    return count_cache_stats()
+
+@app.get("/status/book-stats")
+def status_book_stats():
+    return stats_refresher_stats()
+
+@app.get("/status/replicas", description="Репліки для читання: здоров'я, відставання, затримка і куди йшли читання.")
+def status_replicas():
+    return replicas_stats()
+
+@app.get("/status/admission", description="Ліміти за класами маршрутів: запити в обробці та відхилені (503 — зайнято, 429 — ліміт).")
+def status_admission():
+    return admission_stats()
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    # Журнал показує SQL і плани, а DELETE стирає його для всіх — тому не публічно, як решта /status.
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Потрібен X-Admin-Token (ADMIN_TOKEN)")
+
+@app.get("/status/slow-queries", dependencies=[Depends(require_admin)],
+         description="Форми повільних запитів (SLOW_QUERY_MS) за сумарним часом, з планами для вибірки.")
+def status_slow_queries():
+    return slow_query_stats()
+
+@app.delete("/status/slow-queries", dependencies=[Depends(require_admin)])
+def reset_slow_queries():
+    clear_slow_queries()
+    return {"ok": True}
 
 app.include_router(auth_router)
 app.include_router(books_router)
 app.include_router(imports_router)
 app.include_router(export_router)
+app.include_router(stats_router)
 
 
 if __name__=='__main__':
     uvicorn.run("main:app", reload=True)
-
-
@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- Індекси під сортування й фільтри списків: ключ сортування + id, як у ORDER BY ... , b.id
+-- (пагінація курсором). Назва сортується без урахування регістру: lower(title).
+-- CONCURRENTLY не блокує запис у books на час побудови.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS books_title_key ON books (lower(title), id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS books_owner_title ON books (owner_id, lower(title), id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS books_genre_title ON books (genre, lower(title), id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS books_year ON books (published_year, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS books_genre_year ON books (genre, published_year, id);
+ANALYZE books;
@@ -0,0 +1,79 @@
+-- Лічильники книг за жанром і власником для X-Total-Count без COUNT(*) по books.
+-- Оновлюються тригерами на рівні команди (transition tables), тож пачка імпорту чи COPY
+-- змінює кожен рядок лічильника один раз, а не на кожну книгу.
+CREATE TABLE IF NOT EXISTS book_counts_by_genre (
+    genre genre_enum PRIMARY KEY,
+    n     BIGINT     NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS book_counts_by_owner (
+    owner_id INT    PRIMARY KEY,
+    n        BIGINT NOT NULL
+);
+
+-- Рядки лічильників оновлюються в порядку ключа, щоб конкурентні пачки не взаємоблокувалися.
+CREATE OR REPLACE FUNCTION book_counts_apply(genres genre_enum[], owners INT[], deltas INT[]) RETURNS void
+LANGUAGE sql AS $$
+    INSERT INTO book_counts_by_genre AS t (genre, n)
+    SELECT genre, SUM(delta) FROM unnest(genres, deltas) AS d(genre, delta)
+    GROUP BY genre HAVING SUM(delta) <> 0 ORDER BY genre
+    ON CONFLICT (genre) DO UPDATE SET n = t.n + EXCLUDED.n;
+
+    INSERT INTO book_counts_by_owner AS t (owner_id, n)
+    SELECT owner_id, SUM(delta) FROM unnest(owners, deltas) AS d(owner_id, delta)
+    GROUP BY owner_id HAVING SUM(delta) <> 0 ORDER BY owner_id
+    ON CONFLICT (owner_id) DO UPDATE SET n = t.n + EXCLUDED.n;
+
+    DELETE FROM book_counts_by_owner WHERE owner_id = ANY(owners) AND n = 0;
+$$;
+
+CREATE OR REPLACE FUNCTION book_counts_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    genres genre_enum[];
+    owners INT[];
+    deltas INT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(genre), array_agg(owner_id), array_agg(1) INTO genres, owners, deltas FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(genre), array_agg(owner_id), array_agg(-1) INTO genres, owners, deltas FROM old_rows;
+    ELSE
+        SELECT array_agg(genre), array_agg(owner_id), array_agg(delta) INTO genres, owners, deltas
+        FROM (SELECT genre, owner_id, 1 AS delta FROM new_rows
+              UNION ALL
+              SELECT genre, owner_id, -1 FROM old_rows) d;
+    END IF;
+    IF genres IS NOT NULL THEN
+        PERFORM book_counts_apply(genres, owners, deltas);
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION book_counts_truncate() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM book_counts_by_genre;
+    DELETE FROM book_counts_by_owner;
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS book_counts_ins ON books;
+DROP TRIGGER IF EXISTS book_counts_upd ON books;
+DROP TRIGGER IF EXISTS book_counts_del ON books;
+DROP TRIGGER IF EXISTS book_counts_trunc ON books;
+CREATE TRIGGER book_counts_ins AFTER INSERT ON books REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_counts_trigger();
+CREATE TRIGGER book_counts_upd AFTER UPDATE ON books REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_counts_trigger();
+CREATE TRIGGER book_counts_del AFTER DELETE ON books REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_counts_trigger();
+CREATE TRIGGER book_counts_trunc AFTER TRUNCATE ON books
+    FOR EACH STATEMENT EXECUTE FUNCTION book_counts_truncate();
+
+-- Початкове заповнення; SHARE блокує запис у books, поки рахуємо.
+LOCK TABLE books IN SHARE MODE;
+DELETE FROM book_counts_by_genre;
+DELETE FROM book_counts_by_owner;
+INSERT INTO book_counts_by_genre (genre, n) SELECT genre, COUNT(*) FROM books GROUP BY genre;
+INSERT INTO book_counts_by_owner (owner_id, n) SELECT owner_id, COUNT(*) FROM books GROUP BY owner_id;
@@ -0,0 +1,97 @@
+-- Зведена статистика каталогу для GET /books/stats.
+-- Тригери лише дописують агреговані зміни в book_stats_delta (без оновлення «гарячих» рядків),
+-- а app.stats періодично переносить їх у зведені таблиці; вік найстарішої зміни — це застарілість.
+CREATE TABLE IF NOT EXISTS book_stats_delta (
+    id             BIGSERIAL   PRIMARY KEY,
+    genre          genre_enum  NOT NULL,
+    published_year INT         NOT NULL,
+    author_id      INT         NOT NULL,
+    owner_id       INT         NOT NULL,
+    delta          INT         NOT NULL,
+    created_at     TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS book_stats_genre_year (
+    genre          genre_enum NOT NULL,
+    published_year INT        NOT NULL,
+    n              BIGINT     NOT NULL,
+    PRIMARY KEY (genre, published_year)
+);
+
+CREATE TABLE IF NOT EXISTS book_stats_author (
+    author_id INT        NOT NULL,
+    genre     genre_enum NOT NULL,
+    n         BIGINT     NOT NULL,
+    PRIMARY KEY (author_id, genre)
+);
+CREATE INDEX IF NOT EXISTS book_stats_author_n ON book_stats_author (n DESC);
+
+CREATE TABLE IF NOT EXISTS book_stats_owner (
+    owner_id INT        NOT NULL,
+    genre    genre_enum NOT NULL,
+    n        BIGINT     NOT NULL,
+    PRIMARY KEY (owner_id, genre)
+);
+
+CREATE TABLE IF NOT EXISTS book_stats_state (
+    id           BOOLEAN     PRIMARY KEY DEFAULT TRUE CHECK (id),
+    refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+INSERT INTO book_stats_state DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION book_stats_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO book_stats_delta (genre, published_year, author_id, owner_id, delta)
+        SELECT genre, published_year, author_id, owner_id, COUNT(*) FROM new_rows
+        GROUP BY genre, published_year, author_id, owner_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO book_stats_delta (genre, published_year, author_id, owner_id, delta)
+        SELECT genre, published_year, author_id, owner_id, -COUNT(*) FROM old_rows
+        GROUP BY genre, published_year, author_id, owner_id;
+    ELSE
+        INSERT INTO book_stats_delta (genre, published_year, author_id, owner_id, delta)
+        SELECT genre, published_year, author_id, owner_id, SUM(delta)
+        FROM (SELECT genre, published_year, author_id, owner_id, 1 AS delta FROM new_rows
+              UNION ALL
+              SELECT genre, published_year, author_id, owner_id, -1 FROM old_rows) d
+        GROUP BY genre, published_year, author_id, owner_id
+        HAVING SUM(delta) <> 0;
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION book_stats_truncate() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM book_stats_delta;
+    DELETE FROM book_stats_genre_year;
+    DELETE FROM book_stats_author;
+    DELETE FROM book_stats_owner;
+    UPDATE book_stats_state SET refreshed_at = NOW();
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS book_stats_ins ON books;
+DROP TRIGGER IF EXISTS book_stats_upd ON books;
+DROP TRIGGER IF EXISTS book_stats_del ON books;
+DROP TRIGGER IF EXISTS book_stats_trunc ON books;
+CREATE TRIGGER book_stats_ins AFTER INSERT ON books REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_stats_trigger();
+CREATE TRIGGER book_stats_upd AFTER UPDATE ON books REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_stats_trigger();
+CREATE TRIGGER book_stats_del AFTER DELETE ON books REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION book_stats_trigger();
+CREATE TRIGGER book_stats_trunc AFTER TRUNCATE ON books
+    FOR EACH STATEMENT EXECUTE FUNCTION book_stats_truncate();
+
+LOCK TABLE books IN SHARE MODE;
+DELETE FROM book_stats_delta;
+DELETE FROM book_stats_genre_year;
+DELETE FROM book_stats_author;
+DELETE FROM book_stats_owner;
+INSERT INTO book_stats_genre_year SELECT genre, published_year, COUNT(*) FROM books GROUP BY genre, published_year;
+INSERT INTO book_stats_author SELECT author_id, genre, COUNT(*) FROM books GROUP BY author_id, genre;
+INSERT INTO book_stats_owner SELECT owner_id, genre, COUNT(*) FROM books GROUP BY owner_id, genre;
+UPDATE book_stats_state SET refreshed_at = NOW();
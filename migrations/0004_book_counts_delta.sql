@@ -0,0 +1,42 @@
+-- Лічильники X-Total-Count — так само, як зведена статистика (0003): тригери лише дописують зміни
+-- в book_counts_delta, а не оновлюють рядок жанру, через який інакше проходив би кожен запис у books.
+-- app.counts переносить їх у book_counts_by_genre/_by_owner разом зі статистикою, а читання
+-- додає до базового рядка ще не перенесені зміни, тож кількість лишається точною.
+CREATE TABLE IF NOT EXISTS book_counts_delta (
+    id       BIGSERIAL  PRIMARY KEY,
+    genre    genre_enum NOT NULL,
+    owner_id INT        NOT NULL,
+    delta    INT        NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION book_counts_trigger() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO book_counts_delta (genre, owner_id, delta)
+        SELECT genre, owner_id, COUNT(*) FROM new_rows GROUP BY genre, owner_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO book_counts_delta (genre, owner_id, delta)
+        SELECT genre, owner_id, -COUNT(*) FROM old_rows GROUP BY genre, owner_id;
+    ELSE
+        INSERT INTO book_counts_delta (genre, owner_id, delta)
+        SELECT genre, owner_id, SUM(delta)
+        FROM (SELECT genre, owner_id, 1 AS delta FROM new_rows
+              UNION ALL
+              SELECT genre, owner_id, -1 FROM old_rows) d
+        GROUP BY genre, owner_id
+        HAVING SUM(delta) <> 0;
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION book_counts_truncate() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    DELETE FROM book_counts_delta;
+    DELETE FROM book_counts_by_genre;
+    DELETE FROM book_counts_by_owner;
+    RETURN NULL;
+END $$;
+
+DROP FUNCTION IF EXISTS book_counts_apply(genre_enum[], INT[], INT[]);
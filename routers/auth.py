@@ -1,50 +1,74 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
-from app.auth import Token, SignupIn, get_user_by_id, get_user_by_email
-from app.db import conn, get_dict_cursor
-from app.security import hash_pwd, verify_pwd, make_token, decode_token
+from app.auth import Token, SignupIn, get_user_by_id, get_user_by_email, token_entry, delete_user
+from app.adb import get_aconn, get_async_dict_cursor
+from app.security import hash_pwd_async, verify_and_rehash_async, make_token
 
 router = APIRouter(prefix="/auth", tags=['auth'])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
+oauth2_optional = OAuth2PasswordBearer(tokenUrl="/auth/token", auto_error=False)
 
 @router.post("/signup", status_code=201)
-def signup(payload: SignupIn):
-    with conn() as c, get_dict_cursor(c) as cur:
-        if get_user_by_email(cur, str(payload.email)):
+async def signup(payload: SignupIn, c=Depends(get_aconn)):
+    async with get_async_dict_cursor(c) as cur:
+        if await get_user_by_email(cur, str(payload.email)):
             raise HTTPException(status_code=409, detail="Користувач вже існує")
 
-        cur.execute(
+        await cur.execute(
             "INSERT INTO users(email, password_hash) VALUES (%s,%s)",
-            (payload.email, hash_pwd(payload.password)),
+            (payload.email, await hash_pwd_async(payload.password)),
         )
         return {"ok": True}
 
 @router.post("/token", response_model=Token)
-def login_for_access_token(form: OAuth2PasswordRequestForm = Depends()):
-    with conn() as c, get_dict_cursor(c) as cur:
-        user = get_user_by_email(cur, form.username)
-        if not user or not verify_pwd(form.password, user["password_hash"]):
+async def login_for_access_token(form: OAuth2PasswordRequestForm = Depends(), c=Depends(get_aconn)):
+    async with get_async_dict_cursor(c) as cur:
+        user = await get_user_by_email(cur, form.username)
+        if not user:
+            raise HTTPException(status_code=401, detail="Неправильний логін або пароль")
+        ok, new_hash = await verify_and_rehash_async(form.password, user["password_hash"])
+        if not ok:
             raise HTTPException(status_code=401, detail="Неправильний логін або пароль")
+        if new_hash:
+            await cur.execute("UPDATE users SET password_hash=%s WHERE id=%s", (new_hash, user["id"]))
         token = make_token(str(user['id']))
         return Token(access_token=token)
 
-def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
     try:
-        data = decode_token(token)
+        data = token_entry(token)["claims"]
         return int(data["sub"])
     except Exception:
         raise HTTPException(status_code=401, detail="Недійсний токен")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_optional_user_id(token: str | None = Depends(oauth2_optional)) -> int | None:
+    # Для публічних маршрутів: недійсний чи прострочений токен — як анонім; де вхід обов'язковий, 401 дає сам маршрут.
+    if token is None:
+        return None
     try:
-        payload = decode_token(token)
-        uid = int(payload["sub"])
+        return await get_current_user_id(token)
+    except HTTPException:
+        return None
+
+async def get_current_user(token: str = Depends(oauth2_scheme), c=Depends(get_aconn)):
+    try:
+        entry = token_entry(token)
+        uid = int(entry["claims"]["sub"])
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
-    with conn() as c, get_dict_cursor(c) as cur:
-        user = get_user_by_id(cur, uid)
+    if entry["user"] is not None:
+        return entry["user"]
+    async with get_async_dict_cursor(c) as cur:
+        user = await get_user_by_id(cur, uid)
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
-        return user
\ No newline at end of file
+        entry["user"] = user
+        return user
+
+@router.delete("/me")
+async def delete_me(user=Depends(get_current_user), c=Depends(get_aconn)):
+    async with get_async_dict_cursor(c) as cur:
+        await delete_user(cur, user["id"])
+    return {"ok": True}
@@ -1,151 +1,206 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request, Response
 from psycopg.errors import UniqueViolation
 from typing import List, Optional
 
-from app.books import BookIn, BookOut, Genre, get_or_create_author, row_to_out
+from app.books import (BookIn, BookOut, Genre, author_cte, remember_author, row_to_out,
+                       BOOK_COLUMNS, book_json, books_json,
+                       build_filters, keyset_page, encode_cursor, SORT_FIELD)
 from routers.auth import get_current_user_id
-from app.db import conn, get_dict_cursor
+from app.adb import get_aconn, get_async_dict_cursor
+from app.batch import BookBatch, BatchResult, run_batch
+from app.response_cache import list_key, book_key, lookup, store, respond, invalidate_books
+from app.counts import total_count
+from app.replicas import get_read_aconn, read_aconn, mark_write, from_primary, cacheable
 
 router = APIRouter(prefix="/books", tags=["books"])
 
 
 @router.post("", response_model=BookOut)
-def create_book(payload: BookIn, user_id: int = Depends(get_current_user_id)):
+async def create_book(payload: BookIn, user_id: int = Depends(get_current_user_id), c=Depends(get_aconn)):
+    cte, params = author_cte(payload.author)
     try:
-        with conn() as c, get_dict_cursor(c) as cur:
-            author_id = get_or_create_author(cur, payload.author)
-            cur.execute(
-                """INSERT INTO books(title, author_id, genre, published_year, owner_id)
-                   VALUES (%s,%s,%s,%s,%s)
-                   RETURNING id, title, %s AS author, genre, published_year""",
-                (payload.title, author_id, payload.genre.value, payload.published_year, user_id, payload.author),
+        async with get_async_dict_cursor(c) as cur:
+            await cur.execute(
+                f"""WITH {cte}, ins AS (
+                        INSERT INTO books(title, author_id, genre, published_year, owner_id)
+                        SELECT %(title)s, a.id, %(genre)s, %(year)s, %(owner_id)s FROM a
+                        RETURNING id, title, genre, published_year, author_id
+                    )
+                    SELECT ins.*, %(author)s AS author, a.created AS author_created FROM ins, a""",
+                {**params, "title": payload.title, "genre": payload.genre.value,
+                 "year": payload.published_year, "owner_id": user_id},
             )
-            return row_to_out(cur.fetchone())
+            r = await cur.fetchone()
+            remember_author(cur, payload.author, r["author_id"], r["author_created"])
     except UniqueViolation:
         raise HTTPException(status_code=409, detail="Книжка вже додана для цього автора і року")
+    invalidate_books()
+    mark_write(user_id)
+    return row_to_out(r)
+
+@router.post("/batch", response_model=List[BatchResult],
+             description="Створення/оновлення/видалення багатьох книг в одній транзакції; статус для кожної операції.")
+async def batch_books(payload: BookBatch, user_id: int = Depends(get_current_user_id), c=Depends(get_aconn)):
+    results, changed = await run_batch(c, payload, user_id)
+    if changed:
+        invalidate_books(*changed)
+        mark_write(user_id)
+    return results
 
 @router.get("", response_model=List[BookOut])
-def list_books(
+async def list_books(
+                request: Request,
                 search: Optional[str] = Query(None, description="Пошук за назвою/автором."),
                 author: Optional[str] = Query(None, description="Фільтр за автором."),
                 genre: Optional[Genre] = Query(None, description="Фільтр за жанром."),
                 year_from: Optional[int] = Query(None, ge=1800, description="Мінімальний рік."),
                 year_to: Optional[int] = Query(None, ge=1800, description="Максимальний рік."),
-                sort: str = Query("title", pattern="^(title|author|year)$", description="Сортування за полями."),
+                sort: str = Query("title", pattern="^(title|author|year|relevance)$",
+                                  description="Сортування за полями; relevance — найрелевантніші до search спочатку."),
                 order: str = Query("asc", pattern="^(asc|desc)$", description="Сортування за зростанням/спаданням."),
                 limit: int = Query(20, ge=1, le=100, description="Максимальна кількість книг у відповіді (пагінація)."),
                 offset: int = Query(0, ge=0, description="Кількість книг, які потрібно пропустити (зсув для пагінації)."),
+                cursor: Optional[str] = Query(None, description="Курсор наступної сторінки з заголовка X-Next-Cursor (замість offset)."),
+                count: Optional[str] = Query(None, pattern="^(exact|estimate)$",
+                                             description="Додати X-Total-Count: exact — точний COUNT (кешується), estimate — оцінка."),
                 ):
 
+    key = list_key("books", {"search": search, "author": author, "genre": genre.value if genre else None,
+                             "year_from": year_from, "year_to": year_to, "sort": sort, "order": order,
+                             "limit": limit, "offset": 0 if cursor else offset, "cursor": cursor, "count": count})
+    if (entry := lookup(key)) is not None:
+        return respond(request, entry)
 
-    sort_map = {"title": "b.title", "author": "a.name", "year": "b.published_year"}
-    order_kw = "ASC" if order == "asc" else "DESC"
-
-    where = []
-    args = []
-
-    if search:
-        where.append("(b.title ILIKE %s OR a.name ILIKE %s)")
-        args += [f"%{search}%", f"%{search}%"]
-    if author:
-        where.append("a.name ILIKE %s")
-        args.append(f"%{author}%")
-
-    if genre:
-        where.append("b.genre = %s")
-        args.append(genre.value)
-
-    if year_from is not None:
-        where.append("b.published_year >= %s")
-        args.append(year_from)
-
-    if year_to is not None:
-        where.append("b.published_year <= %s")
-        args.append(year_to)
-
+    where, args = build_filters(search, author, genre, year_from, year_to)
+    count_where, count_args = list(where), list(args)
+    try:
+        order_by = keyset_page(where, args, sort, order, cursor, search)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     sql = f"""
-            SELECT b.id, b.title, a.name AS author, b.genre, b.published_year
+            SELECT {BOOK_COLUMNS}
             FROM books b
             JOIN authors a ON a.id = b.author_id
             {"WHERE " + " AND ".join(where) if where else ""}
-            ORDER BY {sort_map[sort]} {order_kw}
+            {order_by}
             LIMIT %s OFFSET %s
         """
-    args += [limit, offset]
-
-    with conn() as c, get_dict_cursor(c) as cur:
-        cur.execute(sql, args)
-        rows = cur.fetchall()
-        return [BookOut(**r) for r in rows]
+    args += [limit + 1, 0 if cursor else offset]
+
+    # З'єднання — лише після промаху кешу: влучання і 304 не займають пул.
+    async with read_aconn(request) as c, get_async_dict_cursor(c) as cur:
+        await cur.execute(sql, args)
+        rows = await cur.fetchall()
+        rows, headers = page_rows(rows, limit, sort)
+        if count:
+            headers.update(await total_count(cur, count, count_where, count_args, {
+                "search": search, "author": author, "genre": genre.value if genre else None,
+                "year_from": year_from, "year_to": year_to}, cache=from_primary(request)))
+    return respond(request, store(key, books_json(rows), headers=headers, cache=cacheable(request, key)))
+
+@router.get("/by-owner", response_model=List[BookOut], description="Повертає книги поточного користувача (за owner_id) посторінково.")
+async def list_my_books(
+                user_id: int = Depends(get_current_user_id),
+                limit: int = Query(100, ge=1, le=1000, description="Максимальна кількість книг у відповіді."),
+                cursor: Optional[str] = Query(None, description="Курсор наступної сторінки з заголовка X-Next-Cursor."),
+                count: Optional[str] = Query(None, pattern="^(exact|estimate)$",
+                                             description="Додати X-Total-Count: exact — точний COUNT (кешується), estimate — оцінка."),
+                c=Depends(get_read_aconn),
+                ):
+    where, args = ["b.owner_id = %s"], [user_id]
+    try:
+        order_by = keyset_page(where, args, "title", "asc", cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/by-owner", response_model=List[BookOut], description="Повертає всі книги поточного користувача (за owner_id).")
-def list_my_books(user_id: int = Depends(get_current_user_id)):
-    sql = """
-        SELECT b.id, b.title, a.name AS author, b.genre, b.published_year
+    sql = f"""
+        SELECT {BOOK_COLUMNS}
         FROM books b
         JOIN authors a ON a.id = b.author_id
-        WHERE b.owner_id = %s
-        ORDER BY b.title
+        WHERE {" AND ".join(where)}
+        {order_by}
+        LIMIT %s
     """
-    with conn() as c, get_dict_cursor(c) as cur:
-        cur.execute(sql, (user_id,))
-        rows = cur.fetchall()
-        return [row_to_out(r) for r in rows]
+    async with get_async_dict_cursor(c) as cur:
+        await cur.execute(sql, args + [limit + 1])
+        rows = await cur.fetchall()
+        rows, headers = page_rows(rows, limit, "title")
+        if count:
+            headers.update(await total_count(cur, count, ["b.owner_id = %s"], [user_id], {"owner_id": user_id}))
+    return Response(content=books_json(rows), media_type="application/json", headers=headers)
+
+def page_rows(rows: list, limit: int, sort: str) -> tuple[list, dict]:
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if sort in SORT_FIELD:
+            headers["X-Next-Cursor"] = encode_cursor(rows[-1], sort)
+    return rows, headers
 
 @router.get("/id/{book_id}", response_model=BookOut)
-def get_book(book_id: int):
-    with conn() as c, get_dict_cursor(c) as cur:
-        cur.execute(
-            """SELECT b.id, b.title, a.name AS author, b.genre, b.published_year
-               FROM books b
-               JOIN authors a ON a.id = b.author_id
-               WHERE b.id = %s""",
+async def get_book(book_id: int, request: Request):
+    key = book_key(book_id)
+    if (entry := lookup(key)) is not None:
+        return respond(request, entry)
+    async with read_aconn(request) as c, get_async_dict_cursor(c) as cur:
+        await cur.execute(
+            f"""SELECT {BOOK_COLUMNS}
+                FROM books b
+                JOIN authors a ON a.id = b.author_id
+                WHERE b.id = %s""",
             (book_id,),
         )
-        r = cur.fetchone()
+        r = await cur.fetchone()
         if not r:
             raise HTTPException(status_code=404, detail="Не знайдено")
-        return row_to_out(r)
+    return respond(request, store(key, book_json(r), cache=cacheable(request, key)))
 
 @router.put("/{book_id}", response_model=BookOut)
-def update_book(book_id: int, payload: BookIn, user_id: int = Depends(get_current_user_id)):
-    with conn() as c, get_dict_cursor(c) as cur:
-        cur.execute("SELECT owner_id FROM books WHERE id=%s", (book_id,))
-        row = cur.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="Книга не знайдена.")
-
-        if row['owner_id'] != user_id:
-            raise HTTPException(status_code=403, detail="У доступі відмовлено.")
-
-        author_id = get_or_create_author(cur, payload.author)
-        cur.execute(
-            """UPDATE books
-               SET title=%s, author_id=%s, genre=%s, published_year=%s
-               WHERE id=%s
-               RETURNING id""",
-            (payload.title, author_id, payload.genre.value, payload.published_year, book_id),
-        )
-
-        cur.execute(
-            """SELECT b.id, b.title, a.name AS author, b.genre, b.published_year
-               FROM books b
-               JOIN authors a ON a.id = b.author_id
-               WHERE b.id = %s""",
-            (book_id,),
-        )
-        return row_to_out(cur.fetchone())
+async def update_book(book_id: int, payload: BookIn, user_id: int = Depends(get_current_user_id), c=Depends(get_aconn)):
+    # Один запит: власника перевіряє сам UPDATE, а target відрізняє 404 від 403.
+    cte, params = author_cte(payload.author, guard="WHERE EXISTS (SELECT 1 FROM target WHERE owner_id = %(owner_id)s)")
+    try:
+        async with get_async_dict_cursor(c) as cur:
+            await cur.execute(
+                f"""WITH target AS (SELECT owner_id FROM books WHERE id = %(id)s), {cte}, upd AS (
+                        UPDATE books b
+                        SET title = %(title)s, author_id = a.id, genre = %(genre)s, published_year = %(year)s
+                        FROM a
+                        WHERE b.id = %(id)s AND b.owner_id = %(owner_id)s
+                        RETURNING b.id, b.title, b.genre, b.published_year, b.author_id, a.created AS author_created
+                    )
+                    SELECT target.owner_id, upd.*, %(author)s AS author
+                    FROM (SELECT 1) one LEFT JOIN target ON TRUE LEFT JOIN upd ON TRUE""",
+                {**params, "id": book_id, "owner_id": user_id, "title": payload.title,
+                 "genre": payload.genre.value, "year": payload.published_year},
+            )
+            r = await cur.fetchone()
+    except UniqueViolation:
+        raise HTTPException(status_code=409, detail="Книжка вже додана для цього автора і року")
+    if r["owner_id"] is None:
+        raise HTTPException(status_code=404, detail="Книга не знайдена.")
+    if r["id"] is None:
+        raise HTTPException(status_code=403, detail="У доступі відмовлено.")
+    remember_author(cur, payload.author, r["author_id"], r["author_created"])
+    invalidate_books(book_id)
+    mark_write(user_id)
+    return row_to_out(r)
 
 @router.delete("/{book_id}")
-def delete_book(book_id: int, user_id: int = Depends(get_current_user_id)):
-    with conn() as c, get_dict_cursor(c) as cur:
-        cur.execute("SELECT owner_id FROM books WHERE id=%s", (book_id,))
-        row = cur.fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail="Книга не знайдена")
-        if row["owner_id"] != user_id:
-            raise HTTPException(status_code=403, detail="Немає доступу")
-
-        cur.execute("DELETE FROM books WHERE id=%s", (book_id,))
-    return {"ok": True}
\ No newline at end of file
+async def delete_book(book_id: int, user_id: int = Depends(get_current_user_id), c=Depends(get_aconn)):
+    async with get_async_dict_cursor(c) as cur:
+        await cur.execute(
+            """WITH target AS (SELECT owner_id FROM books WHERE id = %(id)s),
+                    del AS (DELETE FROM books WHERE id = %(id)s AND owner_id = %(owner_id)s RETURNING id)
+               SELECT (SELECT owner_id FROM target) AS owner_id, (SELECT id FROM del) AS id""",
+            {"id": book_id, "owner_id": user_id},
+        )
+        r = await cur.fetchone()
+    if r["owner_id"] is None:
+        raise HTTPException(status_code=404, detail="Книга не знайдена")
+    if r["id"] is None:
+        raise HTTPException(status_code=403, detail="Немає доступу")
+    invalidate_books(book_id)
+    mark_write(user_id)
+    return {"ok": True}
@@ -1,16 +1,72 @@
 from typing import Optional, Literal
-from fastapi import APIRouter, Query
-from fastapi.responses import JSONResponse, StreamingResponse
-import csv, io
+from fastapi import APIRouter, Query, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+import csv, io, time, itertools
 
-from app.db import conn, get_dict_cursor
-from app.books import Genre, row_to_out
+from psycopg.rows import dict_row
+from starlette.concurrency import run_in_threadpool
+
+from app.replicas import read_conn, cacheable
+from app.query_log import SLOW_QUERY_SECONDS, slow_sync
+from app.books import Genre, book_json, books_json
+from routers.auth import get_optional_user_id
+from app.response_cache import list_key, lookup, store, respond
 
 router = APIRouter(prefix="/books", tags=["books"])
 
+EXPORT_FIELDS = ["id", "title", "author", "genre", "published_year"]
+EXPORT_BATCH = 1000
+MEDIA_TYPES = {"json": "application/json", "ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _csv_rows(rows, header: bool = False) -> bytes:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS)
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buf.getvalue().encode("utf-8")
+
+def stream_rows(request: Request, sql: str, args: list, explain: bool = True):
+    """Читає рядки через серверний курсор пачками по EXPORT_BATCH, не тримаючи весь результат у пам'яті.
+
+    explain=False — без EXPLAIN ANALYZE у журналі повільних запитів (для bulk він пройшов би всю таблицю ще раз).
+    """
+    with read_conn(request) as c, c.transaction():
+        with c.cursor(name="books_export", row_factory=dict_row) as cur:
+            cur.itersize = EXPORT_BATCH
+            started = time.perf_counter()
+            cur.execute(sql, args)
+            rows = cur.fetchmany(EXPORT_BATCH)
+            # Серверний курсор: execute лише оголошує його, тож міряємо до першої пачки — далі час
+            # залежить від того, як швидко клієнт забирає відповідь.
+            seconds = time.perf_counter() - started
+            if seconds >= SLOW_QUERY_SECONDS:
+                slow_sync(cur, sql, args, seconds, explain=explain)
+            while rows:
+                yield rows
+                rows = cur.fetchmany(EXPORT_BATCH)
+
+def render(export_format: str, batches):
+    if export_format == "csv":
+        yield _csv_rows([], header=True)
+        for rows in batches:
+            yield _csv_rows(rows)
+    elif export_format == "ndjson":
+        for rows in batches:
+            yield b"".join(book_json(r) + b"\n" for r in rows)
+    else:
+        yield b"["
+        first = True
+        for rows in batches:
+            chunk = books_json(rows)[1:-1]
+            yield chunk if first else b"," + chunk
+            first = False
+        yield b"]"
+
 @router.get("/export")
-def export_books(
-    export_format: Literal["json", "csv"] = Query(
+async def export_books(
+    request: Request,
+    export_format: Literal["json", "csv", "ndjson"] = Query(
         "json",
         alias="format",
         description="Формат експорту"
@@ -18,38 +74,48 @@ def export_books(
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
     genre: Optional[Genre] = Query(None),
+    bulk: bool = Query(False, description="Експорт усіх книг без limit/offset (лише для авторизованих)."),
+    user_id: Optional[int] = Depends(get_optional_user_id),
 ):
+    if bulk and user_id is None:
+        raise HTTPException(status_code=401, detail="Повний експорт доступний лише авторизованим користувачам")
+
+    # Посторінковий експорт обмежений 1000 рядків — його можна кешувати цілком; bulk завжди стрімиться.
+    key = None
+    if not bulk:
+        key = list_key("export", {"format": export_format, "limit": limit, "offset": offset,
+                                  "genre": genre.value if genre else None})
+        if (entry := lookup(key)) is not None:
+            return respond(request, entry)
+
     where, args = [], []
     if genre:
         where.append("b.genre = %s")
         args.append(genre.value)
 
     sql = f"""
-        SELECT b.id, b.title, a.name AS author, b.genre::text AS genre, b.published_year
+        SELECT b.title, a.name AS author, b.genre::text AS genre, b.published_year, b.id
         FROM books b
         JOIN authors a ON a.id = b.author_id
         {"WHERE " + " AND ".join(where) if where else ""}
-        ORDER BY b.title
-        LIMIT %s OFFSET %s
+        ORDER BY lower(b.title), b.id
+        {"" if bulk else "LIMIT %s OFFSET %s"}
     """
-    args += [limit, offset]
-
-    with conn() as c, get_dict_cursor(c) as cur:
-        cur.execute(sql, args)
-        rows = cur.fetchall()
+    if not bulk:
+        args += [limit, offset]
 
-    if export_format == "json":
-        return JSONResponse(content=[row_to_out(r).model_dump() for r in rows])
-
-
-    buf = io.StringIO()
-    writer = csv.DictWriter(buf, fieldnames=["id", "title", "author", "genre", "published_year"])
-    writer.writeheader()
-    for r in rows:
-        writer.writerow(row_to_out(r).model_dump())
-    buf.seek(0)
+    headers = {}
+    if export_format != "json":
+        headers["Content-Disposition"] = f'attachment; filename="books.{export_format}"'
+    if key is not None:
+        body = await run_in_threadpool(lambda: b"".join(render(export_format, stream_rows(request, sql, args))))
+        return respond(request, store(key, body, MEDIA_TYPES[export_format], headers, cache=cacheable(request, key)))
+    # Перша пачка читається ще до заголовків: так недоступна репліка замінюється основною БД,
+    # а помилка запиту стає звичайною відповіддю 5xx, а не обірваним потоком після 200.
+    batches = stream_rows(request, sql, args, explain=not bulk)
+    first = await run_in_threadpool(next, batches, None)
     return StreamingResponse(
-        iter([buf.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": 'attachment; filename="books.csv"'},
-    )
\ No newline at end of file
+        render(export_format, itertools.chain([first] if first else [], batches)),
+        media_type=MEDIA_TYPES[export_format],
+        headers=headers,
+    )
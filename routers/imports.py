@@ -1,17 +1,45 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from uuid import UUID
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from routers.auth import get_current_user_id
+from app.db import get_conn, get_dict_cursor
 from app.imports import parse_upload, import_books_items
+from app.jobs import enqueue_upload, get_job, cancel_job
 
 router = APIRouter(prefix="/books", tags=["books"])
 
 @router.post("/import")
 async def import_books(file: UploadFile = File(..., description="JSON або CSV з книгами"),
-                       user_id: int = Depends(get_current_user_id)):
-    raw = await file.read()
+                       background: bool = Query(False, description="Імпортувати у фоні: одразу повертає job_id (202)."),
+                       user_id: int = Depends(get_current_user_id),
+                       c=Depends(get_conn)):
+    if background:
+        job_id = await run_in_threadpool(enqueue_upload, c, user_id, file.filename or "", file.content_type, file.file)
+        return JSONResponse(status_code=202, content={"ok": True, "job_id": job_id, "status": "queued"})
+
     try:
-        items = parse_upload(file.filename or "", file.content_type, raw)
+        items = await run_in_threadpool(parse_upload, file.filename or "", file.content_type, file.file)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    created, skipped, errors = import_books_items(items, user_id)
-    return {"ok": True, "created": created, "skipped": skipped, "errors": errors[:200]}
\ No newline at end of file
+    created, skipped, errors = await run_in_threadpool(import_books_items, c, items, user_id)
+    return {"ok": True, "created": created, "skipped": skipped, "errors": errors[:200]}
+
+@router.get("/import/jobs/{job_id}", description="Прогрес фонового імпорту.")
+def get_import_job(job_id: UUID, user_id: int = Depends(get_current_user_id), c=Depends(get_conn)):
+    with get_dict_cursor(c) as cur:
+        job = get_job(cur, str(job_id), user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задачу не знайдено")
+    return job
+
+@router.post("/import/jobs/{job_id}/cancel", description="Скасування фонового імпорту (після поточної пачки).")
+def cancel_import_job(job_id: UUID, user_id: int = Depends(get_current_user_id), c=Depends(get_conn)):
+    with get_dict_cursor(c) as cur:
+        job = cancel_job(cur, str(job_id), user_id) or get_job(cur, str(job_id), user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Задачу не знайдено")
+    if not job["cancel_requested"]:
+        raise HTTPException(status_code=409, detail=f"Задача вже завершена ({job['status']})")
+    return job
@@ -0,0 +1,27 @@
+from typing import Optional
+from fastapi import APIRouter, Query, Depends, HTTPException
+
+from app.books import Genre
+from app.adb import get_aconn, get_async_dict_cursor
+from app.stats import catalogue_stats, refresh_stats
+
+router = APIRouter(prefix="/books", tags=["books"])
+
+@router.get("/stats", description="Кількість книг за жанром, роком, десятиліттям, автором або власником зі зведених таблиць. "
+                                  "stale_seconds — вік найстарішої ще не врахованої зміни.")
+async def books_stats(
+                group_by: str = Query("genre", pattern="^(genre|year|decade|author|owner)$", description="Групування."),
+                genre: Optional[Genre] = Query(None, description="Фільтр за жанром."),
+                year_from: Optional[int] = Query(None, ge=1800, description="Мінімальний рік (для genre/year/decade)."),
+                year_to: Optional[int] = Query(None, ge=1800, description="Максимальний рік (для genre/year/decade)."),
+                limit: int = Query(100, ge=1, le=1000, description="Максимальна кількість груп (для author/owner — найбільші)."),
+                refresh: bool = Query(False, description="Спершу врахувати всі накопичені зміни."),
+                c=Depends(get_aconn),
+                ):
+    async with get_async_dict_cursor(c) as cur:
+        if refresh:
+            await refresh_stats(cur, wait=True)
+        try:
+            return await catalogue_stats(cur, group_by, genre.value if genre else None, year_from, year_to, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
@@ -37,6 +37,25 @@ CREATE TABLE IF NOT EXISTS books (
     )
 );
 
+-- Фонові задачі імпорту
+CREATE TABLE IF NOT EXISTS import_jobs (
+    id               UUID        PRIMARY KEY DEFAULT gen_random_uuid(),
+    owner_id         INT         NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    filename         TEXT        NOT NULL,
+    content_type     TEXT,
+    spool_path       TEXT        NOT NULL,
+    status           TEXT        NOT NULL DEFAULT 'queued',
+    rows_processed   INT         NOT NULL DEFAULT 0,
+    created          INT         NOT NULL DEFAULT 0,
+    skipped          INT         NOT NULL DEFAULT 0,
+    errors           JSONB       NOT NULL DEFAULT '[]',
+    error            TEXT,
+    cancel_requested BOOLEAN     NOT NULL DEFAULT FALSE,
+    created_at       TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at       TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CONSTRAINT import_jobs_status_check CHECK (status IN ('queued','running','done','failed','cancelled'))
+);
+
 -- View для SELECT
 CREATE OR REPLACE VIEW books_view AS
 SELECT
@@ -47,4 +66,10 @@ SELECT
     b.published_year,
     b.created_at
 FROM books b
-JOIN authors a ON a.id = b.author_id;
\ No newline at end of file
+JOIN authors a ON a.id = b.author_id;
+
+-- Пошук за підрядком (ILIKE '%...%') по назві та автору
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS books_title_trgm ON books USING gin (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS authors_name_trgm ON authors USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS books_author_id ON books (author_id);
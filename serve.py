@@ -0,0 +1,192 @@
+"""Продакшн-запуск: кілька воркерів, uvloop/httptools, плавна зупинка і preload.
+
+    python serve.py --workers 4 --preload
+    python serve.py --startup-report --budget-ms 1500
+
+Майстер відкриває сокет і запускає воркери через fork. З preload застосунок імпортується один раз
+у майстрі, тож воркер стартує без повторного імпорту FastAPI, pydantic і роутерів; пули з'єднань
+відкриваються вже у lifespan кожного воркера. SIGTERM/SIGINT майстер передає воркерам: ті
+перестають приймати з'єднання, чекають на запити в обробці до SERVER_GRACEFUL_TIMEOUT с і закривають
+пули та фонові задачі. Воркер, що впав, перезапускається.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import traceback
+import subprocess
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS") or os.cpu_count() or 1)
+SERVER_PRELOAD = os.getenv("SERVER_PRELOAD", "1") == "1"
+SERVER_GRACEFUL_TIMEOUT = float(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "2000"))
+
+APP = "main:app"
+PROJECT_MODULES = ("main", "app", "routers")
+
+
+def server_config(app, host: str, port: int) -> uvicorn.Config:
+    # loop/http="auto" беруть uvloop і httptools, якщо вони встановлені (uvloop немає на Windows).
+    return uvicorn.Config(app, host=host, port=port, loop="auto", http="auto", lifespan="on",
+                          proxy_headers=True, backlog=SERVER_BACKLOG,
+                          timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT)
+
+
+def _worker(sock, app, host: str, port: int):
+    # Своя група процесів: Ctrl+C у терміналі отримує лише майстер, а воркер — один SIGTERM від нього.
+    # Друге повідомлення uvicorn вважав би вимогою зупинитися негайно.
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    uvicorn.Server(server_config(app, host, port)).run(sockets=[sock])
+
+
+def _spawn(sock, app, host: str, port: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _worker(sock, app, host, port)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(workers: int, preload: bool, host: str, port: int):
+    if not hasattr(os, "fork"):
+        # Windows: воркери uvicorn через spawn, кожен імпортує застосунок сам.
+        uvicorn.run(APP, host=host, port=port, workers=workers, loop="auto", http="auto",
+                    timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT)
+        return
+
+    sock = server_config(APP, host, port).bind_socket()
+    app = APP
+    if preload:
+        started = time.perf_counter()
+        from main import app
+        print(f"[serve] preloaded {APP} in {(time.perf_counter() - started) * 1000:.0f} ms", flush=True)
+
+    children = {_spawn(sock, app, host, port) for _ in range(workers)}
+    print(f"[serve] {workers} workers on {host}:{port}: {sorted(children)}", flush=True)
+    stopping = threading.Event()
+
+    def kill_leftovers():
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def stop(signum, frame):
+        if stopping.is_set():
+            return
+        stopping.set()
+        print(f"[serve] {signal.Signals(signum).name}: draining workers", flush=True)
+        # Інакше нові з'єднання й далі ставали б у чергу сокета майстра і скидалися б на виході.
+        sock.close()
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        # uvicorn сам обмежує очікування запитів; запас — на lifespan shutdown.
+        timer = threading.Timer(SERVER_GRACEFUL_TIMEOUT + 10, kill_leftovers)
+        timer.daemon = True
+        timer.start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        _mark_dead(pid)
+        if not stopping.is_set():
+            print(f"[serve] worker {pid} exited with {os.waitstatus_to_exitcode(status)}, restarting", flush=True)
+            time.sleep(1)
+            children.add(_spawn(sock, app, host, port))
+
+
+def _mark_dead(pid: int):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
+
+
+def import_times() -> tuple[float, list[dict]]:
+    """Час імпорту кожного модуля за `python -X importtime` у чистому процесі (як холодний старт воркера)."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {APP.split(':')[0]}"],
+                         capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        modules.append({"module": name.strip(), "self_ms": int(self_us) / 1000,
+                        "cumulative_ms": int(cumulative_us) / 1000})
+    total = next(m["cumulative_ms"] for m in modules if m["module"] == APP.split(":")[0])
+    return total, modules
+
+
+def lifespan_ms() -> float:
+    """Час lifespan startup: відкриття пулів, прогрів кешу авторів, відновлення задач імпорту."""
+    import asyncio
+    from main import app
+
+    async def run() -> float:
+        started = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            elapsed = time.perf_counter() - started
+        return elapsed * 1000
+
+    return asyncio.run(run())
+
+
+def startup_report(budget_ms: float, top: int) -> dict:
+    total, modules = import_times()
+    ours = [m for m in modules if m["module"].split(".")[0] in PROJECT_MODULES]
+    startup = lifespan_ms()
+    return {
+        "import_ms": round(total, 1),
+        "lifespan_ms": round(startup, 1),
+        "total_ms": round(total + startup, 1),
+        "budget_ms": budget_ms,
+        "ok": total + startup <= budget_ms,
+        "project_modules": sorted(ours, key=lambda m: m["self_ms"], reverse=True),
+        "heaviest_modules": sorted(modules, key=lambda m: m["self_ms"], reverse=True)[:top],
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Продакшн-сервер Book Manager")
+    ap.add_argument("--host", default=SERVER_HOST)
+    ap.add_argument("--port", type=int, default=SERVER_PORT)
+    ap.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    ap.add_argument("--preload", action=argparse.BooleanOptionalAction, default=SERVER_PRELOAD)
+    ap.add_argument("--startup-report", action="store_true", help="лише звіт про час старту (JSON) і вихід")
+    ap.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    ap.add_argument("--top", type=int, default=15)
+    args = ap.parse_args()
+
+    if args.startup_report:
+        report = startup_report(args.budget_ms, args.top)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        sys.exit(0 if report["ok"] else 1)
+    serve(args.workers, args.preload, args.host, args.port)
@@ -7,6 +7,14 @@ from fastapi.testclient import TestClient
 load_dotenv()
 TEST_DB = os.getenv("DBNAME_TEST", "books_test")
 os.environ["DBNAME"] = TEST_DB  # щоб app/db.py підключився до тестової бази
+# «Репліка» — та сама тестова БД під іншим application_name: читання йдуть через маршрутизацію реплік
+os.environ.setdefault("PG_REPLICAS", "application_name=books-replica")
+# Обмеження навантаження вимкнене за замовчуванням — у тестах вмикаємо, щоб перевірити і його.
+os.environ.setdefault("ADMISSION_ENABLED", "1")
+# Усі тести входять з одного IP «testclient» — ліміт входів на IP тут лише заважав би
+os.environ.setdefault("ADMIT_AUTH_RATE", "0")
+# Журнал повільних запитів доступний лише з цим токеном
+os.environ.setdefault("ADMIN_TOKEN", "test-admin")
 
 # 2) Ініціалізуємо БД (створення БД і накочення schema.sql)
 from init_db import create_database, apply_schema
@@ -15,11 +23,16 @@ apply_schema()
 
 from main import app
 from app.db import conn, get_dict_cursor
+from app.auth import token_cache
+from app.books import author_cache
+from app.response_cache import response_cache
+from app.counts import count_cache
 
 
 @pytest.fixture(scope="session")
 def client():
-    return TestClient(app)
+    with TestClient(app) as c:
+        yield c
 
 
 @pytest.fixture(autouse=True)
@@ -28,6 +41,10 @@ def clean_db():
         cur.execute("DELETE FROM books;")
         cur.execute("DELETE FROM authors;")
         cur.execute("DELETE FROM users;")
+    token_cache.clear()
+    author_cache.clear()
+    response_cache.clear()
+    count_cache.clear()
     yield
 
 def _signup_and_token(client: TestClient, email="u1@example.com", pwd="Qa123456!"):
@@ -1,5 +1,9 @@
+import pytest
 from fastapi.testclient import TestClient
 
+from app.db import conn, get_dict_cursor
+from app.metrics import METRICS_ENABLED
+
 BOOK = {"title": "Moby-Dick", "author": "Herman Melwille", "genre": "Fiction", "published_year": 1851}
 
 def test_public_list_empty_ok(client: TestClient):
@@ -46,4 +50,237 @@ def test_duplicate_conflict(client: TestClient, auth_headers):
     r1 = client.post("/books", headers=auth_headers, json=BOOK)
     assert r1.status_code == 200
     r2 = client.post("/books", headers=auth_headers, json=BOOK)
-    assert r2.status_code == 409
\ No newline at end of file
+    assert r2.status_code == 409
+
+def test_status_pool(client: TestClient):
+    r = client.get("/status/pool")
+    assert r.status_code == 200
+    body = r.json()
+    for name in ("sync", "async"):
+        assert body[name]["open"] is True
+        assert body[name]["pool_max"] >= body[name]["pool_min"]
+
+def test_readiness_and_metrics(client: TestClient, auth_headers):
+    r = client.get("/status")
+    assert r.status_code == 200
+    assert r.json()["ok"] and r.json()["db"]["ok"] and r.json()["pool"]["ok"]
+
+    book_id = client.post("/books", headers=auth_headers, json=BOOK).json()["id"]
+    client.get(f"/books/id/{book_id}")
+    if not METRICS_ENABLED:
+        assert client.get("/metrics").status_code == 404
+        return
+    text = client.get("/metrics").text
+    # Мітка маршруту — шаблон, а не конкретний шлях.
+    assert 'route="/books/id/{book_id}",status="200"' in text
+    assert 'book_manager_db_query_seconds_count{pool="async"}' in text
+    assert 'book_manager_db_acquire_seconds_count{pool="async"}' in text
+    assert 'book_manager_hashing_seconds_count{op="hash_pwd"}' in text
+    assert "book_manager_token_cache_hit_ratio" in text
+
+
+def test_login_rehashes_outdated_cost(client: TestClient):
+    from passlib.context import CryptContext
+    from app.security import BCRYPT_ROUNDS
+
+    pwd = "Qa123456!"
+    client.post("/auth/signup", json={"email": "old@example.com", "password": pwd})
+    weak = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(pwd)
+    with conn() as c, get_dict_cursor(c) as cur:
+        cur.execute("UPDATE users SET password_hash=%s WHERE email=%s", (weak, "old@example.com"))
+
+    r = client.post("/auth/token", data={"username": "old@example.com", "password": pwd})
+    assert r.status_code == 200
+
+    with conn() as c, get_dict_cursor(c) as cur:
+        cur.execute("SELECT password_hash FROM users WHERE email=%s", ("old@example.com",))
+        assert cur.fetchone()["password_hash"].startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+
+def test_login_503_when_hash_queue_full(client: TestClient, monkeypatch):
+    import app.security
+    client.post("/auth/signup", json={"email": "x@example.com", "password": "Qa123456!"})
+    monkeypatch.setattr(app.security, "HASH_QUEUE_MAX", 0)
+    r = client.post("/auth/token", data={"username": "x@example.com", "password": "Qa123456!"})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+
+def test_admission_limits(client: TestClient, auth_headers, monkeypatch):
+    from app import admission
+    if not admission.ADMISSION_ENABLED:
+        pytest.skip("ADMISSION_ENABLED=0")
+    monkeypatch.setattr(admission, "buckets", admission.MemoryBuckets(100))
+    monkeypatch.setattr(admission.limits["export"], "rate", 1.0)
+    monkeypatch.setattr(admission.limits["export"], "burst", 2.0)
+
+    # Анонімні — відро на IP, авторизований користувач — своє.
+    codes = [client.get("/books/export").status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+    r = client.get("/books/export")
+    assert r.status_code == 429 and int(r.headers["Retry-After"]) >= 1
+    assert client.get("/books/export", headers=auth_headers).status_code == 200
+
+    # Клас зайнятий повністю — 503 одразу; перевірки готовності не обмежуються.
+    monkeypatch.setattr(admission.limits["write"], "concurrency", 0)
+    r = client.post("/books", headers=auth_headers, json=BOOK)
+    assert r.status_code == 503 and r.headers["Retry-After"] == "1"
+    assert client.get("/status").status_code == 200
+    stats = client.get("/status/admission").json()
+    assert stats["export_limited"] >= 2 and stats["write_busy"] >= 1
+
+class FakeRedis:
+    """Спільне сховище відер, як один Redis для кількох воркерів; down — сервер недоступний."""
+
+    def __init__(self):
+        self.tokens = {}
+        self.down = False
+
+    def register_script(self, script):
+        async def run(keys, args):
+            if self.down:
+                raise ConnectionError("redis down")
+            rate, burst = args
+            tokens = self.tokens.get(keys[0], burst)
+            if tokens >= 1:
+                self.tokens[keys[0]] = tokens - 1
+                return b"0"
+            return str((1 - tokens) / rate).encode()
+        return run
+
+def test_admission_shared_redis_buckets(client: TestClient, monkeypatch):
+    from app import admission
+    if not admission.ADMISSION_ENABLED:
+        pytest.skip("ADMISSION_ENABLED=0")
+    fake = FakeRedis()
+    # Два «воркери» з одним Redis ділять ліміт: третій запит відхиляє вже інший воркер.
+    workers = [admission.RedisBuckets("", client=fake) for _ in range(2)]
+    monkeypatch.setattr(admission.limits["export"], "rate", 1.0)
+    monkeypatch.setattr(admission.limits["export"], "burst", 2.0)
+    codes = []
+    for worker in (0, 1, 0):
+        monkeypatch.setattr(admission, "buckets", workers[worker])
+        codes.append(client.get("/books/export").status_code)
+    assert codes == [200, 200, 429]
+
+    fake.down = True
+    assert client.get("/books/export").status_code == 200
+    stats = client.get("/status/admission").json()
+    assert stats["backend"] == "redis" and stats["backend_errors"] == 1
+
+def test_token_cache_and_delete_me(client: TestClient, auth_headers):
+    before = client.get("/status/token-cache").json()
+    client.post("/books", headers=auth_headers, json=BOOK)
+    client.get("/books/by-owner", headers=auth_headers)
+    client.get("/books/by-owner", headers=auth_headers)
+    after = client.get("/status/token-cache").json()
+    assert after["hits"] >= before["hits"] + 2
+
+    r = client.delete("/auth/me", headers=auth_headers)
+    assert r.status_code == 200
+    r = client.delete("/auth/me", headers=auth_headers)
+    assert r.status_code == 401
+
+def test_response_cache_etag_and_invalidation(client: TestClient, auth_headers, monkeypatch):
+    from app import replicas
+    # Без фонових перевірок реплік не відомо, чи репліка вже відтворила запис, — її читання не кешуються.
+    async def no_check():
+        pass
+    monkeypatch.setattr(replicas, "check_replicas", no_check)
+    bid = client.post("/books", headers=auth_headers, json=BOOK).json()["id"]
+
+    r = client.get(f"/books/id/{bid}")
+    etag = r.headers["ETag"]
+    r = client.get(f"/books/id/{bid}", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+
+    # Анонімні читання йдуть на репліку і в кеш поки не потрапляють; автор щойно писав —
+    # читає з основної БД, і вже його відповідь кешується.
+    before = client.get("/status/response-cache").json()["hits"]
+    for headers in (None, None, auth_headers, auth_headers):
+        lst = client.get("/books", headers=headers)
+        assert [b["id"] for b in lst.json()] == [bid]
+    replicated = bool(client.get("/status/replicas").json()["healthy"])
+    assert client.get("/status/response-cache").json()["hits"] - before == (1 if replicated else 3)
+
+    client.put(f"/books/{bid}", headers=auth_headers, json={**BOOK, "published_year": 1966})
+    r = client.get(f"/books/id/{bid}", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["published_year"] == 1966
+    assert client.get("/books").json()[0]["published_year"] == 1966
+
+    client.post("/books", headers=auth_headers, json={**BOOK, "title": "Typee"})
+    assert len(client.get("/books").json()) == 2
+
+def test_cache_hit_takes_no_connection(client: TestClient, auth_headers, monkeypatch):
+    from app import replicas
+    bid = client.post("/books", headers=auth_headers, json=BOOK).json()["id"]
+    # Автор щойно писав — читає з основної БД, тож відповіді потрапляють у кеш.
+    etag = client.get(f"/books/id/{bid}", headers=auth_headers).headers["ETag"]
+    client.get("/books", headers=auth_headers)
+    client.get("/books/export", headers=auth_headers)
+
+    # Кожне з'єднання для читання (репліка чи основна БД) береться через read_replica.
+    checkouts = []
+    real = replicas.read_replica
+    monkeypatch.setattr(replicas, "read_replica", lambda request: checkouts.append(request.url.path) or real(request))
+    assert client.get(f"/books/id/{bid}", headers=auth_headers).status_code == 200
+    assert client.get(f"/books/id/{bid}", headers={**auth_headers, "If-None-Match": etag}).status_code == 304
+    assert client.get("/books", headers=auth_headers).status_code == 200
+    assert client.get("/books/export", headers=auth_headers).status_code == 200
+    assert checkouts == []
+    # Промах — з'єднання береться.
+    assert client.get("/books", headers=auth_headers, params={"limit": 5}).status_code == 200
+    assert checkouts == ["/books"]
+
+def test_author_cache_saves_round_trips(client: TestClient, auth_headers):
+    before = client.get("/status/author-cache").json()
+    client.post("/books", headers=auth_headers, json=BOOK)
+    client.post("/books", headers=auth_headers, json={**BOOK, "title": "Typee"})
+    client.post("/books", headers=auth_headers, json={**BOOK, "title": "Omoo"})
+    after = client.get("/status/author-cache").json()
+    assert after["upserts"] - before["upserts"] == 1
+    assert after["created"] - before["created"] == 1
+    assert after["hits"] - before["hits"] == 2
+    assert after["round_trips_saved"] - before["round_trips_saved"] == 3
+
+def test_batch_crud(client: TestClient, auth_headers, other_headers):
+    mine = client.post("/books", headers=auth_headers, json=BOOK).json()["id"]
+    theirs = client.post("/books", headers=other_headers, json={**BOOK, "title": "Typee"}).json()["id"]
+    theirs2 = client.post("/books", headers=other_headers, json={**BOOK, "title": "Israel Potter"}).json()["id"]
+    gone = client.post("/books", headers=auth_headers, json={**BOOK, "title": "Omoo"}).json()["id"]
+
+    r = client.post("/books/batch", headers=auth_headers, json={"ops": [
+        {"op": "create", "book": {**BOOK, "title": "Mardi"}},
+        {"op": "create", "book": {**BOOK, "title": "Mardi"}},
+        {"op": "create", "book": {**BOOK, "title": "Pierre", "author": "Nathaniel Hawthorne"}},
+        {"op": "update", "id": mine, "book": {**BOOK, "published_year": 1852}},
+        {"op": "update", "id": theirs, "book": BOOK},
+        {"op": "update", "id": 0, "book": BOOK},
+        {"op": "delete", "id": gone},
+        {"op": "delete", "id": theirs2},
+    ]})
+    assert r.status_code == 200, r.text
+    assert [x["status"] for x in r.json()] == [200, 409, 200, 200, 403, 404, 200, 403]
+    assert r.json()[2]["book"]["author"] == "Nathaniel Hawthorne"
+    assert client.get(f"/books/id/{mine}").json()["published_year"] == 1852
+    assert client.get(f"/books/id/{gone}").status_code == 404
+
+    # Дублікат при оновленні не ламає решту пачки.
+    r = client.post("/books/batch", headers=auth_headers, json={"ops": [
+        {"op": "update", "id": mine, "book": {**BOOK, "title": "Mardi"}},
+        {"op": "delete", "id": mine + 1000},
+        {"op": "create", "book": {**BOOK, "title": "Redburn"}},
+    ]})
+    assert [x["status"] for x in r.json()] == [409, 404, 200]
+
+    # Оновлення чужої чи відсутньої книги не створює автора.
+    r = client.post("/books/batch", headers=auth_headers, json={"ops": [
+        {"op": "update", "id": theirs, "book": {**BOOK, "author": "Batch Ghost One"}},
+        {"op": "update", "id": mine + 1000, "book": {**BOOK, "author": "Batch Ghost Two"}},
+    ]})
+    assert [x["status"] for x in r.json()] == [403, 404]
+    with conn() as c, get_dict_cursor(c) as cur:
+        cur.execute("SELECT count(*) AS n FROM authors WHERE name LIKE 'Batch Ghost%%'")
+        assert cur.fetchone()["n"] == 0
+
+    r = client.post("/books/batch", headers=auth_headers, json={"ops": [{"op": "delete", "id": mine}, {"op": "delete", "id": mine}]})
+    assert r.status_code == 422
@@ -1,6 +1,15 @@
-import io, json
+import copy, io, json
+import psycopg
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from fastapi.testclient import TestClient
 
+from app.books import BookIn, BookOut
+from app.imports import validate_items
+from app import metrics, query_log
+from app.db import conn, get_dict_cursor
+
 B1 = {"title":"Dune","author":"Frank Herbert","genre":"Fiction","published_year":1965}
 B2 = {"title":"Sapiens","author":"Yuval Noah Harari","genre":"History","published_year":2011}
 B3 = {"title":"A Brief History of Time","author":"Stephen Hawking","genre":"Science","published_year":1988}
@@ -67,4 +76,404 @@ def test_export_json_and_csv(client: TestClient, auth_headers):
     assert "Content-Disposition" in r.headers
     assert "books.csv" in r.headers["Content-Disposition"]
     text = r.text.splitlines()
-    assert text[0] == "id,title,author,genre,published_year"
\ No newline at end of file
+    assert text[0] == "id,title,author,genre,published_year"
+
+def test_cursor_pagination(client: TestClient, auth_headers):
+    seed_books(client, auth_headers)
+
+    for sort, order in (("title", "asc"), ("year", "desc"), ("author", "asc")):
+        seen, cursor = [], None
+        while True:
+            params = {"sort": sort, "order": order, "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            r = client.get("/books", params=params)
+            assert r.status_code == 200
+            seen += [x["title"] for x in r.json()]
+            cursor = r.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        full = client.get("/books", params={"sort": sort, "order": order}).json()
+        assert seen == [x["title"] for x in full]
+
+    r = client.get("/books/by-owner", headers=auth_headers, params={"limit": 2})
+    assert len(r.json()) == 2
+    r = client.get("/books/by-owner", headers=auth_headers, params={"limit": 2, "cursor": r.headers["X-Next-Cursor"]})
+    assert [x["title"] for x in r.json()] == ["Sapiens"]
+    assert "X-Next-Cursor" not in r.headers
+
+    assert client.get("/books", params={"cursor": "garbage"}).status_code == 400
+
+def test_title_sort_ignores_case(client: TestClient, auth_headers):
+    for title in ("beta", "Alpha", "Gamma"):
+        client.post("/books", headers=auth_headers, json={**B1, "title": title})
+    r = client.get("/books", params={"limit": 2})
+    assert [x["title"] for x in r.json()] == ["Alpha", "beta"]
+    r = client.get("/books", params={"limit": 2, "cursor": r.headers["X-Next-Cursor"]})
+    assert [x["title"] for x in r.json()] == ["Gamma"]
+
+    with conn() as c, get_dict_cursor(c) as cur:
+        cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+        assert [r["version"] for r in cur.fetchall()][:2] == [0, 1]
+
+def test_total_count(client: TestClient, auth_headers, other_headers):
+    seed_books(client, auth_headers)
+    client.post("/books", headers=other_headers, json={**B1, "title": "Children of Dune", "published_year": 1976})
+
+    def total(url="/books", headers=None, **params):
+        r = client.get(url, params=params, headers=headers)
+        return int(r.headers["X-Total-Count"]), r.headers["X-Total-Count-Source"]
+
+    assert "X-Total-Count" not in client.get("/books").headers
+    assert total(count="estimate", limit=1) == (4, "counter")
+    assert total(count="exact", genre="Fiction") == (2, "counter")
+    assert total("/books/by-owner", auth_headers, count="exact", limit=1) == (3, "counter")
+    assert total(count="exact", search="dune") == (2, "exact")
+    assert total(count="estimate", year_from=1970)[1] == "planner"
+    # Порожні фільтри ігноруються так само, як у самому списку.
+    assert total(count="exact", search="", author="") == (4, "counter")
+    assert total(count="estimate", search="", genre="Fiction") == (2, "counter")
+
+    # Запис скидає закешований COUNT, лічильники оновлюються тригерами.
+    client.post("/books", headers=auth_headers, json={**B1, "title": "Dune Messiah", "published_year": 1969})
+    assert total(count="exact", search="dune") == (3, "exact")
+    assert total(count="exact", genre="Fiction") == (3, "counter")
+    client.delete("/auth/me", headers=other_headers)
+    assert total(count="exact") == (4, "counter")
+
+    # Тригери лише дописують журнал; перенос у лічильники не змінює кількості й прибирає нульових власників.
+    def pending():
+        with conn() as c, get_dict_cursor(c) as cur:
+            cur.execute("SELECT COUNT(*) AS n FROM book_counts_delta")
+            return cur.fetchone()["n"]
+    assert pending() > 0
+    client.get("/books/stats", params={"refresh": True})
+    assert pending() == 0
+    assert total(count="exact") == (4, "counter")
+    assert total(count="exact", genre="Fiction") == (2, "counter")
+    assert total("/books/by-owner", auth_headers, count="exact", limit=1) == (4, "counter")
+    with conn() as c, get_dict_cursor(c) as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM book_counts_by_owner")
+        assert cur.fetchone()["n"] == 1
+
+def test_books_stats(client: TestClient, auth_headers, other_headers):
+    seed_books(client, auth_headers)
+    data = json.dumps([{**B1, "title": "Dune Messiah", "published_year": 1969},
+                       {**B2, "title": "Homo Deus", "published_year": 2015}]).encode("utf-8")
+    client.post("/books/import", headers=other_headers, files={"file": ("books.json", data, "application/json")})
+    mine = client.get("/books/by-owner", headers=auth_headers).json()
+    sapiens = next(b for b in mine if b["title"] == "Sapiens")
+    client.put(f"/books/{sapiens['id']}", headers=auth_headers, json={**B2, "genre": "Science"})
+    dune = next(b for b in mine if b["title"] == "Dune")
+    client.delete(f"/books/{dune['id']}", headers=auth_headers)
+
+    def stats(**params):
+        r = client.get("/books/stats", params={"refresh": True, **params})
+        assert r.status_code == 200, r.text
+        return r.json()
+
+    body = stats()
+    assert {g["key"]: g["books"] for g in body["groups"]} == {"Fiction": 1, "History": 1, "Science": 2}
+    assert body["total"] == 4 and body["pending"] == 0 and body["stale_seconds"] == 0
+    assert stats(group_by="decade", year_from=1960)["groups"] == [
+        {"key": 1960, "books": 1}, {"key": 1980, "books": 1}, {"key": 2010, "books": 2}]
+    assert stats(group_by="author", limit=1)["groups"] == [{"key": "Yuval Noah Harari", "books": 2}]
+    assert stats(group_by="owner", genre="Science")["total"] == 2
+    assert client.get("/books/stats", params={"group_by": "author", "year_from": 2000}).status_code == 400
+
+    # Явний refresh чекає, поки інший процес закінчить перенос, а не пропускає його.
+    import threading
+    from app.stats import STATS_LOCK
+    client.post("/books", headers=auth_headers, json=B1)
+    with conn() as c:
+        c.execute("SELECT pg_advisory_lock(%s)", (STATS_LOCK,))
+        result = {}
+        t = threading.Thread(target=lambda: result.update(stats()))
+        t.start()
+        t.join(0.3)
+        assert t.is_alive()
+        c.execute("SELECT pg_advisory_unlock(%s)", (STATS_LOCK,))
+    t.join(5)
+    assert result["total"] == 5 and result["pending"] == 0
+
+def test_read_replica_routing(client: TestClient, auth_headers, other_headers, monkeypatch):
+    from app import replicas
+    if not replicas._replicas:
+        pytest.skip("PG_REPLICAS не задано")
+    before = client.get("/status/replicas").json()
+    assert before["healthy"] == len(before["details"])
+
+    # Після запису читання автора йдуть в основну БД, анонімні — на репліку.
+    seed_books(client, auth_headers)
+    assert len(client.get("/books/by-owner", headers=auth_headers).json()) == 3
+    client.get("/books", params={"genre": "Science"})
+    after = client.get("/status/replicas").json()
+    assert after["sticky_reads"] == before["sticky_reads"] + 1
+    assert after["replica_reads"] == before["replica_reads"] + 1
+
+    # Нездорова репліка — читання з основної БД.
+    monkeypatch.setattr(replicas._replicas[0], "healthy", False)
+    assert client.get("/books", params={"genre": "History"}).status_code == 200
+    assert client.get("/status/replicas").json()["primary_reads"] == after["primary_reads"] + 1
+
+    # Репліка не дала з'єднання для експорту — потік іде з основної БД, а не обривається після 200.
+    from psycopg_pool import PoolTimeout
+    class DeadPool:
+        def getconn(self):
+            raise PoolTimeout("replica down")
+    monkeypatch.setattr(replicas._replicas[0], "healthy", True)
+    monkeypatch.setattr(replicas._replicas[0], "sync_pool", lambda: DeadPool())
+    r = client.get("/books/export", params={"bulk": True, "format": "ndjson"}, headers=other_headers)
+    assert r.status_code == 200 and len(r.text.splitlines()) == 3
+    assert client.get("/status/replicas").json()["fallbacks"] == after["fallbacks"] + 1
+
+def test_replica_reads_fill_cache_once_caught_up(client: TestClient, auth_headers, monkeypatch):
+    import time
+    from collections import deque
+    from app import replicas
+    if not replicas._replicas:
+        pytest.skip("PG_REPLICAS не задано")
+    check = replicas.check_replicas
+    async def no_check():
+        pass
+    monkeypatch.setattr(replicas, "check_replicas", no_check)
+    hits = lambda: client.get("/status/response-cache").json()["hits"]
+
+    # Після запису ще не перевірено, що репліка його відтворила, — анонімні читання не кешуються.
+    seed_books(client, auth_headers)
+    before = hits()
+    for _ in range(2):
+        assert len(client.get("/books", params={"genre": "Science"}).json()) == 1
+    assert hits() == before
+
+    # Перевірка після запису показала, що репліка наздогнала основну БД: перше читання
+    # з репліки йде в кеш, друге анонімне — вже з кешу.
+    client.portal.call(check)
+    for _ in range(2):
+        assert len(client.get("/books", params={"genre": "Science"}).json()) == 1
+    assert hits() == before + 1
+    assert client.get("/status/replicas").json()["cached_replica_reads"] >= 1
+
+    # Репліка відстає від нового запису — її відповідь у кеш не йде.
+    client.post("/books", headers=auth_headers, json={**B3, "title": "The Universe in a Nutshell", "published_year": 2001})
+    client.portal.call(check)
+    monkeypatch.setattr(replicas._replicas[0], "replayed", deque([(time.monotonic(), 0)]))
+    for _ in range(2):
+        assert len(client.get("/books", params={"genre": "Science"}).json()) == 2
+    assert hits() == before + 1
+
+def test_search_relevance(client: TestClient, auth_headers):
+    seed_books(client, auth_headers)
+    r = client.get("/books", params={"search": "History", "sort": "relevance"})
+    assert r.status_code == 200
+    assert [x["title"] for x in r.json()] == ["A Brief History of Time"]
+    r = client.get("/books", params={"author": "hawk"})
+    assert [x["author"] for x in r.json()] == ["Stephen Hawking"]
+    assert client.get("/books", params={"sort": "relevance"}).status_code == 400
+
+def test_export_bulk_stream(client: TestClient, auth_headers):
+    seed_books(client, auth_headers)
+    assert client.get("/books/export?bulk=true").status_code == 401
+    # Публічний експорт не зважає на недійсний токен, bulk — вимагає дійсний.
+    bad = {"Authorization": "Bearer not-a-token"}
+    assert client.get("/books/export", headers=bad).status_code == 200
+    assert client.get("/books/export?bulk=true", headers=bad).status_code == 401
+
+    r = client.get("/books/export?format=ndjson&bulk=true", headers=auth_headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [x["title"] for x in rows] == ["A Brief History of Time", "Dune", "Sapiens"]
+
+    r = client.get("/books/export?format=json&limit=2&offset=1")
+    assert [x["title"] for x in r.json()] == ["Dune", "Sapiens"]
+
+def test_import_reports_rows(client: TestClient, auth_headers):
+    bad = {**B2, "published_year": 1500}
+    data = json.dumps([B1, B1, bad, B3]).encode("utf-8")
+    files = {"file": ("books.json", data, "application/json")}
+    r = client.post("/books/import", headers=auth_headers, files=files)
+    body = r.json()
+    assert (body["created"], body["skipped"]) == (2, 2)
+    assert [e["row"] for e in body["errors"]] == [2, 3]
+    assert body["errors"][0]["error"] == "duplicate (already exists)"
+
+def test_import_streaming_formats(client: TestClient, auth_headers):
+    data = json.dumps({"source": "x", "items": [B1, B2]}).encode("utf-8")
+    r = client.post("/books/import", headers=auth_headers, files={"file": ("books.json", data, "application/json")})
+    assert r.json()["created"] == 2
+
+    data = (json.dumps([B3])[:-1] + ', {"title": ').encode("utf-8")
+    r = client.post("/books/import", headers=auth_headers, files={"file": ("books.json", data, "application/json")})
+    body = r.json()
+    assert body["created"] == 1
+    assert body["errors"][0]["row"] == 2
+    assert body["errors"][0]["error"].startswith("Некоректний JSON")
+
+    r = client.post("/books/import", headers=auth_headers, files={"file": ("books.json", b"{oops", "application/json")})
+    assert r.status_code == 400
+
+def test_import_background_job(client: TestClient, auth_headers):
+    import time
+    data = json.dumps([B1, B2, B1]).encode("utf-8")
+    files = {"file": ("books.json", data, "application/json")}
+    r = client.post("/books/import?background=true", headers=auth_headers, files=files)
+    assert r.status_code == 202, r.text
+    job_id = r.json()["job_id"]
+
+    for _ in range(100):
+        job = client.get(f"/books/import/jobs/{job_id}", headers=auth_headers).json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done"
+    assert (job["rows_processed"], job["created"], job["skipped"]) == (3, 2, 1)
+    assert job["errors"] == [{"row": 3, "error": "duplicate (already exists)"}]
+
+    # Завершену задачу скасувати не можна, і її рядок не змінюється.
+    r = client.post(f"/books/import/jobs/{job_id}/cancel", headers=auth_headers)
+    assert r.status_code == 409
+    assert client.get(f"/books/import/jobs/{job_id}", headers=auth_headers).json() == job
+
+def test_import_background_job_unexpected_error(client: TestClient, auth_headers, monkeypatch):
+    import os, time
+    from app import jobs
+    def boom(*args, **kwargs):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(jobs, "import_books_items", boom)
+    files = {"file": ("books.json", json.dumps([B1]).encode("utf-8"), "application/json")}
+    r = client.post("/books/import?background=true", headers=auth_headers, files=files)
+    assert r.status_code == 202, r.text
+    job_id = r.json()["job_id"]
+
+    for _ in range(100):
+        job = client.get(f"/books/import/jobs/{job_id}", headers=auth_headers).json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "failed"
+    assert job["error"] == "RuntimeError: boom"
+    with conn() as c, get_dict_cursor(c) as cur:
+        cur.execute("SELECT spool_path FROM import_jobs WHERE id=%s", (job_id,))
+        assert not os.path.exists(cur.fetchone()["spool_path"])
+
+def test_fast_json_matches_response_model(client: TestClient, auth_headers):
+    for i, author in enumerate(["Тарас Шевченко", "Leo Tolstoy"]):
+        client.post("/books", headers=auth_headers,
+                    json={"title": f"Кобзар \"{i}\"", "author": author, "genre": "History", "published_year": 1840 + i})
+    for url in ["/books", "/books/by-owner"]:
+        r = client.get(url, headers=auth_headers)
+        expected = JSONResponse(jsonable_encoder([BookOut(**b) for b in r.json()])).body
+        assert r.content == expected
+    bid = r.json()[0]["id"]
+    r = client.get(f"/books/id/{bid}")
+    assert r.content == JSONResponse(jsonable_encoder(BookOut(**r.json()))).body
+
+    schema = client.get("/openapi.json").json()
+    ok = schema["paths"]["/books"]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert ok["items"]["$ref"].endswith("/BookOut")
+
+def per_row(items, start=1):
+    # Еталон для validate_items: BookIn(**item) по рядку, як було до пакетної валідації.
+    valid, errors = [], []
+    for i, raw_item in enumerate(items, start=start):
+        row_no = raw_item.pop("_row", i) if isinstance(raw_item, dict) else i
+        if isinstance(raw_item, dict) and "_error" in raw_item:
+            errors.append({"row": row_no, "error": raw_item["_error"]})
+            continue
+        try:
+            valid.append((row_no, BookIn(**raw_item)))
+        except Exception as e:
+            errors.append({"row": row_no, "error": str(e)})
+    return valid, errors
+
+def test_validate_items_matches_bookin_errors():
+    items = [
+        {"title": "  Dune ", "author": "Frank Herbert", "genre": "Fiction", "published_year": "1965", "_row": 2},
+        {"title": "", "author": "A", "genre": "Nope", "published_year": 1700, "_row": 3},
+        {"title": "T$", "author": "Bob1", "genre": "Fiction", "published_year": 2000, "_row": 4},
+        {"title": "   ", "author": "Bob", "genre": "Fiction", "published_year": 2000, "_row": 5},
+        {"author": "Bob", "genre": "Fiction", "_row": 6},
+        {"_error": "bad line", "_row": 7},
+        "not an object",
+    ]
+    # Помилки мають бути тими самими, що дає BookIn(**item) по рядку.
+    expected_valid, expected_errors = per_row(copy.deepcopy(items), start=2)
+    valid, errors = validate_items(items, start=2)
+    assert valid == [(2, "Dune", "Frank Herbert", "Fiction", 1965)]
+    assert [row for row, _ in expected_valid] == [2]
+    assert errors == expected_errors
+    assert [e["row"] for e in errors] == [3, 4, 5, 6, 7, 8]
+
+def test_normalize_query_shape():
+    a = query_log.normalize("SELECT * FROM books\n  WHERE genre = 'Fiction' AND published_year > 1990 LIMIT %s")
+    b = query_log.normalize("SELECT * FROM books WHERE genre = 'History' AND published_year > 2001 LIMIT %s")
+    assert a == b == "SELECT * FROM books WHERE genre = ? AND published_year > ? LIMIT %s"
+    assert query_log.normalize("WHERE id IN (%s, %s,%s)") == "WHERE id IN (%s, ...)"
+    assert query_log.param_types({"ids": [1, 2], "q": None}) == {"ids": "list[int]", "q": "null"}
+
+ADMIN = {"X-Admin-Token": "test-admin"}
+
+def test_slow_query_log_requires_admin_token(client: TestClient):
+    assert client.get("/status/slow-queries").status_code == 403
+    assert client.delete("/status/slow-queries", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/status/slow-queries", headers=ADMIN).status_code == 200
+
+@pytest.mark.skipif(not metrics.TIMED_CURSORS, reason="курсори без обгортки")
+def test_slow_query_log_with_explain(client: TestClient, auth_headers, monkeypatch, tmp_path):
+    log = tmp_path / "slow.jsonl"
+    monkeypatch.setattr(metrics, "SLOW_QUERY_SECONDS", 0.0)
+    monkeypatch.setattr(query_log, "SLOW_QUERY_EXPLAIN_SAMPLE", 1.0)
+    monkeypatch.setattr(query_log, "SLOW_QUERY_LOG", str(log))
+    client.delete("/status/slow-queries", headers=ADMIN)
+    client.post("/books", headers=auth_headers, json=B1)
+    assert client.get("/books", params={"genre": "Fiction", "sort": "year"}).status_code == 200
+
+    shapes = client.get("/status/slow-queries", headers=ADMIN).json()["shapes"]
+    listing = [s for s in shapes if "FROM books b" in s["sql"] and "LIMIT" in s["sql"]]
+    assert listing and listing[0]["plan"][0]["Plan"]
+    assert "genre_enum" in listing[0]["param_types"] or "str" in listing[0]["param_types"]
+    # Запити на запис логуються, але без EXPLAIN ANALYZE.
+    assert all("plan" not in s for s in shapes if s["sql"].startswith("INSERT"))
+    assert client.get("/books").json()[0]["title"] == "Dune"
+
+    query_log.flush_log()
+    lines = [json.loads(l) for l in log.read_text().splitlines()]
+    assert {s["fingerprint"] for s in shapes} <= {l["fingerprint"] for l in lines}
+
+    # Експорт міряється до першої пачки; bulk — без EXPLAIN ANALYZE.
+    from routers import export
+    monkeypatch.setattr(export, "SLOW_QUERY_SECONDS", 0.0)
+    client.delete("/status/slow-queries", headers=ADMIN)
+    assert client.get("/books/export", params={"limit": 10}).status_code == 200
+    assert client.get("/books/export", params={"bulk": True, "format": "csv"}, headers=auth_headers).status_code == 200
+    exports = {"LIMIT" in s["sql"]: s for s in client.get("/status/slow-queries", headers=ADMIN).json()["shapes"]
+               if "ORDER BY lower(b.title)" in s["sql"]}
+    assert exports[True]["plan"] and "plan" not in exports[False]
+
+    # Запит, що впав, теж у лозі — без плану.
+    with pytest.raises(psycopg.errors.DivisionByZero), conn() as c, get_dict_cursor(c) as cur:
+        cur.execute("SELECT 1 / 0")
+    failed = [e for e in client.get("/status/slow-queries", headers=ADMIN).json()["recent"] if e.get("failed")]
+    assert [e["sql"] for e in failed] == ["SELECT ? / ?"]
+    assert all("plan" not in s for s in query_log.slow_query_stats()["shapes"] if s["sql"] == "SELECT ? / ?")
+    client.delete("/status/slow-queries", headers=ADMIN)
+
+def test_migration_rebuilds_invalid_concurrent_index():
+    from init_db import NO_TRANSACTION, run_migration
+    migration = f"{NO_TRANSACTION}\nCREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS mig_probe_x ON mig_probe (x);\n"
+    with conn() as c:
+        c.execute("DROP TABLE IF EXISTS mig_probe")
+        c.execute("CREATE TABLE mig_probe (x int)")
+        c.execute("INSERT INTO mig_probe VALUES (1), (1)")
+        try:
+            # Дублікати — CONCURRENTLY падає і лишає індекс INVALID.
+            with pytest.raises(psycopg.errors.UniqueViolation):
+                run_migration(c, 9001, "probe", migration)
+            c.execute("DELETE FROM mig_probe WHERE ctid = (SELECT max(ctid) FROM mig_probe)")
+            run_migration(c, 9001, "probe", migration)
+            valid = c.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = 'mig_probe_x'::regclass").fetchone()
+            assert valid == (True,)
+        finally:
+            c.execute("DELETE FROM schema_migrations WHERE version = 9001")
+            c.execute("DROP TABLE mig_probe")